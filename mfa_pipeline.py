@@ -1,11 +1,45 @@
 import os
+import sys
 from pathlib import Path
 import time
 import glob
-from tqdm import tqdm
+import json
+import logging
+import uuid
+import threading
+import multiprocessing
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor, wait,
+                                FIRST_COMPLETED)
+from contextlib import nullcontext
+from typing import Iterator, Optional
+import numpy as np
 import hydra
 from omegaconf import DictConfig, OmegaConf
-from utils import mfa_utils
+from tqdm.contrib.logging import logging_redirect_tqdm
+from utils import mfa_utils, lexicon
+from utils.events import EventLog, ProgressView
+from utils.watch import PatientWatcher
+from utils import preflight, compact
+from utils.pipeline import (process_patient, realign_patient, export_patient,
+                            sweep_patient, run_types, planned_stages,
+                            load_stim_templates, resp_names, windows_name,
+                            epochs_name, sweep_values, RESP_TYPES,
+                            EXPORT_UNITS)
+from utils.sweep import formatSweep
+
+try:  # peak memory is only measured on platforms providing getrusage
+    import resource
+except ImportError:
+    resource = None
+
+try:  # the whole process tree's memory is only sampled if psutil is installed
+    import psutil
+except ImportError:
+    psutil = None
+
+log = logging.getLogger(__name__)
+
+RUN_REPORT_NAME = 'run_report.json'
 
 
 @hydra.main(version_base=None, config_path="conf", config_name="config")
@@ -35,53 +69,77 @@ def main(cfg: DictConfig) -> None:
     if cfg.debug_mode:
         print('##### RUNNING IN DEBUG MODE #####')
 
-    HOME = os.path.expanduser("~")
-    run_stim = cfg.task.get('run_stim', True)      
+    if cfg.mode == 'compact':
+        compact_patients(patients, cfg)
+        return
+    if cfg.mode == 'realign':
+        realign_patients(patients, cfg)
+        return
+    if cfg.mode == 'export':
+        export_patients(patients, cfg)
+        return
 
-    run_type = ['resp']
-    if cfg.task.get('mark_yes_no', False):
-        run_type.append('yes')
-        run_type.append('no')
+    run_type = run_types(cfg)
 
-    start = time.time()
-    err_pts = []
-    for pt in tqdm(patients, desc='Running MFA', ascii=False, ncols=150,
-                   bar_format='{l_bar}{bar}{r_bar}'):
-        pt_path = Path(cfg.patient_dir) / pt
-        mfa_path = pt_path / 'mfa'
-        mfa_utils.makeMFADirs(pt_path, run_type)
-
-        if run_stim:
-            print('##### Annotating stimuli for patient %s #####' % pt)
-            # Load stimulus annotations for the task
-            annot_dir = Path(os.path.join(HOME, cfg.task.stim_dir))
-            annot_dict = mfa_utils.loadAnnotsToDict(annot_dir)
-
-            stims_ran, err_msg = run_stims(annot_dict, pt_path,
-                                           mfa_path, cfg.merge_thresh,
-                                           cfg.debug_mode)
-            if not stims_ran:
-                err_pts.append(pt)
-                print(err_msg % pt)
-                continue
+    # stimulus templates are shared by all patients, so only load them once
+    annot_dict = None
+    if cfg.task.get('run_stim', True):
+        annot_dict = load_stim_templates(cfg)
 
-            if cfg.only_stims:
-                continue
+    # pronunciation lexicon used to check transcripts before running MFA
+    lex_index = None
+    if cfg.lexicon.oov_action != 'ignore' or cfg.lexicon.subset_dict:
+        # without the task dictionary, a subset dictionary would replace its
+        # pronunciations with the base dictionary's, so MFA is given the task
+        # dictionary unchanged
+        if lexicon.findDictionary(cfg.task.mfa.dict) is None:
+            print(f'WARNING: dictionary {cfg.task.mfa.dict} not found '
+                  'locally, skipping lexicon check')
+        else:
+            dict_names = [cfg.task.mfa.dict]
+            base_dict = cfg.lexicon.get('base_dict')
+            if base_dict and base_dict != cfg.task.mfa.dict:
+                dict_names.append(base_dict)
+            lex_index = lexicon.loadLexicon(dict_names)
+            print(f'##### Loaded {len(lex_index["words"])} words from '
+                  f'{lex_index["sources"]} #####')
 
-        for t in run_type:
-            t_msg = 'Response' if t == 'resp' else 'Yes & No'
-            print(f'##### Preparing patient {pt} for MFA: {t_msg} '
-                  'Annotation #####')
-            annot_fname = cfg.task.get('annot_fname')
-            resp_ran, err_msg = run_resp(cfg.task.name, pt_path, mfa_path, t,
-                                         cfg.task.max_dur, cfg.task.mfa.dict,
-                                         cfg.task.mfa.acoustic,
-                                         cfg.debug_mode, annot_fname)
-            if not resp_ran:
-                err_pts.append(pt)
-                print(err_msg % pt)
-                continue
+    # remove persistent MFA temporary directories that are no longer used
+    if cfg.mfa_work.root and cfg.mfa_work.max_age_days is not None:
+        evicted = mfa_utils.evictMFAWorkDirs(cfg.mfa_work.root,
+                                             cfg.mfa_work.max_age_days)
+        print(f'##### Removed {len(evicted)} unused MFA temporary '
+              'directories #####')
+
+    # check every patient's files before doing any heavy work
+    if cfg.preflight.enabled and not cfg.watch.enabled:
+        print('##### Running pre-flight checks #####')
+        results = preflight.preflight(
+            [Path(cfg.patient_dir) / pt for pt in patients],
+            required_files(cfg), annot_dict,
+            retro_cue=cfg.task.name == 'retro_cue',
+            n_workers=cfg.preflight.n_workers)
+        print(preflight.formatPreflight(results))
+        failed = [r['patient'] for r in results if not r['ok']]
+        print(f'##### {len(results) - len(failed)}/{len(results)} patients '
+              'passed pre-flight checks #####')
+        if cfg.preflight.only:
+            return
+        if failed and cfg.preflight.drop_failing:
+            print(f'##### Dropping patients that failed: {failed} #####')
+            patients = [pt for pt in patients if pt not in failed]
+
+    if cfg.mode == 'sweep':
+        sweep_patients(patients, cfg, run_type, annot_dict, lex_index)
+        return
 
+    if cfg.watch.enabled:
+        watch_patients(cfg, run_type, annot_dict, lex_index,
+                       None if cfg.patients == 'all' else patients)
+        return
+
+    start = time.time()
+    err_pts = run_batch(patients, cfg, run_type, annot_dict, lex_index)
     end = time.time()
     if len(err_pts) > 0:
         print(f'Errors occurred for the following patients: \n{err_pts}')
@@ -89,128 +147,614 @@ def main(cfg: DictConfig) -> None:
           'seconds')
 
 
-def run_stims(annot_dict, pt_path, mfa_path, merge_thresh, debug):
-    # relevant files in patient directory
-    onset_path = pt_path / 'cue_events.txt'
-    trial_info_path = pt_path / 'trialInfo.mat'
+def run_batch(patients: list[str], cfg: DictConfig, run_type: list[str],
+              annot_dict: Optional[dict],
+              lex_index: Optional[dict] = None) -> list[str]:
+    """Run a batch of patients, showing live progress.
+
+    Args:
+        patients (list[str]): Patient IDs to run.
+        cfg (DictConfig): Pipeline configuration.
+        run_type (list[str]): Response annotation types to run.
+        annot_dict (Optional[dict]): Stim annotation templates.
+        lex_index (Optional[dict], optional): Lexicon index. Defaults to None.
+
+    Returns:
+        list[str]: IDs of patients that had errors.
+    """
+    costs = estimate_batch(patients, cfg)
+
+    # structured events for every stage, shown live while the batch runs
+    batch = time.strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:6]
+    events = EventLog(cfg.events.log, batch=batch, task=cfg.task.name)
+    n_workers = 1 if cfg.debug_mode else max(1, cfg.scheduler.n_workers)
+    plan = {pt: (costs[pt][0], planned_stages(cfg, run_type))
+            for pt in patients}
+    view = ProgressView(cfg.events.log, batch, plan, n_workers=n_workers,
+                        interval=cfg.events.refresh_s).start()
+
+    start = time.time()
+    events.emit('batch_start', patients=patients, run_type=run_type)
+    err_pts = []
+    try:
+        # console log messages are printed above the progress bar
+        with logging_redirect_tqdm():
+            for pt, errs in schedule_patients(patients, costs, cfg, run_type,
+                                              annot_dict, lex_index, events):
+                if errs:
+                    err_pts.append(pt)
+    finally:
+        view.stop()
+    events.emit('batch_end', duration_s=time.time() - start,
+                errors=err_pts)
+    return err_pts
+
+
+def keep_patterns(cfg: DictConfig) -> list[str]:
+    """List the entries of a patient's 'mfa' directory kept by compaction:
+    the outputs of every pipeline mode under both their default and their
+    configured names (response windows named by `task.annot_fname`, epochs
+    of every export unit and format, and the `sweep.out_dir` directory),
+    sweep outputs saved under an earlier `sweep.out_dir`, plus
+    `compact.keep`. Outputs of runs with a different configuration are kept
+    too, so changing the configuration never deletes them.
+
+    Args:
+        cfg (DictConfig): Pipeline configuration.
+
+    Returns:
+        list[str]: Names or glob patterns of entries to keep, see
+            `compact.isKept`.
+    """
+    keep = ['mfa_stim_words.txt', 'mfa_stim_phones.txt',
+            'annotations_of_interest', 'sweep', cfg.sweep.out_dir,
+            RUN_REPORT_NAME]
+    # directories holding the summary or variants of a sweep
+    keep += ['*/summary.json', '*/merge_*_maxdur_*']
+    units = dict.fromkeys(EXPORT_UNITS + [cfg.export.unit])
+    for t in RESP_TYPES:
+        names = resp_names(t)
+        keep += [f'{names["label"]}_words.txt',
+                 f'{names["label"]}_phones.txt',
+                 f'annotated_{t}_windows.txt', windows_name(cfg, t),
+                 names['input_dir'], names['output_dir'], f'lexicon_{t}.dict']
+        for unit in units:
+            stack = epochs_name(t, unit, 'stack')
+            keep += [epochs_name(t, unit, 'clips'), stack,
+                     stack.replace('.npy', '_index.npz')]
+    keep += list(cfg.compact.get('keep') or [])
+    return list(dict.fromkeys(keep))
+
 
-    if not debug:
+def compact_patients(patients: list[str], cfg: DictConfig) -> list[dict]:
+    """Reclaim disk space in processed patient directories, see
+    `compact.compact`.
+
+    Args:
+        patients (list[str]): IDs of the patients to compact.
+        cfg (DictConfig): Pipeline configuration.
+
+    Returns:
+        list[dict]: Compaction results for each patient.
+    """
+    dry_run = cfg.compact.dry_run
+    print(f'##### Compacting {len(patients)} patients'
+          f'{" (dry run)" if dry_run else ""} #####')
+    results = compact.compact([Path(cfg.patient_dir) / pt for pt in patients],
+                              keep_patterns(cfg), dedup=cfg.compact.dedup,
+                              prune=cfg.compact.prune, dry_run=dry_run,
+                              n_workers=cfg.compact.n_workers)
+    print(compact.formatCompaction(results, dry_run))
+    if dry_run:
+        print('##### Dry run, nothing was changed. Set compact.dry_run=False '
+              'to compact #####')
+    return results
+
+
+def realign_patients(patients: list[str], cfg: DictConfig) -> list[str]:
+    """Re-align the suspect response windows of already aligned patients,
+    see `realign_patient`.
+
+    Args:
+        patients (list[str]): IDs of the patients to re-align.
+        cfg (DictConfig): Pipeline configuration.
+
+    Returns:
+        list[str]: IDs of patients that could not be re-aligned.
+    """
+    err_pts = []
+    for pt in patients:
+        print(f'##### Re-aligning suspect windows for patient {pt} #####')
         try:
-            # annotate stimuli for the current patient
-            mfa_utils.annotateStims(annot_dict, onset_path, trial_info_path,
-                                    out_form='mfa_stim_%s.txt')
-
-            # merge stimuli annotations together so that separate
-            # intrastimulus words are represented as the same stimulus
-            mfa_utils.mergeAnnots(
-                mfa_path / 'mfa_stim_words.txt',
-                merge_thresh,
-                merge_path=mfa_path / 'merged_stim_times.txt'
-            )
+            realign_patient(Path(cfg.patient_dir) / pt, cfg)
         except Exception as e:
-            err_msg = f'Error annotating stimuli for patient %s: {e}'
-            return False, err_msg
-    else:
-        mfa_utils.annotateStims(annot_dict, onset_path, trial_info_path,
-                                out_form='mfa_stim_%s.txt')
-        mfa_utils.mergeAnnots(mfa_path / 'mfa_stim_words.txt',
-                              merge_thresh, merge_path=mfa_path /
-                              'merged_stim_times.txt')
-    return True, None
-
-
-def run_resp(task_name, pt_path, mfa_path, resp_type, max_dur, mfa_dict,
-             mfa_acoustic, debug, annot_name=None):
-    # default annotation file name if one is not provided
-    if not annot_name:
-        annot_name = f'annotated_{resp_type}_windows.txt'
-    wav_name_out = (f'allblocks_{resp_type}.wav' if resp_type in ['yes', 'no']
-                    else 'allblocks.wav')
-    tg_out = (f'allblocks_{resp_type}.TextGrid' if resp_type in ['yes', 'no']
-              else 'allblocks.TextGrid')
-    inp_mfa_name = (f'input_mfa_{resp_type}' if resp_type in ['yes', 'no']
-                    else 'input_mfa')
-    out_mfa_name = (f'output_mfa_{resp_type}' if resp_type in ['yes', 'no']
-                    else 'output_mfa')
-    label_name = f'mfa_{resp_type}'
-    if not debug:
-        try:
-            # create text grid annotation for responses
-            recording_dur = mfa_utils.calculateAudDur(
-                                pt_path / 'allblocks.wav')            
-            if task_name == 'retro_cue':
-                # create text grid annotation for retro cue task
-                mfa_utils.annotateRetrocue(pt_path / 'cue_events_mfa.txt',
-                                           recording_dur,
-                                           mfa_path, max_dur,
-                                           output_fname=annot_name)
-            else:
-                mfa_utils.annotateResp(mfa_path / 'merged_stim_times.txt.',
-                                    pt_path / 'trialInfo.mat',
-                                    recording_dur, mfa_path,
-                                    max_dur, method=resp_type,
-                                    output_fname=annot_name)
-
-            mfa_utils.txt2textGrid(mfa_path / annot_name, tg_out,
-                                   tg_dir=mfa_path)
-            mfa_utils.prepareForMFA(mfa_path,
-                                    wav_path=pt_path / 'allblocks.wav',
-                                    tg_path=mfa_path / tg_out,
-                                    wav_name_out=wav_name_out,
-                                    input_dir_name=inp_mfa_name,
-                                    output_dir_name=out_mfa_name)
+            if cfg.debug_mode:
+                raise
+            print(f'Error re-aligning patient {pt}: {e}')
+            err_pts.append(pt)
+    if err_pts:
+        print(f'Patients with errors: {err_pts}')
+    return err_pts
+
+
+def export_patients(patients: list[str], cfg: DictConfig) -> list[str]:
+    """Export audio epochs of several aligned patients concurrently, see
+    `export_patient`.
+
+    Args:
+        patients (list[str]): IDs of the patients to export.
+        cfg (DictConfig): Pipeline configuration.
+
+    Returns:
+        list[str]: IDs of patients that could not be exported.
+    """
+    print(f'##### Exporting {cfg.export.unit} epochs for {len(patients)} '
+          'patients #####')
 
+    def _export(pt):
+        try:
+            return export_patient(Path(cfg.patient_dir) / pt, cfg), None
         except Exception as e:
-            err_msg = f'Error preparing patient %s for MFA: {e}'
-            return False, err_msg
-
-        # run mfa
-        mfa_ran = mfa_utils.runMFA(mfa_path / inp_mfa_name, mfa_path /
-                                   out_mfa_name, mfa_dict=mfa_dict,
-                                   mfa_model=mfa_acoustic)
-        if not mfa_ran:
-            err_msg = f'Error running MFA on patient %s'
-            return False, err_msg
+            if cfg.debug_mode:
+                raise
+            return {}, f'{type(e).__name__}: {e}'
+
+    err_pts = []
+    with ThreadPoolExecutor(max_workers=max(1, cfg.export.n_workers)) \
+            as executor:
+        for pt, (summaries, err) in zip(patients,
+                                        executor.map(_export, patients)):
+            if err is not None:
+                print(f'Error exporting patient {pt}: {err}')
+                err_pts.append(pt)
+            elif not summaries:
+                print(f'##### No alignments to export for patient {pt} #####')
+            for t, summary in summaries.items():
+                print(f'##### {pt} ({t}): {summary["n_epochs"]} epochs saved '
+                      f'to {summary["path"]} #####')
+    if err_pts:
+        print(f'Patients with errors: {err_pts}')
+    return err_pts
+
+
+def sweep_patients(patients: list[str], cfg: DictConfig, run_type: list[str],
+                   annot_dict: Optional[dict], lex_index: Optional[dict]) \
+        -> list[str]:
+    """Run the parameter sweep on several patients, see `sweep_patient`, and
+    print a table comparing the variants.
+
+    Args:
+        patients (list[str]): IDs of the patients to sweep.
+        cfg (DictConfig): Pipeline configuration.
+        run_type (list[str]): Response annotation types to run.
+        annot_dict (Optional[dict]): Stim annotation templates.
+        lex_index (Optional[dict]): Lexicon index.
+
+    Returns:
+        list[str]: IDs of patients with errors.
+    """
+    sweep_values(cfg)  # reject invalid sweeps before running any patient
+    err_pts = []
+    summaries = {}
+    for pt in patients:
         try:
-            # convert mfa output to txt file
-            mfa_utils.textGrid2txt(mfa_path / out_mfa_name /
-                                   tg_out, label_name, txt_dir=mfa_path)
+            summaries[pt] = sweep_patient(Path(cfg.patient_dir) / pt, cfg,
+                                          annot_dict, lex_index, run_type)
         except Exception as e:
-            err_msg = f'Error extracting annotations for patient %s: {e}'
-            return False, err_msg
+            if cfg.debug_mode:
+                raise
+            print(f'Error sweeping patient {pt}: {e}')
+            err_pts.append(pt)
+    print(formatSweep(summaries))
+    if err_pts:
+        print(f'Patients with errors: {err_pts}')
+    return err_pts
+
 
+def required_files(cfg: DictConfig) -> list[str]:
+    """List the files a patient folder needs before it can be processed.
+
+    Args:
+        cfg (DictConfig): Pipeline configuration.
+
+    Returns:
+        list[str]: Names of required files in the patient folder.
+    """
+    files = ['allblocks.wav']
+    if cfg.task.get('run_stim', True):
+        files += ['cue_events.txt', 'trialInfo.mat']
+    elif cfg.task.name == 'retro_cue':
+        files.append('cue_events_mfa.txt')
     else:
-        # create text grid annotation for responses
-        recording_dur = mfa_utils.calculateAudDur(
-                            pt_path / 'allblocks.wav')
-        # create text grid annotation for responses            
-        if task_name == 'retro_cue':
-            # create text grid annotation for retro cue task
-            mfa_utils.annotateRetrocue(pt_path / 'cue_events_mfa.txt',
-                                        recording_dur,
-                                        mfa_path, max_dur,
-                                        output_fname=annot_name)
-        else:
-            mfa_utils.annotateResp(mfa_path / 'merged_stim_times.txt.',
-                                pt_path / 'trialInfo.mat',
-                                recording_dur, mfa_path,
-                                max_dur, method=resp_type,
-                                output_fname=annot_name)
-
-        mfa_utils.txt2textGrid(mfa_path / annot_name, tg_out,
-                               tg_dir=mfa_path)
-        mfa_utils.prepareForMFA(mfa_path, wav_path=pt_path / 'allblocks.wav',
-                                tg_path=mfa_path / tg_out,
-                                wav_name_out=wav_name_out,
-                                input_dir_name=inp_mfa_name,
-                                output_dir_name=out_mfa_name)
-        _ = mfa_utils.runMFA(mfa_path / inp_mfa_name, mfa_path /
-                             out_mfa_name, mfa_dict=mfa_dict,
-                             mfa_model=mfa_acoustic)
-        # convert mfa output to txt file
-        mfa_utils.textGrid2txt(mfa_path / out_mfa_name / tg_out, label_name,
-                               txt_dir=mfa_path)
-    return True, None
+        files.append('trialInfo.mat')
+    return files
+
+
+def watch_patients(cfg: DictConfig, run_type: list[str],
+                   annot_dict: Optional[dict],
+                   lex_index: Optional[dict] = None,
+                   patients: Optional[list[str]] = None) -> None:
+    """Process patient folders as they are added to or changed in the
+    patient directory, until interrupted.
+
+    Stim templates and the lexicon are loaded once by the caller and reused
+    for every patient.
+
+    Args:
+        cfg (DictConfig): Pipeline configuration.
+        run_type (list[str]): Response annotation types to run.
+        annot_dict (Optional[dict]): Stim annotation templates.
+        lex_index (Optional[dict], optional): Lexicon index. Defaults to None.
+        patients (Optional[list[str]], optional): Only watch these patients.
+            Defaults to None (all patients matching `cfg.patient_prefixes`).
+    """
+    watcher = PatientWatcher(cfg.patient_dir, cfg.patient_prefixes,
+                             required_files(cfg),
+                             settle_s=cfg.watch.settle_s,
+                             poll_s=cfg.watch.poll_s,
+                             state_path=cfg.watch.state,
+                             patients=patients,
+                             retry_s=cfg.watch.get('retry_s'))
+    print(f'##### Watching {cfg.patient_dir} for new patients, press Ctrl+C '
+          'to stop #####')
+    try:
+        while True:
+            ready = watcher.scan()
+            if ready:
+                print(f'##### Processing patients: {ready} #####')
+                err_pts = run_batch(ready, cfg, run_type, annot_dict,
+                                    lex_index)
+                if err_pts:
+                    print(f'Errors occurred for the following patients: '
+                          f'\n{err_pts}')
+                # patients with errors are retried once their files change or
+                # after watch.retry_s
+                watcher.mark_processed([pt for pt in ready
+                                        if pt not in err_pts])
+                watcher.mark_failed(err_pts)
+            watcher.wait()
+    except KeyboardInterrupt:
+        print('##### Stopped watching #####')
+    finally:
+        watcher.close()
+
+
+def _peak_mem_mb() -> Optional[float]:
+    """Peak resident memory of this process and its largest finished child in
+    MB.
+
+    `RUSAGE_CHILDREN` only reports the peak of the single largest child, so
+    this is a lower bound when MFA runs several workers at once.
+    """
+    if resource is None:
+        return None
+    scale = 1024 ** 2
+    if sys.platform.startswith('linux'):  # ru_maxrss is in kB on Linux
+        scale = 1024
+    peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss +
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / scale
+
+
+class _TreeMemSampler:
+    """Samples the total resident memory of this process and all of its
+    descendants (MFA and its parallel workers) in a background thread, and
+    keeps the peak. Requires psutil.
+
+    Args:
+        interval (float, optional): Seconds between samples. Defaults to 0.5.
+    """
+
+    def __init__(self, interval: float = 0.5) -> None:
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self) -> '_TreeMemSampler':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+    def sample(self) -> None:
+        """Add up the memory of the process tree and update the peak."""
+        proc = psutil.Process()
+        total = 0
+        try:
+            procs = [proc] + proc.children(recursive=True)
+        except psutil.Error:
+            procs = [proc]
+        for p in procs:
+            try:
+                total += p.memory_info().rss
+            except psutil.Error:  # process exited while sampling
+                continue
+        self.peak_mb = max(self.peak_mb, total / 1024 ** 2)
+
+    def _run(self) -> None:
+        self.sample()
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+
+def _run_patient_job(pt: str, cfg: DictConfig, run_type: list[str],
+                     annot_dict: Optional[dict], lex_index: Optional[dict],
+                     events: EventLog, audio_min: float,
+                     fresh_process: bool) -> tuple[str, list[str]]:
+    """Run a patient and save a run report used to schedule future runs."""
+    events = events.bind(patient=pt, audio_min=audio_min)
+    events.emit('patient_start', run_type=run_type)
+    start = time.time()
+    # memory is only meaningful when the process runs this patient alone
+    sampler = (_TreeMemSampler() if fresh_process and psutil is not None
+               else None)
+    try:
+        with sampler or nullcontext(), events.captureLogs():
+            result = process_patient(Path(cfg.patient_dir) / pt, cfg,
+                                     annot_dict, lex_index, events, run_type)
+        errs = result.errors
+    except Exception as e:
+        events.emit('patient_end', duration_s=time.time() - start,
+                    status='error', error=f'{type(e).__name__}: {e}')
+        raise
+    events.emit('patient_end', duration_s=time.time() - start,
+                status='error' if errs else 'ok',
+                error='; '.join(errs) if errs else None)
+    peak_mem_mb = None
+    if sampler is not None:
+        peak_mem_mb = sampler.peak_mb
+    elif fresh_process:
+        peak_mem_mb = _peak_mem_mb()
+    report = {
+        'audio_min': audio_min,
+        'runtime_s': time.time() - start,
+        'peak_mem_mb': peak_mem_mb,
+        # getrusage misses all but the largest of MFA's workers
+        'peak_mem_lower_bound': sampler is None,
+        'run_type': run_type,
+        'success': not errs,
+        'finished': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    mfa_path = Path(cfg.patient_dir) / pt / 'mfa'
+    if mfa_path.is_dir():
+        with open(mfa_path / RUN_REPORT_NAME, 'w') as f:
+            json.dump(report, f, indent=2)
+    return pt, errs
+
+
+def load_run_reports(pt_paths: list[Path]) -> dict[str, dict]:
+    """Load the run reports saved by previous runs of the pipeline.
+
+    Args:
+        pt_paths (list[Path]): Patient directories to search for reports.
+
+    Returns:
+        dict[str, dict]: Run report for each patient that has one.
+    """
+    reports = {}
+    for pt_path in pt_paths:
+        report_path = pt_path / 'mfa' / RUN_REPORT_NAME
+        if not report_path.is_file():
+            continue
+        try:
+            with open(report_path, 'r') as f:
+                reports[pt_path.name] = json.load(f)
+        except (OSError, ValueError):
+            continue
+    return reports
+
+
+def estimate_patient_cost(audio_min: float, report: Optional[dict],
+                          reports: dict[str, dict],
+                          sched_cfg: DictConfig) -> tuple[float, float]:
+    """Estimate the peak memory and runtime of running a patient.
+
+    A patient's own previous successful run is used if it was run on the
+    same recording. Otherwise, costs are scaled by recording length using the
+    median per-minute cost of all previous runs, falling back to the
+    per-minute defaults in the scheduler config. Measured peak memory includes
+    the base memory of the worker process, so the per-minute memory rate is
+    fitted on the memory above `base_mem_mb`. Peak memory measured without
+    psutil is a lower bound (see `_peak_mem_mb`) and is scaled by
+    `mem_headroom`.
+
+    Args:
+        audio_min (float): Length of the patient's recording in minutes.
+        report (Optional[dict]): Previous run report for the patient.
+        reports (dict[str, dict]): Previous run reports for all patients.
+        sched_cfg (DictConfig): Scheduler configuration.
+
+    Returns:
+        tuple[float, float]: Estimated peak memory (MB) and runtime (s).
+    """
+    def _peak_mem(r: dict) -> float:
+        headroom = (sched_cfg.get('mem_headroom', 1.0)
+                    if r.get('peak_mem_lower_bound', True) else 1.0)
+        return r['peak_mem_mb'] * headroom
+
+    def _median_rate(key: str, default: float, base: float = 0.0) -> float:
+        rates = [max(0.0, (_peak_mem(r) if key == 'peak_mem_mb' else r[key])
+                     - base) / r['audio_min']
+                 for r in reports.values()
+                 if r.get('success') and r.get(key) is not None and
+                 r.get('audio_min')]
+        return float(np.median(rates)) if rates else default
+
+    mem_rate = _median_rate('peak_mem_mb', sched_cfg.mem_mb_per_min,
+                            sched_cfg.base_mem_mb)
+    time_rate = _median_rate('runtime_s', sched_cfg.sec_per_min)
+    mem_mb = sched_cfg.base_mem_mb + mem_rate * audio_min
+    runtime_s = time_rate * audio_min
+
+    same_audio = (report is not None and report.get('success', False) and
+                  abs(report.get('audio_min', -1) - audio_min) < 1e-3)
+    if same_audio and report.get('peak_mem_mb') is not None:
+        mem_mb = _peak_mem(report)
+    if same_audio and report.get('runtime_s') is not None:
+        runtime_s = report['runtime_s']
+    return mem_mb, runtime_s
+
+
+def estimate_batch(patients: list[str], cfg: DictConfig) \
+        -> dict[str, tuple[float, float, float]]:
+    """Estimate the cost of running each patient in a batch.
+
+    Args:
+        patients (list[str]): Patient IDs to run.
+        cfg (DictConfig): Pipeline configuration.
+
+    Returns:
+        dict[str, tuple[float, float, float]]: Minutes of audio, estimated
+            peak memory (MB) and estimated runtime (s) for each patient.
+    """
+    sched_cfg = cfg.scheduler
+    pt_paths = [Path(cfg.patient_dir) / pt for pt in patients]
+    reports = load_run_reports(pt_paths)
+    costs = {}
+    for pt, pt_path in zip(patients, pt_paths):
+        try:
+            audio_min = mfa_utils.calculateAudDur(
+                pt_path / 'allblocks.wav') / 60
+        except (OSError, ValueError):
+            audio_min = 0.0  # errors are reported when the patient is run
+        mem_mb, runtime_s = estimate_patient_cost(audio_min, reports.get(pt),
+                                                  reports, sched_cfg)
+        costs[pt] = (audio_min, mem_mb, runtime_s)
+        log.info(f'Estimated cost for {pt}: {audio_min:.1f} min of audio, '
+                 f'{mem_mb:.0f} MB peak memory, {runtime_s:.0f} s runtime')
+    return costs
+
+
+def admit_patients(pending: list[str],
+                   costs: dict[str, tuple[float, float, float]],
+                   used_mb: float, n_running: int, n_workers: int,
+                   budget_mb: Optional[float]) -> list[str]:
+    """Choose the pending patients to start, in order, while workers are free
+    and their estimated memory fits in the remaining budget. A patient that
+    does not fit is deferred while other patients are running, and started
+    alone otherwise.
+
+    Args:
+        pending (list[str]): IDs of patients waiting to run, in the order
+            they should be started.
+        costs (dict[str, tuple[float, float, float]]): Minutes of audio,
+            estimated peak memory (MB) and runtime (s) of each patient, see
+            `estimate_batch`.
+        used_mb (float): Estimated memory (MB) of the running patients.
+        n_running (int): Number of running patients.
+        n_workers (int): Maximum number of patients to run at once.
+        budget_mb (Optional[float]): Memory budget (MB), or None for no
+            limit.
+
+    Returns:
+        list[str]: IDs of the patients to start.
+    """
+    admitted = []
+    for pt in pending:
+        if n_running + len(admitted) >= n_workers:
+            break
+        mem_mb = costs[pt][1]
+        if budget_mb is not None and used_mb + mem_mb > budget_mb:
+            if n_running or admitted:
+                log.info(f'Deferring {pt}: needs {mem_mb:.0f} MB, '
+                         f'{budget_mb - used_mb:.0f} MB free')
+                continue
+            log.warning(f'{pt} needs {mem_mb:.0f} MB which exceeds the '
+                        f'memory budget, running it alone')
+        admitted.append(pt)
+        used_mb += mem_mb
+    return admitted
+
+
+def schedule_patients(patients: list[str],
+                      costs: dict[str, tuple[float, float, float]],
+                      cfg: DictConfig, run_type: list[str],
+                      annot_dict: Optional[dict],
+                      lex_index: Optional[dict] = None,
+                      events: Optional[EventLog] = None) \
+        -> Iterator[tuple[str, list[str]]]:
+    """Run patients on a pool of workers while respecting a memory budget.
+
+    Patients are started longest first to reduce the total time taken by the
+    batch, and a patient is only admitted when its estimated memory fits in
+    the remaining budget. A patient that exceeds the whole budget on its own
+    is run once all other workers are idle.
+
+    Args:
+        patients (list[str]): Patient IDs to run.
+        costs (dict[str, tuple[float, float, float]]): Minutes of audio,
+            estimated peak memory (MB) and runtime (s) of each patient, see
+            `estimate_batch`.
+        cfg (DictConfig): Pipeline configuration.
+        run_type (list[str]): Response annotation types to run.
+        annot_dict (Optional[dict]): Stim annotation templates.
+        lex_index (Optional[dict], optional): Lexicon index. Defaults to None.
+        events (Optional[EventLog], optional): Log for stage events. Defaults
+            to None.
+
+    Yields:
+        tuple[str, list[str]]: Patient ID and its error messages, in order of
+            completion.
+    """
+    sched_cfg = cfg.scheduler
+    n_workers = max(1, int(sched_cfg.n_workers))
+    budget_mb = (None if sched_cfg.mem_budget_gb is None else
+                 sched_cfg.mem_budget_gb * 1024)
+    if events is None:
+        events = EventLog(None)
+
+    # longest processing time first
+    pending = sorted(patients, key=lambda pt: costs[pt][2], reverse=True)
+    log.info(f'Scheduling {len(pending)} patients on {n_workers} worker(s) '
+             f'with memory budget '
+             f'{"unlimited" if budget_mb is None else f"{budget_mb:.0f} MB"}'
+             f': {pending}')
+
+    # run in this process when debugging so errors surface immediately
+    if cfg.debug_mode:
+        for pt in pending:
+            log.info(f'Starting {pt}')
+            yield _run_patient_job(pt, cfg, run_type, annot_dict, lex_index,
+                                   events, costs[pt][0], fresh_process=False)
+        return
+
+    # a fresh process per patient frees memory between patients and keeps
+    # the peak memory measurements in the run reports separate
+    ctx = multiprocessing.get_context('spawn')
+    running = {}
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=ctx,
+                             max_tasks_per_child=1) as executor:
+        while pending or running:
+            used_mb = sum(mem for _, mem in running.values())
+            for pt in admit_patients(pending, costs, used_mb, len(running),
+                                     n_workers, budget_mb):
+                mem_mb = costs[pt][1]
+                future = executor.submit(_run_patient_job, pt, cfg, run_type,
+                                         annot_dict, lex_index, events,
+                                         costs[pt][0], True)
+                running[future] = (pt, mem_mb)
+                pending.remove(pt)
+                used_mb += mem_mb
+                events.emit('scheduled', patient=pt, est_mem_mb=mem_mb,
+                            est_runtime_s=costs[pt][2], used_mem_mb=used_mb)
+                log.info(f'Starting {pt} ({mem_mb:.0f} MB, '
+                         f'{costs[pt][2]:.0f} s estimated); {used_mb:.0f} MB '
+                         f'and {len(running)}/{n_workers} workers in use')
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                pt, _ = running.pop(future)
+                try:
+                    yield future.result()
+                except Exception as e:
+                    log.error(f'Worker for {pt} failed: {e}')
+                    yield pt, [f'Worker for patient {pt} failed: {e}']
+                log.info(f'Finished {pt}; {len(pending)} pending, '
+                         f'{len(running)} running')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,61 @@
+import os
+import sys
+import shutil
+from pathlib import Path
+import numpy as np
+import pytest
+import scipy.io as sio
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, ROOT.as_posix())
+
+DATA_DIR = Path(__file__).resolve().parent / 'data'
+
+
+@pytest.fixture
+def data_dir() -> Path:
+    """Directory with the synthetic patient, stimulus templates and the
+    golden outputs of the original implementation."""
+    return DATA_DIR
+
+
+@pytest.fixture
+def make_cfg(tmp_path):
+    """Compose the pipeline configuration with overrides, with `patient_dir`
+    in a temporary directory."""
+    from hydra import compose, initialize_config_dir
+
+    def _make_cfg(*overrides: str):
+        with initialize_config_dir(version_base=None,
+                                   config_dir=(ROOT / 'conf').as_posix()):
+            return compose('config', overrides=[
+                f'patient_dir={(tmp_path / "patients").as_posix()}',
+                *overrides])
+    return _make_cfg
+
+
+@pytest.fixture
+def fake_mfa(tmp_path, monkeypatch) -> None:
+    """Put a fake `mfa` command (see 'fake_mfa.py') first on the PATH."""
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    script = Path(__file__).resolve().parent / 'fake_mfa.py'
+    mfa = bin_dir / 'mfa'
+    mfa.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n')
+    mfa.chmod(0o755)
+    monkeypatch.setenv('PATH', f'{bin_dir}{os.pathsep}{os.environ["PATH"]}')
+
+
+@pytest.fixture
+def patient(tmp_path, data_dir) -> Path:
+    """Patient directory with the synthetic patient's files and a 52 s noise
+    recording."""
+    pt_path = tmp_path / 'patients' / 'D1'
+    pt_path.mkdir(parents=True)
+    for name in ['cue_events.txt', 'cue_events_mfa.txt', 'trialInfo.mat']:
+        shutil.copy(data_dir / 'patient' / name, pt_path / name)
+    rng = np.random.default_rng(0)
+    fs = 8000
+    sio.wavfile.write(pt_path / 'allblocks.wav', fs,
+                      rng.integers(-1000, 1000, 52 * fs, dtype=np.int16))
+    return pt_path
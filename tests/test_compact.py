@@ -0,0 +1,88 @@
+from pathlib import Path
+
+from mfa_pipeline import keep_patterns
+from utils import compact
+
+
+def make_patient(pt_path: Path, entries: list[str]) -> None:
+    mfa_path = pt_path / 'mfa'
+    for name in entries:
+        if '.' in name:
+            (mfa_path / name).parent.mkdir(parents=True, exist_ok=True)
+            (mfa_path / name).write_text('x')
+        else:
+            (mfa_path / name).mkdir(parents=True)
+            (mfa_path / name / 'file.txt').write_text('x')
+
+
+def test_keep_configured_names(make_cfg, tmp_path):
+    cfg = make_cfg('+task.annot_fname=my_windows.txt', 'sweep.out_dir=params',
+                   'export.unit=phones', 'export.format=stack',
+                   'compact.keep=[notes_*]')
+    pt_path = tmp_path / 'patients' / 'D1'
+    kept = ['mfa_stim_words.txt', 'mfa_resp_words.txt', 'my_windows.txt',
+            'params', 'epochs_resp_phones.npy',
+            'epochs_resp_phones_index.npz', 'epochs_resp_words',
+            'lexicon_resp.dict', 'input_mfa', 'output_mfa', 'notes_1.txt',
+            'run_report.json']
+    pruned = ['merged_stim_times.txt', 'realign_resp', 'scratch',
+              '.mfa_tmp/resp/file.txt']
+    make_patient(pt_path, kept + pruned)
+
+    plan = compact.scanPatient(pt_path, keep_patterns(cfg))
+    assert sorted(Path(p).name for p in plan['prune']) == \
+        sorted(['merged_stim_times.txt', 'realign_resp', 'scratch',
+                '.mfa_tmp'])
+
+
+def test_keep_outputs_of_earlier_configs(make_cfg, tmp_path):
+    """Outputs saved under default or earlier configured names are kept
+    after the configuration changes."""
+    cfg = make_cfg('+task.annot_fname=my_windows.txt', 'sweep.out_dir=params')
+    pt_path = tmp_path / 'patients' / 'D1'
+    kept = ['annotated_resp_windows.txt', 'annotated_yes_windows.txt',
+            'sweep/summary.json', 'old_sweep/summary.json',
+            'partial_sweep/merge_0.5_maxdur_2/mfa_resp_words.txt',
+            'epochs_no_trials', 'epochs_resp_words.npy']
+    make_patient(pt_path, kept + ['scratch'])
+
+    plan = compact.scanPatient(pt_path, keep_patterns(cfg))
+    assert [Path(p).name for p in plan['prune']] == ['scratch']
+
+
+def write_bytes(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+def test_dedup_links_identical_wavs(tmp_path):
+    pt_path = tmp_path / 'D1'
+    denoised = pt_path / 'allblocks.wav'
+    copies = [pt_path / 'mfa' / 'input_mfa' / 'allblocks.wav',
+              pt_path / 'mfa' / 'input_mfa_yes' / 'allblocks_yes.wav']
+    # same size as the denoised audio, different content
+    others = [pt_path / 'allblocks_original.wav',
+              pt_path / 'mfa' / 'input_mfa_no' / 'allblocks_no.wav']
+    for path in [denoised] + copies:
+        write_bytes(path, b'a' * 1000)
+    for i, path in enumerate(others):
+        write_bytes(path, bytes([i]) * 1000)
+    paths = [denoised] + copies + others
+    keep = ['input_mfa*']
+
+    def _state():
+        return {p: (p.stat().st_ino, p.read_bytes()) for p in paths}
+
+    before = _state()
+    results = compact.compact([pt_path], keep, dry_run=True)
+    assert sorted(results[0]['links']) == [(p, denoised) for p in copies]
+    assert _state() == before
+
+    results = compact.compact([pt_path], keep, dry_run=False)
+    assert results[0]['errors'] == []
+    after = _state()
+    for path in copies:
+        assert after[path][0] == before[denoised][0]
+    for path in [denoised] + others:
+        assert after[path] == before[path]
+    assert not list(pt_path.rglob('*.link'))
@@ -0,0 +1,25 @@
+import logging
+
+from utils import mfa_utils
+from utils.events import EventLog, readEvents
+from utils.tier import Tier, Vocab
+
+
+def test_capture_logs(tmp_path, capsys):
+    """Warnings of the pipeline's modules are logged as message events
+    instead of being printed."""
+    log_path = tmp_path / 'events.jsonl'
+    events = EventLog(log_path, patient='D1')
+    vocab = Vocab([''])
+    onsets = Tier([1.0], [1.5], ['1_dog.wav'], vocab=vocab)
+    with events.captureLogs():
+        placed = mfa_utils.placeStims({'words': {}}, onsets, ['sound'])
+    assert len(placed['words']) == 0
+    assert capsys.readouterr().out == ''
+
+    records, _ = readEvents(log_path)
+    assert [(r['event'], r['level'], r['patient']) for r in records] == \
+        [('message', 'warning', 'D1')]
+    assert 'dog' in records[0]['text']
+    logger = logging.getLogger('utils')
+    assert logger.propagate and not logger.handlers
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+import scipy.io as sio
+
+from mfa_pipeline import export_patients
+
+FS = 8000
+N_PATIENTS = 6
+N_WORDS = 40
+
+
+def make_patients(root) -> list[str]:
+    """Make aligned patients whose words all have different labels."""
+    rng = np.random.default_rng(0)
+    patients = []
+    for k in range(N_PATIENTS):
+        pt = f'D{k + 1}'
+        mfa_path = root / pt / 'mfa'
+        mfa_path.mkdir(parents=True)
+        sio.wavfile.write(root / pt / 'allblocks.wav', FS,
+                          rng.integers(-1000, 1000, (N_WORDS + 1) * FS,
+                                       dtype=np.int16))
+        with open(mfa_path / 'mfa_resp_words.txt', 'w') as f:
+            for j in range(N_WORDS):
+                f.write(f'{j + 0.25}\t{j + 0.75}\t{pt.lower()}w{j}\n')
+        patients.append(pt)
+    return patients
+
+
+def expected_labels(pt: str) -> list[str]:
+    return [f'{pt.lower()}w{j}' for j in range(N_WORDS)]
+
+
+@pytest.mark.parametrize('fmt', ['clips', 'stack'])
+def test_parallel_export_labels(make_cfg, tmp_path, fmt):
+    patients = make_patients(tmp_path / 'patients')
+    cfg = make_cfg('export.unit=words', f'export.format={fmt}',
+                   f'export.n_workers={N_PATIENTS}')
+    assert export_patients(patients, cfg) == []
+
+    for pt in patients:
+        mfa_path = tmp_path / 'patients' / pt / 'mfa'
+        labels = expected_labels(pt)
+        if fmt == 'clips':
+            clips = sorted(p.name for p in
+                           (mfa_path / 'epochs_resp_words').glob('*.wav'))
+            assert clips == [f'{j:04d}_{label}.wav'
+                             for j, label in enumerate(labels)]
+        else:
+            stack = np.load(mfa_path / 'epochs_resp_words.npy')
+            assert stack.shape == (N_WORDS, FS // 2)
+            with np.load(mfa_path / 'epochs_resp_words_index.npz') as index:
+                assert index['labels'].tolist() == labels
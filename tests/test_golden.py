@@ -0,0 +1,95 @@
+"""Compare the annotation stages against outputs of the original list-based
+implementation, saved in 'data/golden'. The inputs are the synthetic patient
+in 'data/patient' and the stimulus templates in 'data/stims'; the golden
+files were made with a merge threshold of 0.75 s (or 0.5 s where named), a
+maximum response duration of 3 s and a 52 s recording.
+"""
+from pathlib import Path
+import pytest
+
+from utils import mfa_utils
+from utils.tier import Tier, Vocab
+
+REC_DUR = 52.0
+MAX_DUR = 3.0
+MERGE_THRESH = 0.75
+
+
+def read_golden(path: Path) -> list[tuple[float, float, str]]:
+    rows = []
+    with open(path, 'r') as f:
+        for line in f:
+            cols = line.rstrip('\n').split('\t')
+            rows.append((float(cols[0]), float(cols[1]),
+                         cols[2] if len(cols) > 2 else ''))
+    return rows
+
+
+def assert_golden(tier: Tier, path: Path) -> None:
+    assert [tuple(iv) for iv in tier] == read_golden(path)
+
+
+@pytest.fixture
+def vocab() -> Vocab:
+    return Vocab([''])
+
+
+@pytest.fixture
+def stims(data_dir, vocab) -> dict[str, Tier]:
+    annot_dict = mfa_utils.loadAnnotsToDict(data_dir / 'stims')
+    onsets = mfa_utils.readTier(data_dir / 'patient' / 'cue_events.txt',
+                                vocab)
+    trial_conds = mfa_utils.loadTrialConds(
+        data_dir / 'patient' / 'trialInfo.mat', len(onsets))
+    return mfa_utils.placeStims(annot_dict, onsets, trial_conds['modality'])
+
+
+@pytest.mark.parametrize('tier', ['words', 'phones'])
+def test_place_stims(data_dir, stims, tier):
+    assert_golden(stims[tier], data_dir / 'golden' / f'mfa_stim_{tier}.txt')
+
+
+@pytest.mark.parametrize('merge_thresh', [0.5, 0.75])
+def test_merge_tier(data_dir, stims, merge_thresh):
+    merged = mfa_utils.mergeTier(stims['words'], merge_thresh)
+    assert_golden(merged, data_dir / 'golden' /
+                  f'merged_stim_times_{merge_thresh}.txt')
+
+
+@pytest.mark.parametrize('method', ['resp', 'yes'])
+def test_resp_windows(data_dir, stims, method):
+    merged = mfa_utils.mergeTier(stims['words'], MERGE_THRESH)
+    trial_conds = mfa_utils.loadTrialConds(
+        data_dir / 'patient' / 'trialInfo.mat', len(merged))
+    windows = mfa_utils.respWindows(merged, trial_conds, REC_DUR, MAX_DUR,
+                                    method=method)
+    assert_golden(windows,
+                  data_dir / 'golden' / f'annotated_{method}_windows.txt')
+
+
+def test_retrocue_windows(data_dir, vocab):
+    cues = mfa_utils.readTier(data_dir / 'patient' / 'cue_events_mfa.txt',
+                              vocab)
+    windows = mfa_utils.retrocueWindows(cues, REC_DUR, MAX_DUR)
+    assert_golden(windows,
+                  data_dir / 'golden' / 'annotated_retro_windows.txt')
+
+
+def test_file_helpers(data_dir, tmp_path):
+    """The file-to-file helpers write the same values as the original."""
+    golden = data_dir / 'golden'
+    annot_dict = mfa_utils.loadAnnotsToDict(data_dir / 'stims')
+    patient = data_dir / 'patient'
+    mfa_utils.annotateStims(annot_dict, patient / 'cue_events.txt',
+                            patient / 'trialInfo.mat', out_dir=tmp_path)
+    mfa_utils.mergeAnnots(tmp_path / 'mfa_stim_words.txt', MERGE_THRESH)
+    mfa_utils.annotateResp(tmp_path / 'merged_stim_times.txt',
+                           patient / 'trialInfo.mat', REC_DUR, tmp_path,
+                           MAX_DUR)
+    for name, golden_name in [
+            ('mfa_stim_words.txt', 'mfa_stim_words.txt'),
+            ('mfa_stim_phones.txt', 'mfa_stim_phones.txt'),
+            ('merged_stim_times.txt', 'merged_stim_times_0.75.txt'),
+            ('annotated_resp_windows.txt', 'annotated_resp_windows.txt')]:
+        assert read_golden(tmp_path / name) == read_golden(golden /
+                                                           golden_name)
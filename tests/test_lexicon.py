@@ -0,0 +1,79 @@
+import pytest
+
+from utils import lexicon
+from utils.events import EventLog, readEvents
+from utils.pipeline import check_lexicon
+from utils.tier import Tier, Vocab
+
+
+@pytest.fixture
+def dicts(tmp_path) -> list[str]:
+    """Task dictionary without probabilities, and a base dictionary with
+    them."""
+    (tmp_path / 'task.dict').write_text('dog\tD AO G\nbab\tB AE B\n')
+    (tmp_path / 'base.dict').write_text(
+        'dog\t0.9\tD AA G\n'
+        'cat\t0.8\tK AE T\n'
+        'cat\t0.2\tK AH T\n'
+        'the\t1.0\tDH AH\n')
+    return [(tmp_path / 'task.dict').as_posix(),
+            (tmp_path / 'base.dict').as_posix()]
+
+
+def test_load_lexicon_falls_back_to_base(dicts, tmp_path):
+    lex_index = lexicon.loadLexicon(dicts + ['missing_dict'])
+    assert lex_index['sources'] == dicts
+    # task pronunciations come first, other words from the base dictionary
+    assert lex_index['words']['dog'] == ['dog\tD AO G']
+    assert len(lex_index['words']['cat']) == 2
+    assert lexicon.findOOV({'dog', 'cat', 'gab'}, lex_index) == ['gab']
+    assert lexicon.loadLexicon('missing_dict') == {}
+
+
+def test_subset_dict_mixed_probabilities(dicts, tmp_path):
+    lex_index = lexicon.loadLexicon(dicts)
+    out_path = tmp_path / 'subset.dict'
+    lexicon.writeSubsetDict({'cat', 'dog', 'gab'}, lex_index, out_path)
+    # the task dictionary has no probabilities, so none are kept
+    assert out_path.read_text().splitlines() == \
+        ['cat\tK AE T', 'cat\tK AH T', 'dog\tD AO G']
+
+    lexicon.writeSubsetDict({'cat', 'the'}, lex_index, out_path)
+    assert out_path.read_text().splitlines() == \
+        ['cat\t0.8\tK AE T', 'cat\t0.2\tK AH T', 'the\t1.0\tDH AH']
+
+
+def test_split_pronunciation():
+    assert lexicon.splitPronunciation('dog\tD AO G') == \
+        ('dog', [], ['D', 'AO', 'G'])
+    assert lexicon.splitPronunciation('dog 0.99 0.1 1.0 1.2 D AO G') == \
+        ('dog', ['0.99', '0.1', '1.0', '1.2'], ['D', 'AO', 'G'])
+
+
+def windows(labels: list[str]) -> Tier:
+    return Tier(list(range(len(labels))), list(range(1, len(labels) + 1)),
+                labels, vocab=Vocab(['']))
+
+
+def test_check_lexicon_oov(dicts, tmp_path):
+    lex_index = lexicon.loadLexicon(dicts)
+    dict_path = tmp_path / 'lexicon_resp.dict'
+    resp = windows(['The dog.', 'gab cat'])
+    with pytest.raises(ValueError, match='gab'):
+        check_lexicon(lex_index, resp, dict_path, 'task', 'error')
+    assert not dict_path.exists()
+
+    log_path = tmp_path / 'events.jsonl'
+    assert check_lexicon(lex_index, resp, dict_path, 'task', 'warn',
+                         events=EventLog(log_path)) == 'task'
+    records, _ = readEvents(log_path)
+    assert [r['level'] for r in records] == ['warning']
+    assert 'gab' in records[0]['text']
+
+    assert check_lexicon(lex_index, resp, dict_path, 'task', 'ignore',
+                         subset_dict=True,
+                         events=EventLog(log_path)) == dict_path.as_posix()
+    assert len(readEvents(log_path)[0]) == 1
+    assert [line.split('\t')[0] for line in
+            dict_path.read_text().splitlines()] == ['cat', 'cat', 'dog',
+                                                    'the']
@@ -0,0 +1,70 @@
+import numpy as np
+import scipy.io as sio
+
+from utils import mfa_utils
+
+FS = 8000
+
+
+def write_noise(path, seconds: float, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    data = rng.integers(-1000, 1000, int(seconds * FS), dtype=np.int16)
+    sio.wavfile.write(path, FS, data)
+    return data
+
+
+def test_denoise_reuses_denoised_wav(tmp_path):
+    wav_path = tmp_path / 'allblocks.wav'
+    data = write_noise(wav_path, 3, 0)
+    mfa_utils.denoiseWav(wav_path)
+    assert mfa_utils.isDenoised(wav_path)
+    mtime = wav_path.stat().st_mtime_ns
+
+    mfa_utils.denoiseWav(wav_path)
+    assert wav_path.stat().st_mtime_ns == mtime
+    _, orig = sio.wavfile.read(tmp_path / 'allblocks_original.wav')
+    assert np.array_equal(orig, data)
+
+
+def test_denoise_replaced_recording(tmp_path):
+    wav_path = tmp_path / 'allblocks.wav'
+    write_noise(wav_path, 3, 0)
+    mfa_utils.denoiseWav(wav_path)
+
+    new_data = write_noise(wav_path, 5, 1)
+    assert not mfa_utils.isDenoised(wav_path)
+    staged_path = tmp_path / 'staged.wav'
+    mfa_utils.denoiseWav(wav_path, out_path=staged_path)
+    assert sio.wavfile.read(staged_path)[1].shape == new_data.shape
+    _, wav = sio.wavfile.read(wav_path)
+    assert np.array_equal(wav, new_data)
+
+    mfa_utils.denoiseWav(wav_path)
+    _, orig = sio.wavfile.read(tmp_path / 'allblocks_original.wav')
+    assert np.array_equal(orig, new_data)
+    assert sio.wavfile.read(wav_path)[1].shape == new_data.shape
+    assert mfa_utils.isDenoised(wav_path)
+
+
+def test_prepare_keeps_input_copy(tmp_path):
+    (tmp_path / 'input_mfa').mkdir()
+    write_noise(tmp_path / 'allblocks.wav', 3, 0)
+    (tmp_path / 'allblocks.TextGrid').write_text('')
+    mfa_utils.prepareForMFA(tmp_path)
+    in_wav = tmp_path / 'input_mfa' / 'allblocks.wav'
+    cache = {}
+    digest = mfa_utils.cachedFileHash(in_wav, cache)
+
+    mfa_utils.prepareForMFA(tmp_path)
+    assert cache[in_wav.name][:2] == [in_wav.stat().st_size,
+                                      in_wav.stat().st_mtime_ns]
+    assert mfa_utils.cachedFileHash(in_wav, cache) == digest
+
+
+def test_input_hash_includes_options(tmp_path):
+    (tmp_path / 'a.wav').write_bytes(b'x')
+    hashes = {mfa_utils.mfaInputHash(tmp_path, 'dict', 'model', **kwargs)
+              for kwargs in [{}, {'single_speaker': True},
+                             {'extra_args': ['--beam', '100']},
+                             {'extra_args': ['--beam', '200']}]}
+    assert len(hashes) == 4
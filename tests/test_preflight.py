@@ -0,0 +1,61 @@
+import numpy as np
+import scipy.io as sio
+
+from utils import mfa_utils
+from utils.preflight import preflight, validatePatient
+
+REQUIRED = ['allblocks.wav', 'cue_events.txt', 'trialInfo.mat']
+
+
+def test_valid_patient(patient, data_dir):
+    annot_dict = mfa_utils.loadAnnotsToDict(data_dir / 'stims')
+    result = validatePatient(patient, REQUIRED, annot_dict)
+    assert result['issues'] == []
+    assert result['ok']
+    assert (result['n_cues'], result['n_trials']) == (12, 12)
+    assert result['audio_min'] == 52 / 60
+
+
+def test_truncated_wav(patient):
+    wav_path = patient / 'allblocks.wav'
+    data = wav_path.read_bytes()
+    wav_path.write_bytes(data[:len(data) // 2])
+    result = validatePatient(patient, REQUIRED)
+    assert not result['ok']
+    assert result['issues'] == ['allblocks.wav is truncated']
+
+
+def test_cue_trial_mismatch(patient):
+    cue_path = patient / 'cue_events.txt'
+    lines = cue_path.read_text().splitlines(keepends=True)
+    cue_path.write_text(''.join(lines[:-1]))
+    result = validatePatient(patient, REQUIRED)
+    assert result['issues'] == [
+        '11 cues in cue_events.txt but 12 trials in trialInfo.mat']
+
+
+def test_cue_after_recording(patient):
+    fs = 8000
+    sio.wavfile.write(patient / 'allblocks.wav', fs,
+                      np.zeros(30 * fs, dtype=np.int16))
+    result = validatePatient(patient, REQUIRED)
+    assert result['issues'] == [
+        'cue_events.txt has cues after the end of the recording']
+
+
+def test_missing_files_and_templates(patient, data_dir):
+    annot_dict = mfa_utils.loadAnnotsToDict(data_dir / 'stims')
+    for tier in annot_dict:
+        del annot_dict[tier]['bak']
+    (patient / 'trialInfo.mat').unlink()
+    result = validatePatient(patient, REQUIRED, annot_dict)
+    assert result['issues'] == ['missing trialInfo.mat',
+                                "no stim templates for cues ['bak']"]
+
+
+def test_preflight_order(patient, tmp_path):
+    missing = tmp_path / 'patients' / 'D2'
+    missing.mkdir()
+    results = preflight([missing, patient], REQUIRED, n_workers=2)
+    assert [r['patient'] for r in results] == ['D2', 'D1']
+    assert [r['ok'] for r in results] == [False, True]
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from utils.realign import assignToWindows, scoreWindows, windowReasons
+from utils.tier import Tier, Vocab
+
+# each window is built to have a single problem, except the first
+WINDOWS = [(0.0, 2.0, 'a b'), (3.0, 5.0, 'c'), (6.0, 8.0, 'd e'),
+           (9.0, 11.0, 'f'), (12.0, 12.05, 'g'), (15.0, 17.0, 'h'),
+           (18.0, 20.0, 'i')]
+WORDS = [(0.1, 0.5, 'a'), (0.6, 1.0, 'b'), (6.2, 6.8, 'd'),
+         (9.2, 9.8, '<unk>'), (12.0, 12.03, 'g'), (15.1, 16.9, 'h'),
+         (18.5, 18.6, 'i'), (21.0, 21.5, 'outside')]
+PHONES = [(0.1, 0.2, 'a'), (0.6, 0.7, 'b'), (6.2, 6.3, 'd'),
+          (9.2, 9.3, 'spn'), (15.1, 16.6, 'h'), (18.5, 18.6, 'i')]
+REASONS = [[], ['empty'], ['missing_words'], ['unk'], ['collapsed'],
+           ['phone_outliers'], ['low_coverage']]
+
+
+@pytest.fixture
+def scores() -> dict:
+    vocab = Vocab([''])
+    return scoreWindows(Tier.fromIntervals(WINDOWS, vocab),
+                        Tier.fromIntervals(WORDS, vocab),
+                        Tier.fromIntervals(PHONES, vocab),
+                        min_word_dur=0.05, phone_z=3.5, min_coverage=0.2,
+                        phone_stats=(float(np.log(0.1)), 0.3))
+
+
+def test_score_counts(scores):
+    assert scores['n_words'].tolist() == [2, 0, 1, 1, 1, 1, 1]
+    assert scores['expected'].tolist() == [2, 1, 2, 1, 1, 1, 1]
+    assert scores['n_unk'].tolist() == [0, 0, 0, 1, 0, 0, 0]
+    assert scores['n_collapsed'].tolist() == [0, 0, 0, 0, 1, 0, 0]
+    assert scores['n_phone_outliers'].tolist() == [0, 0, 0, 0, 0, 1, 0]
+    np.testing.assert_allclose(scores['coverage'][[0, 1, 6]],
+                               [0.4, 0.0, 0.05])
+
+
+def test_window_reasons(scores):
+    assert [windowReasons(scores, i) for i in range(len(WINDOWS))] == \
+        REASONS
+    assert scores['suspect'].tolist() == [bool(r) for r in REASONS]
+
+
+def test_phone_stats_default():
+    """Without explicit statistics, outliers are found among the phones."""
+    vocab = Vocab([''])
+    durs = [0.09, 0.1, 0.11, 0.12]
+    phones = Tier.fromIntervals([(i, i + durs[i % 4], 'p')
+                                 for i in range(20)] +
+                                [(30.0, 32.0, 'p')], vocab)
+    windows = Tier.fromIntervals([(0.0, 29.0, 'w'), (29.5, 33.0, 'w')],
+                                 vocab)
+    words = Tier.fromIntervals([(0.0, 20.0, 'w'), (30.0, 32.0, 'w')],
+                               vocab)
+    scores = scoreWindows(windows, words, phones)
+    assert scores['n_phone_outliers'].tolist() == [0, 1]
+
+
+def test_assign_to_windows_bounds():
+    vocab = Vocab([''])
+    windows = Tier.fromIntervals([(1.0, 2.0, 'a'), (2.0, 3.0, 'b')], vocab)
+    tier = Tier.fromIntervals([(1.0, 2.0, 'x'), (2.0, 2.5, 'y'),
+                               (0.5, 1.5, 'z'), (2.5, 3.5, 'w')], vocab)
+    assert assignToWindows(windows, tier).tolist() == [0, 1, -1, -1]
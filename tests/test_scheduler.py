@@ -0,0 +1,70 @@
+import pytest
+
+from mfa_pipeline import admit_patients, estimate_patient_cost
+from utils.pipeline import mfa_work_dir
+
+
+def test_estimate_defaults(make_cfg):
+    sched_cfg = make_cfg().scheduler
+    assert estimate_patient_cost(10, None, {}, sched_cfg) == \
+        (500 + 100 * 10, 30 * 10)
+
+
+def test_estimate_from_reports(make_cfg):
+    sched_cfg = make_cfg().scheduler
+    reports = {
+        'D1': {'success': True, 'audio_min': 10, 'peak_mem_mb': 900,
+               'peak_mem_lower_bound': False, 'runtime_s': 100},
+        'D2': {'success': True, 'audio_min': 20, 'peak_mem_mb': 1300,
+               'peak_mem_lower_bound': False, 'runtime_s': 400},
+        'D3': {'success': False, 'audio_min': 10, 'peak_mem_mb': 9000,
+               'runtime_s': 9000},
+    }
+    # median of 40 and 40 MB/min above the base, and of 10 and 20 s/min
+    assert estimate_patient_cost(5, None, reports, sched_cfg) == \
+        pytest.approx((500 + 40 * 5, 15 * 5))
+
+    # the patient's own run on the same recording, with headroom on a
+    # lower bound of its peak memory
+    own = {'success': True, 'audio_min': 10, 'peak_mem_mb': 1000,
+           'peak_mem_lower_bound': True, 'runtime_s': 120}
+    assert estimate_patient_cost(10, own, reports, sched_cfg) == \
+        pytest.approx((1500, 120))
+    # but not once the recording has changed
+    assert estimate_patient_cost(12, own, reports, sched_cfg)[1] == \
+        pytest.approx(15 * 12)
+
+
+COSTS = {'D1': (10, 3000, 300), 'D2': (10, 2000, 200),
+         'D3': (10, 1500, 100), 'D4': (10, 500, 50)}
+
+
+def test_admit_memory_budget():
+    pending = list(COSTS)
+    # D2 and D3 don't fit next to D1, D4 does
+    assert admit_patients(pending, COSTS, 0, 0, 4, 4000) == ['D1', 'D4']
+    assert admit_patients(pending, COSTS, 0, 0, 4, None) == pending
+    assert admit_patients(pending, COSTS, 0, 0, 2, None) == ['D1', 'D2']
+    # no free workers
+    assert admit_patients(pending, COSTS, 0, 2, 2, None) == []
+    # waits for running patients to free memory
+    assert admit_patients(['D2', 'D3'], COSTS, 3000, 1, 4, 4000) == []
+
+
+def test_admit_over_budget_alone():
+    """A patient that exceeds the whole budget runs once nothing else is."""
+    assert admit_patients(['D1', 'D4'], COSTS, 0, 0, 4, 1000) == ['D1']
+    assert admit_patients(['D1', 'D4'], COSTS, 500, 1, 4, 1000) == ['D4']
+
+
+def test_mfa_work_dir(make_cfg, tmp_path):
+    pt_path = tmp_path / 'patients' / 'D1'
+    assert mfa_work_dir(make_cfg(), pt_path, 'resp') is None
+    # patients aligned at the same time get their own directories
+    cfg = make_cfg('scheduler.n_workers=4')
+    assert mfa_work_dir(cfg, pt_path, 'resp') == \
+        pt_path / 'mfa' / '.mfa_tmp' / 'resp'
+    cfg = make_cfg('scheduler.n_workers=4',
+                   f'mfa_work.root={(tmp_path / "work").as_posix()}')
+    assert mfa_work_dir(cfg, pt_path, 'resp') == \
+        tmp_path / 'work' / 'D1' / 'resp'
@@ -0,0 +1,127 @@
+import hashlib
+import numpy as np
+import scipy.io as sio
+import pytest
+
+from utils import sweep
+from utils.pipeline import process_patient, sweep_patient, sweep_values
+from utils.tier import Tier, Vocab
+
+FS = 8000
+
+
+def random_windows(seed: int, n: int = 200) -> Tier:
+    rng = np.random.default_rng(seed)
+    starts = np.sort(rng.uniform(0, 100, n))
+    return Tier(starts, starts + rng.uniform(0.1, 5, n), vocab=Vocab(['']))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_pack_layers_no_overlap(seed):
+    windows = random_windows(seed)
+    layers = sweep.packLayers(windows)
+    for k in range(layers.max() + 1):
+        layer = windows[layers == k]
+        assert np.all(layer.ends[:-1] <= layer.starts[1:])
+    # as few layers as the most windows overlapping at one time
+    events = sorted([(s, 1) for s in windows.starts.tolist()] +
+                    [(e, -1) for e in windows.ends.tolist()])
+    depth = np.cumsum([d for _, d in events]).max()
+    assert layers.max() + 1 == depth
+
+
+def test_pack_layers_touching():
+    windows = Tier([0.0, 1.0, 2.0], [1.0, 2.0, 3.0], vocab=Vocab(['']))
+    assert sweep.packLayers(windows).tolist() == [0, 0, 0]
+    assert len(sweep.packLayers(Tier(vocab=Vocab([''])))) == 0
+
+
+def test_unique_windows_rounding():
+    vocab = Vocab([''])
+    a = Tier([1.0, 5.0], [3.0, 7.0], ['x', 'y'], vocab=vocab)
+    # same windows up to floating point error, plus one a sample later and
+    # one with another label
+    b = Tier([1.0 + 1e-12, 5.0 + 1.0 / FS, 5.0],
+             [(0.1 + 0.2) * 10, 7.0, 7.0], ['x', 'y', 'z'], vocab=vocab)
+    windows, idx = sweep.uniqueWindows([a, b], FS)
+    assert len(windows) == 4
+    assert list(windows[idx[0]]) == list(a)
+    assert idx[1][0] == idx[0][0]
+    assert windows.labels[idx[1][1]] == 'y' and idx[1][1] != idx[0][1]
+    assert windows.labels[idx[1][2]] == 'z'
+    assert np.all(np.diff(windows.starts) >= 0)
+
+
+def test_variant_alignment():
+    vocab = Vocab([''])
+    tier = Tier([5.0, 1.0, 3.0, 8.0], [5.5, 1.5, 3.5, 8.5],
+                ['c', 'a', 'b', 'd'], vocab=vocab)
+    owners = np.array([2, 0, 1, -1])
+    assert sweep.variantAlignment(tier, owners, np.array([2, 0])).labels == \
+        ['a', 'c']
+    assert len(sweep.variantAlignment(tier, owners, np.array([3]))) == 0
+
+
+def test_retro_cue_merge_thresh_rejected(make_cfg):
+    with pytest.raises(ValueError):
+        sweep_values(make_cfg('task=retro_cue', 'sweep.merge_thresh=[0.5]'))
+    assert sweep_values(make_cfg('task=retro_cue', 'sweep.max_dur=[2,3]')) \
+        == ([0.5], [2, 3])
+
+
+def file_hash(path) -> str:
+    return hashlib.sha1(path.read_bytes()).hexdigest()
+
+
+def test_default_variant_matches_align(make_cfg, data_dir, patient,
+                                       fake_mfa):
+    """The variant with the configured values gives the same windows and
+    alignments as the align mode, and the recording is left unchanged."""
+    cfg = make_cfg('task=lexical_repeat',
+                   f'task.stim_dir={(data_dir / "stims").as_posix()}',
+                   'merge_thresh=0.75', 'task.max_dur=3.0',
+                   'sweep.merge_thresh=[0.5,0.75]', 'sweep.max_dur=[2.0,3.0]')
+    wav_hash = file_hash(patient / 'allblocks.wav')
+    summary = sweep_patient(patient, cfg)
+    assert file_hash(patient / 'allblocks.wav') == wav_hash
+    assert not (patient / 'allblocks_original.wav').exists()
+    assert (patient / 'mfa' / 'sweep' / 'allblocks.wav').is_file()
+
+    # 0.5 s splits the two-word stimuli, giving more stimuli than trials
+    for name in ['merge_0.5_maxdur_2', 'merge_0.5_maxdur_3']:
+        assert 'skipped' in summary[name]
+        assert not (patient / 'mfa' / 'sweep' / name).exists()
+    assert set(summary['merge_0.75_maxdur_2']) == {'resp', 'yes', 'no'}
+
+    result = process_patient(patient, cfg)
+    assert result.errors == []
+    variant_path = patient / 'mfa' / 'sweep' / 'merge_0.75_maxdur_3'
+    names = [f'annotated_{t}_windows.txt' for t in ['resp', 'yes', 'no']] + \
+        [f'mfa_{t}_{tier}.txt' for t in ['resp', 'yes', 'no']
+         for tier in ['words', 'phones']]
+    for name in names:
+        assert (variant_path / name).read_text() == \
+            (patient / 'mfa' / name).read_text(), name
+    assert (variant_path / 'mfa_resp_words.txt').read_text()
+
+
+def test_replaced_recording_denoised_copy(make_cfg, data_dir, patient,
+                                          fake_mfa):
+    """A recording that replaced the denoised audio of an earlier run is
+    denoised to a copy instead of being aligned as it is."""
+    cfg = make_cfg('task=lexical_repeat',
+                   f'task.stim_dir={(data_dir / "stims").as_posix()}',
+                   'merge_thresh=0.75', 'task.max_dur=3.0',
+                   'sweep.max_dur=[2.0,3.0]')
+    assert process_patient(patient, cfg).errors == []
+    staged_path = patient / 'mfa' / 'sweep' / 'allblocks.wav'
+    sweep_patient(patient, cfg)
+    assert not staged_path.exists()
+
+    rng = np.random.default_rng(1)
+    sio.wavfile.write(patient / 'allblocks.wav', FS,
+                      rng.integers(-1000, 1000, 55 * FS, dtype=np.int16))
+    wav_hash = file_hash(patient / 'allblocks.wav')
+    sweep_patient(patient, cfg)
+    assert file_hash(patient / 'allblocks.wav') == wav_hash
+    assert sio.wavfile.read(staged_path)[1].shape == (55 * FS,)
@@ -0,0 +1,80 @@
+import pickle
+import threading
+import numpy as np
+
+from utils.tier import Interval, Tier, Vocab
+
+
+def make_tier(vocab: Vocab) -> Tier:
+    return Tier([0.0, 0.1 + 0.2, 1.5, 12.345],
+                [0.3, 1.0 / 3, 2.0, 13.0],
+                ['a', 'two words', '', 'a'], vocab=vocab)
+
+
+def test_write_read_round_trip(tmp_path):
+    tier = make_tier(Vocab(['']))
+    tier.write(tmp_path / 'tier.txt')
+    read = Tier.read(tmp_path / 'tier.txt', Vocab(['']))
+    assert read == tier
+    np.testing.assert_array_equal(read.starts, tier.starts)
+    np.testing.assert_array_equal(read.ends, tier.ends)
+
+
+def test_write_text(tmp_path):
+    """Times are written as the shortest repr of their value."""
+    tier = Tier.fromIntervals([('12.345000', '13.000000', 'a')], Vocab(['']))
+    tier.write(tmp_path / 'tier.txt')
+    assert (tmp_path / 'tier.txt').read_text() == '12.345\t13.0\ta\n'
+
+
+def test_read_missing_labels(tmp_path):
+    (tmp_path / 'tier.txt').write_text('0.5\t1.0\n\n1.0\t2.0\tb\n')
+    tier = Tier.read(tmp_path / 'tier.txt', Vocab(['']))
+    assert list(tier) == [Interval(0.5, 1.0, ''), Interval(1.0, 2.0, 'b')]
+
+
+def test_save_load_round_trip(tmp_path):
+    tier = make_tier(Vocab(['']))
+    tier[[0, 3]].save(tmp_path / 'tier.npz')
+    # labels are remapped into the vocabulary the tier is loaded into
+    vocab = Vocab(['', 'z', 'a'])
+    loaded = Tier.load(tmp_path / 'tier.npz', vocab)
+    assert loaded == tier[[0, 3]]
+    assert loaded.vocab is vocab
+    assert loaded.codes.tolist() == [2, 2]
+
+
+def test_save_load_empty(tmp_path):
+    Tier(vocab=Vocab([''])).save(tmp_path / 'tier.npz')
+    assert len(Tier.load(tmp_path / 'tier.npz', Vocab(['']))) == 0
+
+
+def test_vocab_pickle():
+    vocab = Vocab(['', 'a', 'b'])
+    copy = pickle.loads(pickle.dumps(vocab))
+    assert copy.labels == vocab.labels
+    assert copy.code('b') == 2
+    assert copy.code('c') == 3
+
+
+def test_vocab_threads():
+    """Threads adding the same labels concurrently get consistent codes."""
+    vocab = Vocab([''])
+    labels = [f'w{i}' for i in range(2000)]
+    barrier = threading.Barrier(8)
+    results = []
+
+    def _encode(k):
+        barrier.wait()
+        order = labels if k % 2 else labels[::-1]
+        results.append(dict(zip(order, vocab.encode(order).tolist())))
+
+    threads = [threading.Thread(target=_encode, args=(k,)) for k in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(vocab) == len(labels) + 1
+    assert sorted(vocab.labels[1:]) == sorted(labels)
+    for codes in results:
+        assert all(vocab.labels[c] == label for label, c in codes.items())
@@ -0,0 +1,45 @@
+import numpy as np
+import scipy.io as sio
+
+from mfa_pipeline import required_files
+from utils.pipeline import process_patient
+from utils.watch import PatientWatcher
+
+FS = 8000
+
+
+def process_ready(watcher: PatientWatcher, cfg) -> list[str]:
+    """Process the patients the watcher finds ready, as `watch_patients`
+    does."""
+    ready = watcher.scan()
+    for pt in ready:
+        assert process_patient(watcher.patient_dir / pt, cfg).errors == []
+    watcher.mark_processed(ready)
+    return ready
+
+
+def test_replaced_recording_survives(make_cfg, data_dir, patient, fake_mfa):
+    """A patient whose recording is replaced after processing is processed
+    again with the new recording."""
+    cfg = make_cfg('task=lexical_repeat',
+                   f'task.stim_dir={(data_dir / "stims").as_posix()}',
+                   'merge_thresh=0.75', 'task.max_dur=3.0')
+    watcher = PatientWatcher(cfg.patient_dir, ['D*'], required_files(cfg),
+                             settle_s=0)
+    try:
+        assert process_ready(watcher, cfg) == ['D1']
+        assert process_ready(watcher, cfg) == []
+
+        rng = np.random.default_rng(1)
+        new_data = rng.integers(-1000, 1000, 55 * FS, dtype=np.int16)
+        sio.wavfile.write(patient / 'allblocks.wav', FS, new_data)
+        assert process_ready(watcher, cfg) == ['D1']
+        assert process_ready(watcher, cfg) == []
+    finally:
+        watcher.close()
+
+    _, orig = sio.wavfile.read(patient / 'allblocks_original.wav')
+    assert np.array_equal(orig, new_data)
+    for path in [patient / 'allblocks.wav',
+                 patient / 'mfa' / 'input_mfa' / 'allblocks.wav']:
+        assert sio.wavfile.read(path)[1].shape == new_data.shape
@@ -0,0 +1,257 @@
+import os
+import shutil
+import fnmatch
+from pathlib import Path
+from typing import Union
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import mfa_utils
+
+# storage categories reported for each patient
+CATEGORIES = ['original_wav', 'denoised_wav', 'input_wavs', 'output_trees',
+              'intermediates', 'annotations']
+
+
+def isKept(path: Union[str, Path], keep: list[str]) -> bool:
+    """Check whether an entry of a patient's 'mfa' directory is kept by the
+    compaction policy.
+
+    Args:
+        path (Union[str, Path]): Path to the entry, or its name.
+        keep (list[str]): Names or glob patterns of entries to keep. A
+            pattern of the form '{dir}/{child}' keeps directories matching
+            '{dir}' that contain an entry matching '{child}', e.g.
+            '*/summary.json' keeps every directory with a summary file.
+
+    Returns:
+        bool: True if the entry matches one of the patterns.
+    """
+    path = Path(path)
+    for pattern in keep:
+        dir_pattern, _, child_pattern = pattern.partition('/')
+        if not fnmatch.fnmatchcase(path.name, dir_pattern):
+            continue
+        if not child_pattern:
+            return True
+        if path.is_dir() and any(
+                fnmatch.fnmatchcase(child.name, child_pattern)
+                for child in path.iterdir()):
+            return True
+    return False
+
+
+def _category(pt_path: Path, path: Path) -> str:
+    """Storage category of a file in a patient directory."""
+    if path.parent == pt_path:
+        if path.name == 'allblocks_original.wav':
+            return 'original_wav'
+        return 'denoised_wav'
+    top = path.relative_to(pt_path / 'mfa').parts[0]
+    if top.startswith('input_mfa') and path.suffix == '.wav':
+        return 'input_wavs'
+    if top.startswith('output_mfa') and (pt_path / 'mfa' / top).is_dir():
+        return 'output_trees'
+    if path.suffix == '.txt':
+        return 'annotations'
+    return 'intermediates'
+
+
+def scanPatient(pt_path: str, keep: list[str], dedup: bool = True,
+                prune: bool = True) -> dict:
+    """Find the disk space that can be reclaimed in a processed patient's
+    directory, without changing anything.
+
+    Entries of the patient's 'mfa' directory that are not kept by the policy
+    are pruned. The remaining wav files in the patient and 'mfa' directories
+    (the original and denoised recordings, and the copies in the MFA input
+    directories) are deduplicated: files with identical contents are
+    replaced by hardlinks to a single copy.
+
+    Args:
+        pt_path (str): Path to the patient directory.
+        keep (list[str]): Names or glob patterns of entries of the 'mfa'
+            directory to keep, see `isKept`.
+        dedup (bool, optional): Whether to deduplicate wav files. Defaults to
+            True.
+        prune (bool, optional): Whether to prune entries that are not kept.
+            Defaults to True.
+
+    Returns:
+        dict: Compaction plan with keys 'patient', 'bytes' and 'reclaimable'
+            (bytes in each storage category), 'prune' (paths to delete) and
+            'links' (pairs of duplicate path and the path it will link to).
+    """
+    pt_path = Path(pt_path)
+    mfa_path = pt_path / 'mfa'
+    plan = {'patient': pt_path.name, 'bytes': dict.fromkeys(CATEGORIES, 0),
+            'reclaimable': dict.fromkeys(CATEGORIES, 0), 'prune': [],
+            'links': []}
+
+    # hardlinked files only take up space once
+    seen = set()
+
+    def _count(p, reclaim):
+        stat = p.stat()
+        if (stat.st_dev, stat.st_ino) in seen:
+            return
+        seen.add((stat.st_dev, stat.st_ino))
+        cat = _category(pt_path, p)
+        plan['bytes'][cat] += stat.st_size
+        if reclaim:
+            plan['reclaimable'][cat] += stat.st_size
+
+    # files in the patient directory that survive pruning
+    files = sorted(p for p in pt_path.glob('*.wav') if p.is_file())
+    if mfa_path.is_dir():
+        for entry in sorted(mfa_path.iterdir()):
+            entry_files = ([p for p in sorted(entry.rglob('*')) if p.is_file()]
+                           if entry.is_dir() else [entry])
+            if prune and not isKept(entry, keep):
+                plan['prune'].append(entry)
+            else:
+                files += entry_files
+    for p in files:
+        _count(p, False)
+    for entry in plan['prune']:
+        for p in ([entry] if entry.is_file() else entry.rglob('*')):
+            if p.is_file():
+                _count(p, True)
+
+    if not dedup:
+        return plan
+
+    # only files of the same size can be duplicates, so only those are hashed
+    by_size = {}
+    for p in files:
+        if p.suffix == '.wav':
+            stat = p.stat()
+            by_size.setdefault((stat.st_dev, stat.st_size), []).append(p)
+    for (_, size), paths in by_size.items():
+        if len(paths) < 2:
+            continue
+        by_hash = {}
+        for p in paths:
+            by_hash.setdefault(mfa_utils.fileHash(p), []).append(p)
+        for same in by_hash.values():
+            # link everything to the first copy, which is in the patient
+            # directory if there is one there
+            canonical = same[0]
+            canonical_ino = canonical.stat().st_ino
+            for p in same[1:]:
+                if p.stat().st_ino == canonical_ino:
+                    continue  # already linked
+                plan['links'].append((p, canonical))
+                plan['reclaimable'][_category(pt_path, p)] += size
+    return plan
+
+
+def applyPlan(plan: dict) -> list[str]:
+    """Carry out a compaction plan made by `scanPatient`.
+
+    Duplicates are replaced by writing a hardlink next to them and renaming
+    it over the duplicate, so a duplicate is never missing if compaction is
+    interrupted.
+
+    Args:
+        plan (dict): Compaction plan.
+
+    Returns:
+        list[str]: Errors for paths that could not be compacted.
+    """
+    errors = []
+    for path in plan['prune']:
+        try:
+            if path.is_dir():
+                shutil.rmtree(path)
+            else:
+                path.unlink()
+        except OSError as e:
+            errors.append(f'could not delete {path}: {e}')
+    for dup, canonical in plan['links']:
+        tmp = dup.with_name(dup.name + '.link')
+        try:
+            os.link(canonical, tmp)
+            os.replace(tmp, dup)
+        except OSError as e:
+            tmp.unlink(missing_ok=True)
+            errors.append(f'could not link {dup} to {canonical}: {e}')
+    return errors
+
+
+def compact(pt_paths: list[str], keep: list[str], dedup: bool = True,
+            prune: bool = True, dry_run: bool = True,
+            n_workers: int = 8) -> list[dict]:
+    """Reclaim disk space in many processed patient directories concurrently.
+    See `scanPatient`.
+
+    Args:
+        pt_paths (list[str]): Paths to the patient directories.
+        keep (list[str]): Names or glob patterns of entries of each 'mfa'
+            directory to keep.
+        dedup (bool, optional): Whether to deduplicate wav files. Defaults to
+            True.
+        prune (bool, optional): Whether to prune entries that are not kept.
+            Defaults to True.
+        dry_run (bool, optional): Only report what would be reclaimed.
+            Defaults to True.
+        n_workers (int, optional): Number of patients compacted at once.
+            Defaults to 8.
+
+    Returns:
+        list[dict]: Compaction plan for each patient, in input order, with an
+            additional 'errors' key.
+    """
+    def _compact(pt_path):
+        try:
+            plan = scanPatient(pt_path, keep, dedup, prune)
+        except OSError as e:
+            return {'patient': Path(pt_path).name,
+                    'bytes': dict.fromkeys(CATEGORIES, 0),
+                    'reclaimable': dict.fromkeys(CATEGORIES, 0), 'prune': [],
+                    'links': [], 'errors': [f'{type(e).__name__}: {e}']}
+        plan['errors'] = [] if dry_run else applyPlan(plan)
+        return plan
+
+    with ThreadPoolExecutor(max_workers=max(1, n_workers)) as executor:
+        return list(executor.map(_compact, pt_paths))
+
+
+def formatCompaction(results: list[dict], dry_run: bool = True) -> str:
+    """Format compaction results as a table of bytes per storage category.
+
+    Args:
+        results (list[dict]): Compaction results, see `compact`.
+        dry_run (bool, optional): Whether the results are from a dry run.
+            Defaults to True.
+
+    Returns:
+        str: Table with one row per category and a total row.
+    """
+    def _fmt(n_bytes):
+        for unit in ['B', 'KB', 'MB', 'GB']:
+            if n_bytes < 1024:
+                return f'{n_bytes:.1f} {unit}'
+            n_bytes /= 1024
+        return f'{n_bytes:.1f} TB'
+
+    header = 'reclaimable' if dry_run else 'reclaimed'
+    rows = [('category', 'size', header)]
+    totals = [0, 0]
+    for cat in CATEGORIES:
+        size = sum(r['bytes'][cat] for r in results)
+        freed = sum(r['reclaimable'][cat] for r in results)
+        totals[0] += size
+        totals[1] += freed
+        rows.append((cat, _fmt(size), _fmt(freed)))
+    rows.append(('total', _fmt(totals[0]), _fmt(totals[1])))
+    widths = [max(len(row[i]) for row in rows) for i in range(3)]
+    lines = ['  '.join(val.ljust(w) for val, w in zip(row, widths))
+             for row in rows]
+    n_prune = sum(len(r['prune']) for r in results)
+    n_links = sum(len(r['links']) for r in results)
+    lines.append(f'{n_prune} entries {"to prune" if dry_run else "pruned"}, '
+                 f'{n_links} duplicate wavs '
+                 f'{"to link" if dry_run else "linked"}')
+    for r in results:
+        lines += [f'{r["patient"]}: {err}' for err in r['errors']]
+    return '\n'.join(line.rstrip() for line in lines)
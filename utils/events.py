@@ -0,0 +1,316 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+import numpy as np
+from tqdm import tqdm
+
+
+class _MessageHandler(logging.Handler):
+    """Reports log records as messages of an event log."""
+
+    def __init__(self, events: 'EventLog') -> None:
+        super().__init__()
+        self.events = events
+
+    def emit(self, record: logging.LogRecord) -> None:
+        level = ('error' if record.levelno >= logging.ERROR else
+                 'warning' if record.levelno >= logging.WARNING else 'info')
+        self.events.message(record.getMessage(), level=level)
+
+
+class EventLog:
+    """Append-only log of pipeline events saved as JSON lines.
+
+    Every event is a single JSON object with at least the fields 'time'
+    (seconds since the epoch), 'event' and 'pid', plus the context fields the
+    log was created or bound with (e.g. 'batch', 'patient'). Stage events also
+    contain 'stage', 'duration_s' and, when a stage fails, 'error'.
+
+    Events are appended with a single write per line, so several worker
+    processes can share the same log file.
+
+    Args:
+        path (Optional[str]): Path to the log file. If None, events are
+            discarded.
+        **context: Fields added to every event.
+    """
+
+    def __init__(self, path: Optional[str], **context) -> None:
+        self.path = None if path is None else Path(path)
+        self.context = context
+        if self.path is not None:
+            os.makedirs(self.path.parent, exist_ok=True)
+
+    def bind(self, **context) -> 'EventLog':
+        """Create a log writing to the same file with additional context.
+
+        Args:
+            **context: Fields added to every event, on top of the current
+                context.
+
+        Returns:
+            EventLog: New event log.
+        """
+        return EventLog(self.path, **{**self.context, **context})
+
+    def emit(self, event: str, **fields) -> dict:
+        """Append an event to the log.
+
+        Args:
+            event (str): Event type (e.g. 'stage_start').
+            **fields: Event fields. None values are dropped.
+
+        Returns:
+            dict: The logged event.
+        """
+        record = {'time': time.time(), 'event': event, 'pid': os.getpid(),
+                  **self.context, **fields}
+        record = {k: v for k, v in record.items() if v is not None}
+        if self.path is not None:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, default=str) + '\n')
+        return record
+
+    def message(self, text: str, level: str = 'info') -> None:
+        """Report a message to the user.
+
+        Without a log file the message is printed. Otherwise it is logged as a
+        'message' event, so it does not break up the live progress view, which
+        shows warnings and errors above the progress bar (see
+        `ProgressView`).
+
+        Args:
+            text (str): Message.
+            level (str, optional): 'info', 'warning' or 'error'. Defaults to
+                'info'.
+        """
+        if self.path is None:
+            print(text)
+        else:
+            self.emit('message', level=level, text=text)
+
+    @contextmanager
+    def captureLogs(self, name: str = 'utils') -> Iterator[None]:
+        """Report the records of a logger as messages (see `message`) instead
+        of passing them on to its parents' handlers, e.g. so a worker process
+        does not print over the progress view.
+
+        Args:
+            name (str, optional): Name of the logger. Defaults to 'utils'
+                (the pipeline's modules).
+        """
+        logger = logging.getLogger(name)
+        handler = _MessageHandler(self)
+        propagate = logger.propagate
+        logger.addHandler(handler)
+        logger.propagate = False
+        try:
+            yield
+        finally:
+            logger.removeHandler(handler)
+            logger.propagate = propagate
+
+    @contextmanager
+    def stage(self, stage: str, **fields) -> Iterator[dict]:
+        """Log the start and end of a pipeline stage.
+
+        The yielded dictionary is added to the 'stage_end' event, so the stage
+        can report e.g. the number of bytes it processed, or an error for
+        failures that do not raise an exception. Exceptions raised in the
+        stage are logged as errors and re-raised.
+
+        Args:
+            stage (str): Stage name.
+            **fields: Fields added to both the start and end events.
+
+        Yields:
+            dict: Extra fields for the 'stage_end' event.
+        """
+        end_fields = {}
+        self.emit('stage_start', stage=stage, **fields)
+        start = time.time()
+        try:
+            yield end_fields
+        except Exception as e:
+            end_fields['error'] = f'{type(e).__name__}: {e}'
+            raise
+        finally:
+            self.emit('stage_end', stage=stage, duration_s=time.time() - start,
+                      status='error' if 'error' in end_fields else 'ok',
+                      **fields, **end_fields)
+
+
+def readEvents(path: str, offset: int = 0) -> tuple[list[dict], int]:
+    """Read events from an event log.
+
+    Args:
+        path (str): Path to the log file.
+        offset (int, optional): Byte offset to start reading from, used to
+            only read events added since the last read. Defaults to 0.
+
+    Returns:
+        tuple[list[dict], int]: Events, and the offset after the last complete
+            line read.
+    """
+    path = Path(path)
+    if not path.is_file():
+        return [], offset
+    events = []
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b'\n'):  # line still being written
+                break
+            offset += len(line)
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                continue
+    return events, offset
+
+
+def stageRates(events: list[dict]) -> dict[str, float]:
+    """Compute the typical duration of each stage per minute of audio.
+
+    Args:
+        events (list[dict]): Events, see `readEvents`.
+
+    Returns:
+        dict[str, float]: Median seconds taken per minute of audio for each
+            stage, from successful stages with a known audio length.
+    """
+    durations = {}
+    for ev in events:
+        if (ev.get('event') != 'stage_end' or ev.get('status') != 'ok' or
+                not ev.get('audio_min')):
+            continue
+        durations.setdefault(ev['stage'], []).append(
+            ev['duration_s'] / ev['audio_min'])
+    return {stage: float(np.median(d)) for stage, d in durations.items()}
+
+
+class ProgressView:
+    """Live view of a batch's progress, built from its event log.
+
+    Shows a progress bar over all stages of all patients in the batch, the
+    stage each running patient is in, and an ETA. The ETA uses the median
+    duration per minute of audio of each stage in earlier batches recorded
+    in the same log, updated with stages finished in the current batch.
+    Warning and error messages logged by the patients are printed above the
+    progress bar.
+
+    Args:
+        path (str): Path to the event log.
+        batch (str): ID of the batch to follow.
+        plan (dict[str, tuple[float, list[str]]]): Minutes of audio and
+            expected stages for each patient in the batch.
+        n_workers (int, optional): Number of patients run at once. Defaults
+            to 1.
+        interval (float, optional): Seconds between updates. Defaults to 1.
+    """
+
+    def __init__(self, path: str, batch: str,
+                 plan: dict[str, tuple[float, list[str]]],
+                 n_workers: int = 1, interval: float = 1.0) -> None:
+        self.path = path
+        self.batch = batch
+        self.plan = plan
+        self.n_workers = n_workers
+        self.interval = interval
+
+        history, self._offset = readEvents(path)
+        self._finished_events = [ev for ev in history
+                                 if ev.get('event') == 'stage_end']
+        self.rates = stageRates(self._finished_events)
+        self.done = {pt: set() for pt in plan}
+        self.running = {}  # patient -> (stage, start time)
+        self.ended = set()
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._pbar = tqdm(total=sum(len(s) for _, s in plan.values()),
+                          desc='Running MFA', ascii=False, ncols=150,
+                          bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} '
+                                     'stages [{elapsed}{postfix}]')
+
+    def start(self) -> 'ProgressView':
+        """Start updating the view in a background thread."""
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop updating the view and close it."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.update()
+        self._pbar.close()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.update()
+
+    def update(self) -> None:
+        """Read new events and redraw the view."""
+        events, self._offset = readEvents(self.path, self._offset)
+        for ev in events:
+            pt = ev.get('patient')
+            if ev.get('batch') != self.batch or pt not in self.plan:
+                continue
+            key = (ev['stage'] + (f':{ev["run_type"]}' if ev.get('run_type')
+                                  else '')) if 'stage' in ev else None
+            if ev['event'] == 'message':
+                if ev.get('level', 'info') != 'info':
+                    tqdm.write(ev.get('text', ''))
+            elif ev['event'] == 'stage_start':
+                self.running[pt] = (key, ev['time'])
+            elif ev['event'] == 'stage_end':
+                self.done[pt].add(key)
+                self.running.pop(pt, None)
+                if ev.get('status') == 'ok':
+                    self._finished_events.append(ev)
+                    self.rates = stageRates(self._finished_events)
+            elif ev['event'] == 'patient_end':
+                # stages skipped after an error will never run
+                self.done[pt].update(self.plan[pt][1])
+                self.running.pop(pt, None)
+                self.ended.add(pt)
+
+        self._pbar.n = sum(len(d & set(self.plan[pt][1]))
+                           for pt, d in self.done.items())
+        status = ' '.join(f'{pt}:{key}' for pt, (key, _)
+                          in self.running.items())
+        self._pbar.set_postfix_str(f'eta {self.eta()} {status}'.rstrip(),
+                                   refresh=False)
+        self._pbar.refresh()
+
+    def eta(self) -> str:
+        """Estimate the time left in the batch.
+
+        Returns:
+            str: Formatted time left, or '?' if a remaining stage has never
+                been run before.
+        """
+        now = time.time()
+        remaining = 0.0
+        for pt, (audio_min, stages) in self.plan.items():
+            if pt in self.ended:
+                continue
+            for key in stages:
+                if key in self.done[pt]:
+                    continue
+                rate = self.rates.get(key.split(':')[0])
+                if rate is None:
+                    return '?'
+                expected = rate * audio_min
+                run_key, run_start = self.running.get(pt, (None, now))
+                if run_key == key:
+                    expected = max(0.0, expected - (now - run_start))
+                remaining += expected
+        return tqdm.format_interval(remaining / self.n_workers)
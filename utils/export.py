@@ -0,0 +1,102 @@
+import os
+import re
+from pathlib import Path
+import numpy as np
+import scipy.io as sio
+
+from utils.tier import Tier
+
+# characters not allowed in clip file names
+_UNSAFE_RE = re.compile(r'[^\w\-]+')
+
+
+def epochSlices(tier: Tier, fs: int, n_samples: int, pre_s: float = 0.0,
+                post_s: float = 0.0) -> tuple[np.ndarray, np.ndarray]:
+    """Get the sample range of each interval of a tier.
+
+    Args:
+        tier (Tier): Intervals to cut, e.g. aligned words or response windows.
+        fs (int): Sampling rate of the recording.
+        n_samples (int): Length of the recording in samples.
+        pre_s (float, optional): Padding in seconds before each interval.
+            Defaults to 0.
+        post_s (float, optional): Padding in seconds after each interval.
+            Defaults to 0.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: First and last (exclusive) sample of
+            each epoch, clipped to the recording.
+    """
+    first = np.floor((tier.starts - pre_s) * fs).astype(np.int64)
+    last = np.ceil((tier.ends + post_s) * fs).astype(np.int64)
+    first = np.clip(first, 0, n_samples)
+    last = np.clip(last, first, n_samples)
+    return first, last
+
+
+def exportEpochs(wav_path: str, tier: Tier, out_path: str,
+                 fmt: str = 'clips', pre_s: float = 0.0,
+                 post_s: float = 0.0) -> dict:
+    """Cut a recording into epochs around the intervals of a tier.
+
+    The recording is memory-mapped rather than loaded, and each epoch is
+    copied straight to its output, so memory use does not grow with the
+    length of the recording.
+
+    Args:
+        wav_path (str): Path to the recording.
+        tier (Tier): Intervals to cut.
+        out_path (str): Output directory for 'clips', or path of the .npy file
+            for 'stack'.
+        fmt (str, optional): 'clips' writes a wav file per epoch named
+            '{index}_{label}.wav'. 'stack' writes a single array of shape
+            (n_epochs, max_samples[, n_channels]), with epochs zero-padded to
+            the longest epoch, and an index '{out_path stem}_index.npz' with
+            the interval times, epoch sample ranges, labels and sampling
+            rate. Defaults to 'clips'.
+        pre_s (float, optional): Padding in seconds before each interval.
+            Defaults to 0.
+        post_s (float, optional): Padding in seconds after each interval.
+            Defaults to 0.
+
+    Returns:
+        dict: Summary with keys 'n_epochs', 'n_samples' (total samples
+            exported) and 'path'.
+    """
+    out_path = Path(out_path)
+    fs, data = sio.wavfile.read(wav_path, mmap=True)
+    first, last = epochSlices(tier, fs, len(data), pre_s, post_s)
+    lengths = last - first
+
+    if fmt == 'clips':
+        os.makedirs(out_path, exist_ok=True)
+        # clear clips from a previous export, which may have other labels
+        for old_clip in out_path.glob('*.wav'):
+            old_clip.unlink()
+        for i, (s0, s1, label) in enumerate(zip(first.tolist(),
+                                                last.tolist(), tier.labels)):
+            name = f'{i:04d}_{_UNSAFE_RE.sub("_", label)}.wav'
+            sio.wavfile.write(out_path / name, fs, np.asarray(data[s0:s1]))
+    elif fmt == 'stack':
+        os.makedirs(out_path.parent, exist_ok=True)
+        shape = (len(tier), int(lengths.max(initial=0))) + data.shape[1:]
+        if np.prod(shape) == 0:
+            # empty files cannot be memory-mapped
+            np.save(out_path, np.zeros(shape, dtype=data.dtype))
+        else:
+            stack = np.lib.format.open_memmap(out_path, mode='w+',
+                                              dtype=data.dtype, shape=shape)
+            for i, (s0, s1) in enumerate(zip(first.tolist(),
+                                             last.tolist())):
+                stack[i, :s1 - s0] = data[s0:s1]
+            stack.flush()
+            del stack
+        np.savez(out_path.with_name(out_path.stem + '_index.npz'),
+                 starts=tier.starts, ends=tier.ends, first=first,
+                 lengths=lengths, labels=np.array(tier.labels, dtype=str),
+                 fs=fs)
+    else:
+        raise ValueError(f'Unknown epoch export format "{fmt}".')
+    del data
+    return {'n_epochs': len(tier), 'n_samples': int(lengths.sum()),
+            'path': out_path.as_posix()}
@@ -0,0 +1,191 @@
+import os
+import re
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+# custom dictionaries shipped with this repository
+REPO_DICT_DIR = Path(__file__).resolve().parent.parent / 'dictionary'
+
+# punctuation stripped from word edges by MFA before dictionary lookup
+_PUNCT_RE = re.compile(r'^[^\w<>\'-]+|[^\w<>\'-]+$')
+
+
+def mfaRootDir() -> Path:
+    """Get the root directory used by MFA for pretrained models.
+
+    Returns:
+        Path: Value of the MFA_ROOT_DIR environment variable if set, otherwise
+            the default 'Documents/MFA' directory in the user's home.
+    """
+    root = os.environ.get('MFA_ROOT_DIR')
+    if root:
+        return Path(root)
+    return Path(os.path.expanduser('~')) / 'Documents' / 'MFA'
+
+
+def findDictionary(dict_name: str,
+                   search_dirs: Optional[list[str]] = None) -> Optional[Path]:
+    """Find the pronunciation dictionary file for an MFA dictionary name.
+
+    Args:
+        dict_name (str): Name of the dictionary (e.g. 'english_us_ps') or a
+            path to a dictionary file.
+        search_dirs (Optional[list[str]], optional): Directories to search
+            before the repository `dictionary/` directory and the MFA
+            pretrained dictionary directory. Defaults to None.
+
+    Returns:
+        Optional[Path]: Path to the dictionary file, or None if it could not
+            be found locally.
+    """
+    if Path(dict_name).suffix and Path(dict_name).is_file():
+        return Path(dict_name)
+
+    dirs = [Path(d) for d in (search_dirs or [])]
+    dirs += [REPO_DICT_DIR, mfaRootDir() / 'pretrained_models' / 'dictionary']
+    for d in dirs:
+        for ext in ['.dict', '.txt']:
+            dict_path = d / (dict_name + ext)
+            if dict_path.is_file():
+                return dict_path
+    return None
+
+
+def normalizeWord(word: str) -> str:
+    """Normalize a transcript word the way MFA does for dictionary lookup.
+
+    Args:
+        word (str): Word from a transcript or dictionary.
+
+    Returns:
+        str: Lower case word with surrounding punctuation removed.
+    """
+    return _PUNCT_RE.sub('', word.lower())
+
+
+def loadLexicon(dict_names: Union[str, list[str]],
+                search_dirs: Optional[list[str]] = None) -> dict:
+    """Load pronunciation dictionaries into a single lexicon index.
+
+    Dictionaries are read in the order given, and a word's pronunciations are
+    taken from the first dictionary containing it, so task dictionaries
+    should come before the base pretrained dictionary.
+
+    Args:
+        dict_names (Union[str, list[str]]): Dictionary names or paths to load.
+            Dictionaries that cannot be found locally are skipped.
+        search_dirs (Optional[list[str]], optional): Additional directories to
+            search for dictionaries. See `findDictionary`. Defaults to None.
+
+    Returns:
+        dict: Lexicon index with keys 'words' (dictionary mapping each
+            normalized word to its pronunciation lines) and 'sources' (paths
+            of the loaded dictionaries). Empty if no dictionary was found.
+    """
+    if not isinstance(dict_names, list):
+        dict_names = [dict_names]
+
+    words = {}
+    sources = []
+    for dict_name in dict_names:
+        dict_path = findDictionary(dict_name, search_dirs)
+        if dict_path is None:
+            continue
+        sources.append(dict_path.as_posix())
+        curr_words = {}
+        with open(dict_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.rstrip('\n')
+                if not line.strip():
+                    continue
+                word = normalizeWord(line.split()[0])
+                curr_words.setdefault(word, []).append(line)
+        for word, prons in curr_words.items():
+            words.setdefault(word, prons)
+
+    if not sources:
+        return {}
+    return {'words': words, 'sources': sources}
+
+
+def labelWords(labels: Iterable[str]) -> set[str]:
+    """Collect the normalized words in transcript labels.
+
+    Args:
+        labels (Iterable[str]): Transcript labels, e.g. 'the dog'.
+
+    Returns:
+        set[str]: Words contained in the labels.
+    """
+    words = set()
+    for label in labels:
+        words.update(normalizeWord(w) for w in label.split())
+    words.discard('')
+    return words
+
+
+def findOOV(words: set[str], lexicon: dict) -> list[str]:
+    """Find words missing from a lexicon index.
+
+    Args:
+        words (set[str]): Normalized words to check.
+        lexicon (dict): Lexicon index, see `loadLexicon`.
+
+    Returns:
+        list[str]: Sorted words that have no pronunciation in the lexicon.
+    """
+    return sorted(w for w in words if w not in lexicon['words'])
+
+
+def splitPronunciation(line: str) -> tuple[str, list[str], list[str]]:
+    """Split a dictionary line into its word, probability columns and phones.
+
+    MFA dictionary lines are 'word phones...', optionally with a
+    pronunciation probability, or a pronunciation probability and three
+    silence probabilities, between the word and the phones.
+
+    Args:
+        line (str): Dictionary line.
+
+    Returns:
+        tuple[str, list[str], list[str]]: Word, probability columns (empty if
+            the line has none) and phones.
+    """
+    fields = line.split()
+    n_probs = 0
+    for field in fields[1:5]:
+        try:
+            float(field)
+        except ValueError:
+            break
+        n_probs += 1
+    return fields[0], fields[1:1 + n_probs], fields[1 + n_probs:]
+
+
+def writeSubsetDict(words: set[str], lexicon: dict, out_path: str) -> Path:
+    """Write a dictionary containing only the pronunciations of the given
+    words, so MFA only compiles the part of the lexicon a run needs.
+
+    Dictionaries with and without probability columns can be mixed in the
+    lexicon, but MFA expects every line of a dictionary to have the same
+    columns, so probabilities are only kept if every pronunciation written
+    has the same probability columns.
+
+    Args:
+        words (set[str]): Normalized words to include. Words missing from the
+            lexicon are skipped.
+        lexicon (dict): Lexicon index, see `loadLexicon`.
+        out_path (str): Path to save the subset dictionary to.
+
+    Returns:
+        Path: Path to the subset dictionary.
+    """
+    out_path = Path(out_path)
+    prons = [splitPronunciation(pron) for word in sorted(words)
+             for pron in lexicon['words'].get(word, [])]
+    keep_probs = len({len(probs) for _, probs, _ in prons}) == 1
+    with open(out_path, 'w', encoding='utf-8') as f:
+        for word, probs, phones in prons:
+            cols = [word] + (probs if keep_probs else []) + [' '.join(phones)]
+            f.write('\t'.join(cols) + '\n')
+    return out_path
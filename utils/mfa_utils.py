@@ -1,5 +1,9 @@
 import os
+import logging
 import subprocess
+import hashlib
+import json
+import time
 from pathlib import Path
 import shutil
 import glob
@@ -9,6 +13,16 @@ import numpy as np
 import scipy.io as sio
 import noisereduce as nr
 
+from utils import lexicon
+from utils.tier import Tier, Vocab
+
+log = logging.getLogger(__name__)
+
+# file recording the inputs of the last MFA run in a temporary directory
+MFA_STAMP_NAME = 'mfa_inputs.sha1'
+# file caching the hashes of MFA input files in a temporary directory
+MFA_HASH_CACHE_NAME = 'mfa_input_hashes.json'
+
 
 def makeMFADirs(base_path: str, runs: list[str]) -> None:
     """Create directories for Montreal Forced Aligner (MFA).
@@ -32,9 +46,63 @@ def makeMFADirs(base_path: str, runs: list[str]) -> None:
         os.makedirs(output_mfa_dir, exist_ok=True)
 
 
+def getWavInfo(wav_path: str) -> dict:
+    """Read the header of a .wav file without loading the audio data.
+
+    Args:
+        wav_path (str): Path to the audio file (assumed to be a .wav file).
+
+    Returns:
+        dict: Header information with keys 'fs' (sampling rate), 'n_channels',
+            'sampwidth' (bytes per sample), 'n_frames' (samples per channel),
+            'data_bytes' (size of the data chunk reported by the header),
+            'data_offset' (byte offset of the audio data) and 'file_bytes'
+            (size of the file on disk).
+    """
+    wav_path = Path(wav_path)
+    file_bytes = wav_path.stat().st_size
+    with open(wav_path, 'rb') as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] not in (b'RIFF', b'RF64') or \
+                riff[8:12] != b'WAVE':
+            raise ValueError(f'{wav_path} is not a RIFF/WAVE file.')
+        fmt = None
+        while True:
+            chunk_hdr = f.read(8)
+            if len(chunk_hdr) < 8:
+                raise ValueError(f'No data chunk found in {wav_path}.')
+            chunk_id = chunk_hdr[:4]
+            chunk_size = int.from_bytes(chunk_hdr[4:], 'little')
+            if chunk_id == b'fmt ':
+                fmt = f.read(chunk_size)
+                if chunk_size % 2:  # chunks are word aligned
+                    f.seek(1, os.SEEK_CUR)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise ValueError(f'Data chunk before fmt chunk in '
+                                     f'{wav_path}.')
+                data_offset = f.tell()
+                break
+            else:
+                f.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+    n_channels = int.from_bytes(fmt[2:4], 'little')
+    fs = int.from_bytes(fmt[4:8], 'little')
+    block_align = int.from_bytes(fmt[12:14], 'little')
+    sampwidth = block_align // n_channels
+    # RF64 files and files still being written can report a placeholder size
+    if chunk_size in (0, 0xFFFFFFFF):
+        chunk_size = file_bytes - data_offset
+    return {'fs': fs, 'n_channels': n_channels, 'sampwidth': sampwidth,
+            'n_frames': chunk_size // block_align, 'data_bytes': chunk_size,
+            'data_offset': data_offset, 'file_bytes': file_bytes}
+
+
 def calculateAudDur(wav_path: str) -> float:
     """Calculate the duration of an audio file in seconds.
 
+    Only the file header is read, so this is cheap even for long recordings.
+
     Args:
         wav_path (str): Path to the audio file (assumed to be a .wav file).
 
@@ -42,10 +110,85 @@ def calculateAudDur(wav_path: str) -> float:
         float: Duration of the audio file in seconds.
 
     """
-    a = sio.wavfile.read(wav_path)
-    fs = a[0]
-    time = (np.array(a[1],dtype=float)).shape[0] / fs
-    return time
+    info = getWavInfo(wav_path)
+    return info['n_frames'] / info['fs']
+
+
+def readTier(txt_path: str, vocab: Optional[Vocab] = None) -> Tier:
+    """Read a text file with format:
+    start_time    end_time    label
+    Lines without a label are kept with an empty label.
+
+    Args:
+        txt_path (str): Path to txt file.
+        vocab (Optional[Vocab], optional): Label vocabulary. Defaults to the
+            shared module vocabulary.
+
+    Returns:
+        Tier: Intervals in the file.
+    """
+    return Tier.read(txt_path, vocab)
+
+
+def writeTier(tier: Tier, txt_path: str) -> None:
+    """Write a tier to a text file with format:
+    start_time    end_time    label
+
+    Args:
+        tier (Tier): Intervals to write.
+        txt_path (str): Path to txt file.
+    """
+    tier.write(txt_path)
+
+
+def tierToTextGrid(tier: Tier, tier_name: str = 'words') -> TextGrid:
+    """Create a TextGrid with a single interval tier. Intervals without a
+    label are skipped.
+
+    Args:
+        tier (Tier): Intervals for the tier.
+        tier_name (str, optional): Name of the interval tier. Defaults to
+            'words'.
+
+    Returns:
+        TextGrid: TextGrid object containing the tier.
+    """
+    tg = TextGrid()
+    tg_tier = IntervalTier(name=tier_name)
+    for start, end, label in tier[tier.codes != tier.vocab.code('')]:
+        tg_tier.add(start, end, label)
+    tg.append(tg_tier)
+    return tg
+
+
+def textGridToTiers(tg: Union[str, TextGrid],
+                    tier_name: Union[str, list[str]] = ['words', 'phones'],
+                    vocab: Optional[Vocab] = None) -> dict[str, Tier]:
+    """Extract labelled intervals from the tiers of a TextGrid.
+
+    Args:
+        tg (Union[str, TextGrid]): TextGrid object or path to a TextGrid file.
+        tier_name (Union[str, list[str]], optional): Tiers to extract.
+            Defaults to ['words', 'phones'].
+        vocab (Optional[Vocab], optional): Label vocabulary. Defaults to the
+            shared module vocabulary.
+
+    Returns:
+        dict[str, Tier]: Intervals with non-empty labels for each tier.
+    """
+    if not isinstance(tg, TextGrid):
+        tg = TextGrid.fromFile(tg)
+    if not isinstance(tier_name, list):
+        tier_name = [tier_name]
+
+    tiers = {}
+    for tier in tier_name:
+        if tier not in tg.getNames():
+            raise ValueError(f'Tier "{tier}" not found in TextGrid file.')
+        tiers[tier] = Tier.fromIntervals(
+            [(iv.minTime, iv.maxTime, iv.mark) for iv in tg.getFirst(tier)
+             if iv.mark], vocab)
+    return tiers
 
 
 def txt2textGrid(txt_path: str, tg_name: str, tg_dir: Optional[str] = None,
@@ -78,29 +221,7 @@ def txt2textGrid(txt_path: str, tg_name: str, tg_dir: Optional[str] = None,
         #                        '.TextGrid')
     tg_path = tg_dir / tg_name
 
-    # Load your text file
-    entries = []
-    with open(txt_path, 'r') as f:
-        for line in f:
-            line_split = line.strip().split('\t')
-            # skip lines with no labels
-            if len(line_split) == 2:
-                continue
-            start, end, label = line_split
-            entries.append((float(start), float(end), label))
-
-    # Create a TextGrid object and add an interval tier
-    tg = TextGrid()
-    tier = IntervalTier(name=tier_name)
-
-    # Add intervals from your text file to the tier
-    for start, end, label in entries:
-        tier.add(start, end, label)
-
-    # Add the tier to the TextGrid
-    tg.append(tier)
-
-    # Save the TextGrid
+    tg = tierToTextGrid(readTier(txt_path, Vocab([''])), tier_name)
     tg.write(tg_path)
 
     if return_tg:
@@ -138,24 +259,99 @@ def textGrid2txt(tg_path: str, txt_name: str, txt_dir: Optional[str] = None,
         if not isinstance(tier_name, list):
             tier_name = [tier_name]
     
-        # Load the TextGrid file
-        tg = TextGrid.fromFile(tg_path)
-    
-        for tier in tier_name:
-            if tier not in tg.getNames():
-                raise ValueError(f'Tier "{tier}" not found in TextGrid file.')
-            curr_tier = tg.getFirst(tier)
-
+        tiers = textGridToTiers(tg_path, tier_name, Vocab(['']))
+        for tier, intervals in tiers.items():
             # write times and labels to txt file
-            with open(txt_path.as_posix() + '_' + tier + '.txt', 'w',
-                      encoding='utf-8') as f:
-                for interval in curr_tier:
-                    start = interval.minTime
-                    end = interval.maxTime
-                    label = interval.mark
-                    if not label:  # remove empty labels btw words
-                        continue
-                    f.write(f'{start}\t{end}\t{label}\n')
+            writeTier(intervals, txt_path.as_posix() + '_' + tier + '.txt')
+
+
+def denoisedStampPath(wav_path: str) -> Path:
+    """Path of the file recording the denoised audio written by
+    `denoiseWav`, '{name}_denoised.json' next to the audio file."""
+    wav_path = Path(wav_path)
+    return wav_path.parent / (wav_path.stem + '_denoised.json')
+
+
+def isDenoised(wav_path: str) -> bool:
+    """Check whether a .wav file is still the denoised audio written by
+    `denoiseWav`, rather than a recording that replaced it since.
+
+    Args:
+        wav_path (str): Path to the audio file.
+
+    Returns:
+        bool: True if '{name}_original.wav' holds the original of the audio
+            in `wav_path`.
+    """
+    wav_path = Path(wav_path)
+    orig_path = wav_path.parent / (wav_path.stem + '_original' +
+                                   wav_path.suffix)
+    if not wav_path.is_file() or not orig_path.is_file():
+        return False
+    stamp_path = denoisedStampPath(wav_path)
+    if not stamp_path.is_file():
+        # denoised by a version of the pipeline that did not record it,
+        # which kept the length of the original
+        keys = ['fs', 'n_channels', 'n_frames']
+        wav_info, orig_info = getWavInfo(wav_path), getWavInfo(orig_path)
+        return all(wav_info[k] == orig_info[k] for k in keys)
+    with open(stamp_path) as f:
+        stamp = json.load(f)
+    stat = wav_path.stat()
+    if stat.st_size != stamp['size']:
+        return False
+    if stat.st_mtime_ns == stamp['mtime_ns']:
+        return True
+    # copying or linking the file changes its modification time, but not
+    # its contents
+    return fileHash(wav_path) == stamp['sha1']
+
+
+def denoiseWav(wav_path: str, out_path: Optional[str] = None) -> None:
+    """Denoise a .wav file in place, keeping a copy of the original audio as
+    '{name}_original.wav'. The original copy is always the one denoised, so
+    repeated calls produce the same audio, and the file is left alone if it
+    is still the one written by a previous call. A recording that replaced
+    the denoised audio since becomes the new original.
+
+    Args:
+        wav_path (str): Path to the audio file.
+        out_path (Optional[str], optional): Path to write the denoised audio
+            to instead, leaving `wav_path` unchanged and without making a
+            copy of the original. Defaults to None (denoise in place).
+    """
+    wav_path = Path(wav_path)
+    orig_path = wav_path.parent / (wav_path.stem + '_original' +
+                                   wav_path.suffix)
+    stamp_path = denoisedStampPath(wav_path)
+    denoised = isDenoised(wav_path)
+
+    if out_path is not None:
+        if not denoised:
+            orig_path = wav_path
+        wav_path = Path(out_path)
+    elif denoised and stamp_path.is_file():
+        return
+    elif not denoised:
+        # keep the new recording as the original, replacing any original of
+        # an earlier recording
+        stamp_path.unlink(missing_ok=True)
+        os.replace(wav_path, orig_path)
+
+    fs, data = sio.wavfile.read(orig_path)
+    reduced_noise = nr.reduce_noise(y=data, sr=fs, stationary=False,
+                                    prop_decrease=0.9)
+
+    # overwrite original wav file with denoised version. Compaction may have
+    # hardlinked the wav files together, so replace files instead of writing
+    # through them
+    wav_path.unlink(missing_ok=True)
+    sio.wavfile.write(wav_path, fs, reduced_noise.astype(data.dtype))
+    if out_path is None:
+        stat = wav_path.stat()
+        with open(stamp_path, 'w') as f:
+            json.dump({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                       'sha1': fileHash(wav_path)}, f)
 
 
 def prepareForMFA(base_dir: str, wav_path: Optional[str] = None,
@@ -163,7 +359,8 @@ def prepareForMFA(base_dir: str, wav_path: Optional[str] = None,
                   wav_name_out: Optional[str] = None,
                   tg_name_out: Optional[str] = None,
                   input_dir_name: str = 'input_mfa',
-                  output_dir_name: str = 'output_mfa') -> None:
+                  output_dir_name: str = 'output_mfa',
+                  tg: Optional[TextGrid] = None) -> None:
     """Prepare files for Montreal Forced Aligner (MFA) by moving audio and
     transcript files to a newly created MFA input directory. An output
     directory is also created to store MFA output files.
@@ -185,6 +382,9 @@ def prepareForMFA(base_dir: str, wav_path: Optional[str] = None,
         tg_name_out (str, optional): Name for the transcript file in the MFA
             input directory. Gives the option to rename the transcript file.
             Defaults to None.
+        tg (TextGrid, optional): Transcript to write directly to the MFA
+            input directory instead of copying `tg_path`. `tg_name_out` must
+            be given with this. Defaults to None.
     """    
     base_path = Path(base_dir)
     
@@ -195,21 +395,16 @@ def prepareForMFA(base_dir: str, wav_path: Optional[str] = None,
     else:
         wav_path = Path(wav_path)
 
-    if tg_path is None:
+    if tg is not None:
+        if tg_name_out is None:
+            raise ValueError('tg_name_out must be given with tg.')
+    elif tg_path is None:
         tg_path = base_path / 'allblocks.TextGrid'
     else:
         tg_path = Path(tg_path)
 
-    # denoise audio file before moving to MFA input directory
-    fs, data = sio.wavfile.read(wav_path)
-    reduced_noise = nr.reduce_noise(y=data, sr=fs, stationary=False,
-                                    prop_decrease=0.9)
-
-    # save copy of original wav file
-    shutil.copy(wav_path, wav_path.parent / (wav_path.stem + '_original' +
-                                            wav_path.suffix))
-    # overwrite original wav file with denoised version
-    sio.wavfile.write(wav_path, fs, reduced_noise.astype(data.dtype))
+    # denoise audio before moving to MFA input directory
+    denoiseWav(wav_path)
 
     # MFA input and output folders to run from command line
     input_mfa_dir = base_path / input_dir_name
@@ -217,8 +412,19 @@ def prepareForMFA(base_dir: str, wav_path: Optional[str] = None,
     # move wav (audio) and TextGrid (transcript) to input directory
     wav_name = wav_path.name if wav_name_out is None else wav_name_out
     tg_name = tg_path.name if tg_name_out is None else tg_name_out
-    shutil.copy(wav_path, input_mfa_dir / wav_name)
-    shutil.copy(tg_path, input_mfa_dir / tg_name)
+    # keep the copy, and its modification time, when the audio is unchanged
+    # so the hashes cached by `runMFA` stay valid
+    wav_out = input_mfa_dir / wav_name
+    src_stat = wav_path.stat()
+    if not wav_out.is_file() or \
+            wav_out.stat().st_size != src_stat.st_size or \
+            wav_out.stat().st_mtime_ns != src_stat.st_mtime_ns:
+        wav_out.unlink(missing_ok=True)
+        shutil.copy2(wav_path, wav_out)
+    if tg is not None:
+        tg.write(input_mfa_dir / tg_name)
+    else:
+        shutil.copy(tg_path, input_mfa_dir / tg_name)
 
 
 def loadAnnotsToDict(annot_dir: str, tier_name: Union[str, list[str]] =
@@ -240,12 +446,11 @@ def loadAnnotsToDict(annot_dir: str, tier_name: Union[str, list[str]] =
             Each tier will have a separate subdictionary in the main returned
             dictionary. Within each tier subdictionary, the keys are the
             annotation labels (e.g. 'dog', 'hoot' for sentence rep stimuli).
-            The values are lists of lists, where each sublist contains the
-            start time, end time, and label for an annotation.
+            The values are tiers with the annotations of each stimulus.
 
             e.g. getting the first phoneme level annotation for the stimuli
             'dog' (which would be loaded from 'dog_phones.txt'):
-            annot_dict['phones']['dog'][0] = [0.0, 0.1, 'd']
+            annot_dict['phones']['dog'][0] = Interval(0.0, 0.1, 'd')
 
     """    
     annot_dir = Path(annot_dir)
@@ -265,15 +470,45 @@ def loadAnnotsToDict(annot_dir: str, tier_name: Union[str, list[str]] =
     for annot_file in to_load:
         tier = annot_file.split('_')[-1].split('.')[0]
         label = os.path.basename(annot_file).split('_')[0]
-        with open(annot_file, 'r') as f:
-            rows = []
-            for line in f:
-                rows.append(line.strip().split('\t'))
-            annot_dict[tier][label] = rows
+        annot_dict[tier][label] = readTier(annot_file)
     
     return annot_dict
 
 
+def mergeTier(tier: Tier, merge_thresh: float) -> Tier:
+    """Merge intervals that are close together in time.
+
+    Args:
+        tier (Tier): Intervals sorted by start time.
+        merge_thresh (float): Threshold in seconds for merging stimuli. The
+            threshold is the maximum time difference between two stimuli (end
+            of first stimulus to start of second stimulus) for them to be
+            considered part of the same stimulus.
+
+    Returns:
+        Tier: Merged intervals, with the labels of merged intervals joined by
+            spaces.
+    """
+    if len(tier) == 0:
+        return tier
+
+    # an interval starts a new group unless it starts close enough to the end
+    # of the previous interval
+    new_group = np.ones(len(tier), dtype=bool)
+    new_group[1:] = np.abs(tier.starts[1:] - tier.ends[:-1]) >= merge_thresh
+    first = np.flatnonzero(new_group)
+    last = np.append(first[1:] - 1, len(tier) - 1)
+
+    # only groups of several intervals need a new label
+    codes = tier.codes[first].copy()
+    labels = tier.vocab.labels
+    for g in np.flatnonzero(last > first):
+        codes[g] = tier.vocab.code(' '.join(
+            labels[c] for c in tier.codes[first[g]:last[g] + 1].tolist()))
+    return Tier(tier.starts[first], tier.ends[last], codes=codes,
+                vocab=tier.vocab)
+
+
 def mergeAnnots(annot_path: str, merge_thresh: float,
                  merge_path: Optional[str] = None,
                  merge_name: str = 'merged_stim_times') -> None:
@@ -296,27 +531,87 @@ def mergeAnnots(annot_path: str, merge_thresh: float,
     if merge_path is None:
         merge_path = Path(annot_path).parent / (merge_name + '.txt')
 
-    with open(annot_path, 'r') as f:
-        stim_times = f.readlines()
-    stim_times = [line.strip().split('\t') for line in stim_times]
+    writeTier(mergeTier(readTier(annot_path, Vocab([''])), merge_thresh),
+              merge_path)
 
-    # set starting stimulus as initial point
-    merged_stims = [stim_times[0]]
-    for i in range(1, len(stim_times)):
-        _, curr_e, _ = merged_stims[-1]  # current stim we are building
-        next_s, next_e, next_stim = stim_times[i]  # next stim to consider
 
-        if np.abs(float(next_s) - float(curr_e)) < merge_thresh:
-            # update end time and stimulus text if times are close enough
-            merged_stims[-1][1] = next_e
-            merged_stims[-1][2] += ' ' + next_stim
-        else:
-            # add new stimulus instance if times are too far apart
-            merged_stims.append(stim_times[i])
-    
-    with open(merge_path, 'w') as f:
-        for stim in merged_stims:
-            f.write('\t'.join(stim) + '\n')
+def loadTrialConds(trial_info_path: str, n_trials: int) -> dict[str, list]:
+    """Load the trial conditions used to annotate a patient's recording from
+    their trial info file. Conditions missing from the file are filled with
+    defaults.
+
+    Args:
+        trial_info_path (str): Path to the trial info file.
+        n_trials (int): Number of trials, used to fill missing conditions.
+
+    Returns:
+        dict[str, list]: Conditions for each trial with keys 'modality'
+            (default 'sound'), 'cue' (read from the 'cue' or 'condition'
+            column, default 'Listen') and 'go' (default 'Speak').
+    """
+    trial_info = sio.loadmat(trial_info_path)['trialInfo'][0, :]
+
+    # get the stimulus modality type (only relevant for picture naming task)
+    mod_cnds = matCol(trial_info, 'modality')
+    if mod_cnds is None:
+        mod_cnds = ['sound'] * n_trials
+
+    cue_col_names = ['cue', 'condition']
+    for col_name in cue_col_names:
+        cue_cnds = matCol(trial_info, col_name)
+        # if no cue column in trial info, temporarily assume all are Listen and
+        # try next column name
+        if cue_cnds is None:
+            cue_cnds = ['Listen'] * n_trials
+        else:  # move on if correct column is found
+            break
+
+    go_cnds = matCol(trial_info, 'go')
+    if go_cnds is None: # if no go column in trial info, assume all are Speak
+        go_cnds = ['Speak'] * n_trials
+
+    return {'modality': list(mod_cnds), 'cue': list(cue_cnds),
+            'go': list(go_cnds)}
+
+
+def placeStims(annot_dict: dict, onsets: Tier,
+               mod_cnds: list[str]) -> dict[str, Tier]:
+    """Places stim annotation templates at locations defined by the provided
+    cue onsets.
+
+    Args:
+        annot_dict (dict): Stim annotation templates. See format in
+            loadAnnots() function above.
+        onsets (Tier): Cue onsets, labelled with the stimulus file name (e.g.
+            '1_dog.wav').
+        mod_cnds (list[str]): Stimulus modality of each trial. Templates are
+            placed for 'sound' trials, other trials are labelled with the cue.
+
+    Returns:
+        dict[str, Tier]: Placed annotations for each tier.
+    """
+    stims = [stim.split('_')[1].split('.')[0] for stim in onsets.labels]
+    placed = {}
+    for tier in annot_dict.keys():
+        pieces = []
+        for i, stim in enumerate(stims):
+            cue_start = onsets.starts[i]
+            # use sound annotations for auditory stimuli
+            if mod_cnds[i] == 'sound':
+                try:
+                    curr_annots = annot_dict[tier][stim]
+                except KeyError:
+                    log.warning(f'No annotations found for {stim} in tier '
+                                f'{tier}.')
+                    continue
+                # add all tokens corresponding to the current stimulus
+                pieces.append(curr_annots.offset(cue_start))
+            # use cue annotations otherwise
+            else:
+                pieces.append(Tier([cue_start], [onsets.ends[i]], [stim],
+                                   vocab=onsets.vocab))
+        placed[tier] = Tier.concat(pieces, vocab=onsets.vocab)
+    return placed
 
 
 def annotateStims(annot_dict: dict, onset_path: str, trial_info_path: str,
@@ -344,46 +639,71 @@ def annotateStims(annot_dict: dict, onset_path: str, trial_info_path: str,
         out_dir = onset_path.parent / 'mfa'
 
     # get all of the cue onsets
-    with open(onset_path, 'r') as f:
-        onsets = f.readlines()
-        # separate onsets into start time, end time, and stimulus
-        onsets = [line.strip().split('\t') for line in onsets]
+    onsets = readTier(onset_path, Vocab(['']))
+    mod_cnds = loadTrialConds(trial_info_path, len(onsets))['modality']
+    placed = placeStims(annot_dict, onsets, mod_cnds)
 
-    # get the stimulus modality type (only relevant for picture naming task)
-    mod_cnds = loadMatCol(trial_info_path, 'trialInfo', 'modality')
-    if mod_cnds is None:
-        mod_cnds = ['sound'] * len(onsets)
-
-    # iterate through each annotation tier
-    tier_names = list(annot_dict.keys())
-    
-    for tier in tier_names:
+    for tier, intervals in placed.items():
         # create label file for current tier
         try:
             fname = out_dir / (out_form % tier)
         except TypeError:
             fname = out_dir / (out_form.split('.')[0] + tier + '.txt')
-        with open(fname, 'w') as f:
-            for i, (cue_start, cue_stop, stim) in enumerate(onsets):
-                # stim = stim.split('_')[1]
-                stim = stim.split('_')[1].split('.')[0]
-                # use sound annotations for auditory stimuli
-                if mod_cnds[i] == 'sound':
-                    try:
-                        curr_annots = annot_dict[tier][stim]
-                    except KeyError:
-                        print(f'No annotations found for {stim} in tier '
-                              f'{tier}.')
-                        continue
-                    # write all tokens corresponding to the current stimulus
-                    for (annot_start, annot_stop, token) in curr_annots:
-                        f.write(f'{float(cue_start) + float(annot_start)}\t'
-                                f'{float(cue_start) + float(annot_stop)}\t'
-                                f'{token}\n')
-                # use cue annotations otherwise
-                else:
-                    f.write(f'{cue_start}\t{cue_stop}\t{stim}\n')
-                    
+        writeTier(intervals, fname)
+
+
+def _windowEnds(times: Tier, recording_length: float,
+                max_dur: float) -> np.ndarray:
+    """Get the end of the response window after each interval: the start of
+    the next interval (or the end of the recording for the last interval),
+    at most `max_dur` seconds after the interval ends.
+    """
+    next_starts = np.append(times.starts[1:], recording_length)
+    return np.where(next_starts - times.ends > max_dur,
+                    times.ends + max_dur, next_starts)
+
+
+def respWindows(stim_times: Tier, trial_conds: dict[str, list],
+                recording_length: float, max_dur: float,
+                method: str = 'resp') -> Tier:
+    """Create response windows for a patient's recording based on the
+    provided stimulus timing information and trial conditions.
+
+    Args:
+        stim_times (Tier): Merged stimulus times, one per trial.
+        trial_conds (dict[str, list]): Trial conditions, see
+            `loadTrialConds`.
+        recording_length (float): Length of the recording in seconds.
+        max_dur (float): Maximum duration of a response window in seconds.
+        method (str, optional): Method to use for response windows. 'resp' will
+            create response windows based on the stimulus content. 'yes' or
+            'no' will create response windows assuming the patient is only
+            responding with 'yes' or 'no' (for yes/no tasks). Defaults to
+            'resp'.
+
+    Returns:
+        Tier: Response windows labelled with the expected response.
+    """
+    n = len(stim_times)
+    cue_cnds = np.asarray(trial_conds['cue'][:n], dtype=object)
+    go_cnds = np.asarray(trial_conds['go'][:n], dtype=object)
+
+    # check that response is expected by task conditions
+    if method == 'resp':
+        keep = (go_cnds == 'Speak') & np.isin(cue_cnds, ['Repeat', 'Listen',
+                                                         'ListenSpeak'])
+        codes = stim_times.codes[keep]
+    elif method in ['yes', 'no']:
+        keep = (go_cnds == 'Speak') & (cue_cnds == 'Yes/No')
+        codes = np.full(np.count_nonzero(keep),
+                        stim_times.vocab.code(method), dtype=np.int32)
+    else:
+        raise ValueError(f'Unknown response window method "{method}".')
+
+    stim_s2 = _windowEnds(stim_times, recording_length, max_dur)
+    return Tier(stim_times.ends[keep], stim_s2[keep], codes=codes,
+                vocab=stim_times.vocab)
+
 
 def annotateResp(time_path: str, trial_info_path: str, recording_length: float,
                  output_dir: str, max_dur: float, method: str = 'resp',
@@ -408,52 +728,33 @@ def annotateResp(time_path: str, trial_info_path: str, recording_length: float,
     """
 
     # covnert stim times to list of format [start, end, stim]
-    stim_times = open(time_path, 'r').readlines()
-    stim_times = [line.strip().split('\t') for line in stim_times]
+    stim_times = readTier(time_path, Vocab(['']))
+    trial_conds = loadTrialConds(trial_info_path, len(stim_times))
 
-    cue_col_names = ['cue', 'condition']
-    for col_name in cue_col_names:
-        cue_cnds = loadMatCol(trial_info_path, 'trialInfo', col_name)
-        # if no cue column in trial info, temporarily assume all are Listen and
-        # try next column name
-        if cue_cnds is None:
-            cue_cnds = ['Listen'] * len(stim_times)
-        else:  # move on if correct column is found
-            break
+    windows = respWindows(stim_times, trial_conds, recording_length, max_dur,
+                          method=method)
+    writeTier(windows, Path(output_dir) / output_fname)
 
-    go_cnds = loadMatCol(trial_info_path, 'trialInfo', 'go')
-    if go_cnds is None: # if no go column in trial info, assume all are Speak
-        go_cnds = ['Speak'] * len(stim_times)
-
-    out_path = output_dir / output_fname
-    with open(out_path, 'w') as f:
-        for i in range(len(stim_times)):
-            # check that response is expected by task conditions
-            if method == 'resp':
-                if go_cnds[i] != 'Speak' or cue_cnds[i] not in ['Repeat',
-                                                                'Listen',
-                                                                'ListenSpeak']:
-                    continue
-                _, stim_e1, stim = stim_times[i]
-            elif method in ['yes', 'no']:
-                if go_cnds[i] != 'Speak' or cue_cnds[i] != 'Yes/No':
-                    continue
-                _, stim_e1, _ = stim_times[i]
-                stim = method
 
-            if i == len(stim_times) - 1:
-                # last response window is from the end of the last stimulus to
-                # the end of the recording
-                stim_s2 = recording_length  # in seconds
-            else:
-                stim_s2, _, _ = stim_times[i + 1]
+def retrocueWindows(cue_times: Tier, recording_length: float,
+                    max_dur: float) -> Tier:
+    """Create retrocue task response windows for a patient's recording based
+    on the provided stimulus timing information.
+
+    Args:
+        cue_times (Tier): Cue times. Cues without a label are not responded
+            to, but still end the previous response window.
+        recording_length (float): Length of the recording in seconds.
+        max_dur (float): Maximum duration of a response window in seconds.
 
-            # write the response window
-            stim_e1 = float(stim_e1)
-            stim_s2 = float(stim_s2)
-            if stim_s2 - stim_e1 > max_dur:
-                stim_s2 = stim_e1 + max_dur
-            f.write(f'{stim_e1}\t{stim_s2}\t{stim}\n')
+    Returns:
+        Tier: Response windows labelled with the expected response.
+    """
+    # ignore lines with no label
+    keep = cue_times.codes != cue_times.vocab.code('')
+    stim_s2 = _windowEnds(cue_times, recording_length, max_dur)
+    return Tier(cue_times.ends[keep], stim_s2[keep],
+                codes=cue_times.codes[keep], vocab=cue_times.vocab)
 
 
 def annotateRetrocue(time_path: str, recording_length: float,
@@ -470,42 +771,159 @@ def annotateRetrocue(time_path: str, recording_length: float,
         output_fname (str, optional): Name of the output file containing the
             response windows. Defaults to 'annotated_resp_windows.txt'.
     """
-    # load stimulus timing information and trial info information
-    # time_path = base_dir / time_fname
-    # trial_info_path = base_dir / trials_fname
+    windows = retrocueWindows(readTier(time_path, Vocab([''])),
+                              recording_length, max_dur)
+    writeTier(windows, Path(output_dir) / output_fname)
 
-    # covnert stim times to list of format [start, end, stim]
-    stim_times = open(time_path, 'r').readlines()
-    stim_times = [line.strip().split('\t') for line in stim_times]
-
-    out_path = output_dir / output_fname
-    with open(out_path, 'w') as f:
-        for i in range(len(stim_times)):
-            # ignore lines with no label
-            if len(stim_times[i]) < 3:
-                continue
-
-            _, stim_e1, stim = stim_times[i]
-
-            if i == len(stim_times) - 1:
-                # last response window is from the end of the last stimulus to
-                # the end of the recording
-                stim_s2 = recording_length  # in seconds
-            else:
-                stim_s2 = stim_times[i + 1][0]
 
-            # write the response window
-            stim_e1 = float(stim_e1)
-            stim_s2 = float(stim_s2)
-            if stim_s2 - stim_e1 > max_dur:
-                stim_s2 = stim_e1 + max_dur
-            f.write(f'{stim_e1}\t{stim_s2}\t{stim}\n')
+def fileHash(file_path: str, chunk_size: int = 2 ** 20) -> str:
+    """Compute the SHA-1 hash of a file's contents, reading it in chunks.
+
+    Args:
+        file_path (str): Path to the file.
+        chunk_size (int, optional): Number of bytes read at a time.
+            Defaults to 1 MB.
+
+    Returns:
+        str: Hex digest of the file contents.
+    """
+    h = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cachedFileHash(file_path: str, cache: dict) -> str:
+    """Get the SHA-1 hash of a file's contents, only reading the file if its
+    size or modification time changed since it was last hashed.
+
+    Args:
+        file_path (str): Path to the file.
+        cache (dict): Hash cache mapping file names to [size, mtime_ns,
+            digest]. Updated in place.
+
+    Returns:
+        str: Hex digest of the file contents.
+    """
+    file_path = Path(file_path)
+    stat = file_path.stat()
+    entry = cache.get(file_path.name)
+    if entry is not None and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+        return entry[2]
+    digest = fileHash(file_path)
+    cache[file_path.name] = [stat.st_size, stat.st_mtime_ns, digest]
+    return digest
+
+
+def findAcousticModel(model_name: str) -> Optional[Path]:
+    """Find the file (or directory) of an MFA acoustic model.
+
+    Args:
+        model_name (str): Name of the model (e.g. 'english_us_arpa') or a
+            path to a model.
+
+    Returns:
+        Optional[Path]: Path to the model, or None if it could not be found
+            locally.
+    """
+    if Path(model_name).exists():
+        return Path(model_name)
+    model_dir = lexicon.mfaRootDir() / 'pretrained_models' / 'acoustic'
+    for ext in ['.zip', '']:
+        model_path = model_dir / (model_name + ext)
+        if model_path.exists():
+            return model_path
+    return None
+
+
+def mfaInputHash(input_mfa_dir: str, mfa_dict: str, mfa_model: str,
+                 hash_cache: Optional[dict] = None,
+                 single_speaker: bool = False,
+                 extra_args: Optional[list[str]] = None) -> str:
+    """Compute a hash identifying the inputs of an MFA alignment run.
+
+    Args:
+        input_mfa_dir (str): Path to the directory containing audio and
+            transcript files for MFA.
+        mfa_dict (str): Name of or path to the dictionary used for MFA.
+        mfa_model (str): Name of or path to the acoustic model used for MFA.
+            The model's size and modification time are included if it can be
+            found locally, so a model updated in place changes the hash.
+        hash_cache (Optional[dict], optional): Cache of input file hashes, see
+            `cachedFileHash`. Defaults to None (every file is read).
+        single_speaker (bool, optional): Whether MFA is run in single speaker
+            mode. Defaults to False.
+        extra_args (Optional[list[str]], optional): Additional options for
+            `mfa align`. Defaults to None.
+
+    Returns:
+        str: Hex digest that changes whenever an input file, the dictionary,
+            the acoustic model or the MFA options change.
+    """
+    if hash_cache is None:
+        hash_cache = {}
+    h = hashlib.sha1()
+    in_files = [p for p in sorted(Path(input_mfa_dir).iterdir())
+                if p.is_file()]
+    for in_file in in_files:
+        h.update(f'{in_file.name}:{cachedFileHash(in_file, hash_cache)}'
+                 .encode())
+    # forget files that are no longer inputs
+    for name in set(hash_cache) - {p.name for p in in_files}:
+        del hash_cache[name]
+    if Path(mfa_dict).is_file():
+        h.update(f'dict:{fileHash(mfa_dict)}'.encode())
+    else:
+        h.update(f'dict:{mfa_dict}'.encode())
+    h.update(f'model:{mfa_model}'.encode())
+    model_path = findAcousticModel(mfa_model)
+    if model_path is not None:
+        model_files = ([model_path] if model_path.is_file() else
+                       sorted(p for p in model_path.rglob('*') if p.is_file()))
+        for model_file in model_files:
+            stat = model_file.stat()
+            h.update(f'{model_file.name}:{stat.st_size}:{stat.st_mtime_ns}'
+                     .encode())
+    h.update(f'single_speaker:{bool(single_speaker)}'.encode())
+    h.update(json.dumps([str(arg) for arg in extra_args or []]).encode())
+    return h.hexdigest()
+
+
+def evictMFAWorkDirs(work_root: str, max_age_days: float) -> list[Path]:
+    """Delete MFA temporary directories that have not been used recently.
+
+    Args:
+        work_root (str): Root directory containing MFA temporary directories
+            in the format '{work_root}/{patient}/{run}'.
+        max_age_days (float): Directories last used longer ago than this are
+            deleted.
+
+    Returns:
+        list[Path]: Deleted directories.
+    """
+    work_root = Path(work_root)
+    if not work_root.is_dir():
+        return []
+    cutoff = time.time() - max_age_days * 24 * 60 * 60
+    evicted = []
+    for work_dir in work_root.glob('*/*'):
+        if not work_dir.is_dir():
+            continue
+        stamp = work_dir / MFA_STAMP_NAME
+        last_used = (stamp if stamp.exists() else work_dir).stat().st_mtime
+        if last_used < cutoff:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            evicted.append(work_dir)
+    return evicted
 
 
 def runMFA(input_mfa_dir: str, output_mfa_dir: str,
            mfa_dict: str = 'english_us_arpa',
            mfa_model: str = 'english_us_arpa',
-           single_speaker=False) -> bool:
+           single_speaker=False, temp_dir: Optional[str] = None,
+           cleanup: str = 'keep', log_path: Optional[str] = None,
+           extra_args: Optional[list[str]] = None) -> bool:
     """Run Montreal Forced Aligner (MFA) on the provided input directory.
 
     Args:
@@ -519,16 +937,68 @@ def runMFA(input_mfa_dir: str, output_mfa_dir: str,
             Defaults to 'english_us_arpa'.
         single_speaker (bool, optional): Flag to indicate if the audio is from
             a single speaker. Defaults to True.
+        temp_dir (Optional[str], optional): Temporary directory for MFA to
+            store its database, features and compiled lexicon in. The
+            directory is kept between runs and only cleaned when the inputs
+            have changed since it was last used, so repeated runs reuse MFA's
+            setup work. If None, MFA's default temporary directory is used and
+            cleaned on every run. Defaults to None.
+        cleanup (str, optional): What to do with `temp_dir` after MFA runs:
+            'keep' keeps it for future runs, 'clean_on_success' deletes it if
+            the alignment succeeded. Defaults to 'keep'.
+        log_path (Optional[str], optional): File to write MFA's console
+            output to. If None, MFA prints to the console. Defaults to None.
+        extra_args (Optional[list[str]], optional): Additional options for
+            `mfa align`, e.g. ['--beam', '100']. Defaults to None.
     """    
+    clean = True
+    if temp_dir is not None:
+        temp_dir = Path(temp_dir)
+        os.makedirs(temp_dir, exist_ok=True)
+        stamp = temp_dir / MFA_STAMP_NAME
+        cache_path = temp_dir / MFA_HASH_CACHE_NAME
+        hash_cache = {}
+        if cache_path.is_file():
+            try:
+                with open(cache_path, 'r') as f:
+                    hash_cache = json.load(f)
+            except ValueError:
+                pass  # rebuilt below
+        input_hash = mfaInputHash(input_mfa_dir, mfa_dict, mfa_model,
+                                  hash_cache, single_speaker, extra_args)
+        with open(cache_path, 'w') as f:
+            json.dump(hash_cache, f)
+        clean = not (stamp.exists() and stamp.read_text() == input_hash)
+        # remove the stamp so an interrupted run is not treated as cached
+        if stamp.exists():
+            stamp.unlink()
+
     try:
-        mfa_cmd = ['mfa', 'align', '--clean', input_mfa_dir, mfa_dict,
-                   mfa_model, output_mfa_dir]
+        mfa_cmd = ['mfa', 'align', input_mfa_dir, mfa_dict, mfa_model,
+                   output_mfa_dir]
+        if clean:
+            mfa_cmd.insert(2, '--clean')
+        if temp_dir is not None:
+            mfa_cmd[2:2] = ['--temporary_directory', temp_dir]
         if single_speaker:
-            mfa_cmd.insert(3, '--single_speaker')
-        subprocess.run(mfa_cmd, check=True)
+            mfa_cmd.insert(2, '--single_speaker')
+        if extra_args:
+            mfa_cmd[2:2] = [str(arg) for arg in extra_args]
+        if log_path is None:
+            subprocess.run(mfa_cmd, check=True)
+        else:
+            with open(log_path, 'w') as f:
+                subprocess.run(mfa_cmd, check=True, stdout=f,
+                               stderr=subprocess.STDOUT)
     except subprocess.CalledProcessError as e:
-        print(f"An error occurred while running MFA: {e}")
+        log.error(f"An error occurred while running MFA: {e}")
         return False
+
+    if temp_dir is not None:
+        if cleanup == 'clean_on_success':
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        else:
+            stamp.write_text(input_hash)
     return True
 
 
@@ -544,8 +1014,33 @@ def loadMatCol(mat_path: str, key: str, col: str) -> np.ndarray:
         np.ndarray: Column of data from the mat file.
     """    
     data = sio.loadmat(mat_path)
-    data_var = data[key][0,:]
+    return matCol(data[key][0,:], col)
+
+
+def countTrials(trial_info_path: str) -> int:
+    """Count the trials in a trial info file.
 
+    Args:
+        trial_info_path (str): Path to the trial info file.
+
+    Returns:
+        int: Number of rows of the 'trialInfo' variable.
+    """
+    return len(sio.loadmat(trial_info_path)['trialInfo'][0, :])
+
+
+def matCol(data_var: np.ndarray, col: str) -> np.ndarray:
+    """Extract a column from a variable already loaded from a .mat file, so
+    several columns can be read from a single load.
+
+    Args:
+        data_var (np.ndarray): Rows of the variable, e.g.
+            `sio.loadmat(mat_path)['trialInfo'][0, :]`.
+        col (str): Name of column to extract from the mat data.
+
+    Returns:
+        np.ndarray: Column of data, or None if the column does not exist.
+    """
     # check that key exists in the mat data
     col_names = (data_var.dtype.names if data_var.dtype.names is not None else
                  data_var[0].dtype.names)
@@ -0,0 +1,754 @@
+import os
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+from omegaconf import DictConfig
+
+from utils import mfa_utils, lexicon, realign, export, sweep
+from utils.tier import Tier, Vocab
+from utils.events import EventLog
+
+# stages logged for each response annotation type
+RESP_STAGES = ['windows', 'prepare', 'align', 'extract']
+
+# response annotation types and export units the pipeline can produce
+RESP_TYPES = ['resp', 'yes', 'no']
+EXPORT_UNITS = ['words', 'phones', 'trials']
+
+
+@dataclass
+class PatientResult:
+    """In-memory outputs of running the pipeline on a patient.
+
+    Attributes:
+        patient (str): Patient ID.
+        stims (dict[str, Tier]): Placed stimulus annotations for each tier
+            (e.g. 'words', 'phones').
+        merged_stims (Tier): Stimulus words merged into one interval per
+            stimulus.
+        windows (dict[str, Tier]): Response windows given to MFA for each run
+            type ('resp', 'yes', 'no').
+        alignments (dict[str, dict[str, Tier]]): MFA alignments for each run
+            type and tier.
+        errors (list[str]): Errors that stopped part of the pipeline.
+        vocab (Vocab): Label vocabulary of the patient's tiers, so labels
+            are freed with the result instead of accumulating in the shared
+            vocabulary.
+    """
+    patient: str
+    stims: dict[str, Tier] = field(default_factory=dict)
+    merged_stims: Tier = field(default_factory=Tier)
+    windows: dict[str, Tier] = field(default_factory=dict)
+    alignments: dict[str, dict[str, Tier]] = field(default_factory=dict)
+    errors: list[str] = field(default_factory=list)
+    vocab: Vocab = field(default_factory=lambda: Vocab(['']))
+
+
+def run_types(cfg: DictConfig) -> list[str]:
+    """List the response annotation types run for the configured task.
+
+    Args:
+        cfg (DictConfig): Pipeline configuration.
+
+    Returns:
+        list[str]: 'resp', plus 'yes' and 'no' for yes/no tasks.
+    """
+    run_type = ['resp']
+    if cfg.task.get('mark_yes_no', False):
+        run_type.append('yes')
+        run_type.append('no')
+    return run_type
+
+
+def resp_names(resp_type: str) -> dict[str, str]:
+    """Get the file and directory names used for a response annotation type.
+
+    Args:
+        resp_type (str): Response annotation type ('resp', 'yes' or 'no').
+
+    Returns:
+        dict[str, str]: Names with keys 'wav', 'tg', 'input_dir',
+            'output_dir' and 'label'.
+    """
+    suffix = f'_{resp_type}' if resp_type in ['yes', 'no'] else ''
+    return {'wav': f'allblocks{suffix}.wav',
+            'tg': f'allblocks{suffix}.TextGrid',
+            'input_dir': f'input_mfa{suffix}',
+            'output_dir': f'output_mfa{suffix}',
+            'label': f'mfa_{resp_type}'}
+
+
+def windows_name(cfg: DictConfig, resp_type: str) -> str:
+    """Get the name of the response windows file for a response annotation
+    type.
+
+    Args:
+        cfg (DictConfig): Pipeline configuration.
+        resp_type (str): Response annotation type ('resp', 'yes' or 'no').
+
+    Returns:
+        str: `cfg.task.annot_fname` if set, otherwise
+            'annotated_{resp_type}_windows.txt'.
+    """
+    return (cfg.task.get('annot_fname') or
+            f'annotated_{resp_type}_windows.txt')
+
+
+def epochs_name(resp_type: str, unit: str, fmt: str) -> str:
+    """Get the name of the epochs exported for a response annotation type.
+
+    Args:
+        resp_type (str): Response annotation type ('resp', 'yes' or 'no').
+        unit (str): Export unit ('words', 'phones' or 'trials').
+        fmt (str): Export format ('clips' or 'stack').
+
+    Returns:
+        str: 'epochs_{resp_type}_{unit}' directory for clips, or
+            'epochs_{resp_type}_{unit}.npy' for stacked arrays (saved with
+            an index 'epochs_{resp_type}_{unit}_index.npz').
+    """
+    name = f'epochs_{resp_type}_{unit}'
+    return f'{name}.npy' if fmt == 'stack' else name
+
+
+def mfa_work_dir(cfg: DictConfig, pt_path: Path, run: str) \
+        -> Optional[Path]:
+    """Get the MFA temporary directory for a run of a patient.
+
+    MFA names its directory in its default temporary root after the corpus
+    directory ('input_mfa'), so patients aligned at the same time would clean
+    each other's work there. When several patients run at once without a
+    `mfa_work.root`, each patient gets its own directory instead.
+
+    Args:
+        cfg (DictConfig): Pipeline configuration.
+        pt_path (Path): Path to the patient directory.
+        run (str): Name of the MFA run (e.g. 'resp' or 'realign_resp').
+
+    Returns:
+        Optional[Path]: '{mfa_work.root}/{patient}/{run}' if `mfa_work.root`
+            is set, 'mfa/.mfa_tmp/{run}' in the patient directory if
+            `scheduler.n_workers` is more than 1, otherwise None (MFA's
+            default temporary directory).
+    """
+    if cfg.mfa_work.root:
+        return Path(cfg.mfa_work.root) / pt_path.name / run
+    if cfg.scheduler.n_workers > 1:
+        return pt_path / 'mfa' / '.mfa_tmp' / run
+    return None
+
+
+def planned_stages(cfg: DictConfig, run_type: list[str]) -> list[str]:
+    """List the stages run for each patient, as reported in the event log.
+
+    Args:
+        cfg (DictConfig): Pipeline configuration.
+        run_type (list[str]): Response annotation types to run.
+
+    Returns:
+        list[str]: Stage names, suffixed with ':{run_type}' for response
+            stages.
+    """
+    stages = []
+    if cfg.task.get('run_stim', True):
+        stages.append('stims')
+        if cfg.only_stims:
+            return stages
+    for t in run_type:
+        stages += [f'{stage}:{t}' for stage in RESP_STAGES]
+    return stages
+
+
+def load_stim_templates(cfg: DictConfig) -> dict:
+    """Load the stimulus annotation templates for the configured task.
+
+    Args:
+        cfg (DictConfig): Pipeline configuration.
+
+    Returns:
+        dict: Stim annotation templates, see `mfa_utils.loadAnnotsToDict`.
+    """
+    HOME = os.path.expanduser("~")
+    annot_dir = Path(os.path.join(HOME, cfg.task.stim_dir))
+    return mfa_utils.loadAnnotsToDict(annot_dir)
+
+
+def check_lexicon(lex_index: dict, windows: Tier, dict_path: Path,
+                  mfa_dict: str, oov_action: str = 'warn',
+                  subset_dict: bool = False,
+                  events: Optional[EventLog] = None) -> str:
+    """Check response windows for out-of-vocabulary words and optionally
+    write a dictionary containing only the words they need.
+
+    Args:
+        lex_index (dict): Lexicon index, see `lexicon.loadLexicon`.
+        windows (Tier): Response windows given to MFA.
+        dict_path (Path): Path to save the subset dictionary to.
+        mfa_dict (str): Dictionary MFA would otherwise use.
+        oov_action (str, optional): 'error' raises a ValueError for
+            out-of-vocabulary words, 'warn' prints them and 'ignore' skips the
+            check. Defaults to 'warn'.
+        subset_dict (bool, optional): Whether to write a subset dictionary.
+            Defaults to False.
+        events (Optional[EventLog], optional): Log to report warnings to.
+            Defaults to None (printed).
+
+    Returns:
+        str: Dictionary for MFA to use.
+    """
+    if events is None:
+        events = EventLog(None)
+    # check that every transcript word has a pronunciation before running MFA
+    words = lexicon.labelWords(windows.labels)
+    oov = lexicon.findOOV(words, lex_index)
+    if oov and oov_action != 'ignore':
+        oov_msg = f'Out-of-vocabulary words in response windows: {oov}'
+        if oov_action == 'error':
+            raise ValueError(oov_msg)
+        events.message(f'WARNING: {oov_msg}', level='warning')
+
+    # only give MFA the pronunciations this run needs
+    if subset_dict:
+        return lexicon.writeSubsetDict(words, lex_index, dict_path).as_posix()
+    return mfa_dict
+
+
+def process_patient(pt_path: str, cfg: DictConfig,
+                    annot_dict: Optional[dict] = None,
+                    lex_index: Optional[dict] = None,
+                    events: Optional[EventLog] = None,
+                    run_type: Optional[list[str]] = None,
+                    write_intermediates: Optional[bool] = None) \
+        -> PatientResult:
+    """Run stimulus and response annotation for a single patient.
+
+    Stages pass their intervals to each other in memory. Only the final
+    outputs are written to the patient's 'mfa' directory (stimulus and
+    response annotations, response windows, and the MFA input files), unless
+    `write_intermediates` is set, in which case the merged stimulus times and
+    the response TextGrids are written too.
+
+    Args:
+        pt_path (str): Path to the patient directory.
+        cfg (DictConfig): Pipeline configuration.
+        annot_dict (Optional[dict], optional): Stim annotation templates, see
+            `mfa_utils.loadAnnotsToDict`. Loaded from `cfg.task.stim_dir` if
+            None and the task annotates stimuli. Defaults to None.
+        lex_index (Optional[dict], optional): Lexicon index used to check
+            transcripts before alignment, see `lexicon.loadLexicon`. Defaults
+            to None (no check).
+        events (Optional[EventLog], optional): Log for stage events and
+            messages. Defaults to None (messages are printed).
+        run_type (Optional[list[str]], optional): Response annotation types to
+            run. Defaults to None (all types for the task, see `run_types`).
+        write_intermediates (Optional[bool], optional): Whether to also write
+            intermediate files. Defaults to None (use
+            `cfg.write_intermediates`).
+
+    Returns:
+        PatientResult: In-memory outputs of each stage. In debug mode errors
+            are raised, otherwise they are returned in `errors`.
+    """
+    pt_path = Path(pt_path)
+    pt = pt_path.name
+    mfa_path = pt_path / 'mfa'
+    if run_type is None:
+        run_type = run_types(cfg)
+    if write_intermediates is None:
+        write_intermediates = cfg.get('write_intermediates', False)
+    if events is None:
+        events = EventLog(None)
+    debug = cfg.debug_mode
+    run_stim = cfg.task.get('run_stim', True)
+    mfa_utils.makeMFADirs(pt_path, run_type)
+    result = PatientResult(patient=pt)
+
+    trial_conds = None
+    if run_stim:
+        events.message('##### Annotating stimuli for patient %s #####' % pt)
+        if annot_dict is None:
+            annot_dict = load_stim_templates(cfg)
+        try:
+            with events.stage('stims'):
+                # annotate stimuli for the current patient
+                onsets = mfa_utils.readTier(pt_path / 'cue_events.txt',
+                                            result.vocab)
+                trial_conds = mfa_utils.loadTrialConds(
+                    pt_path / 'trialInfo.mat', len(onsets))
+                result.stims = mfa_utils.placeStims(annot_dict, onsets,
+                                                    trial_conds['modality'])
+                for tier, intervals in result.stims.items():
+                    mfa_utils.writeTier(intervals,
+                                        mfa_path / f'mfa_stim_{tier}.txt')
+
+                # merge stimuli annotations together so that separate
+                # intrastimulus words are represented as the same stimulus
+                result.merged_stims = mfa_utils.mergeTier(
+                    result.stims['words'], cfg.merge_thresh)
+                if write_intermediates:
+                    mfa_utils.writeTier(result.merged_stims,
+                                        mfa_path / 'merged_stim_times.txt')
+        except Exception as e:
+            if debug:
+                raise
+            err_msg = f'Error annotating stimuli for patient {pt}: {e}'
+            events.message(err_msg, level='error')
+            result.errors.append(err_msg)
+            return result
+
+        if cfg.only_stims:
+            return result
+
+    for t in run_type:
+        t_msg = 'Response' if t == 'resp' else 'Yes & No'
+        events.message(f'##### Preparing patient {pt} for MFA: {t_msg} '
+                       'Annotation #####')
+        # isolated MFA temporary directory for each patient and run
+        work_dir = mfa_work_dir(cfg, pt_path, t)
+        try:
+            result.windows[t], result.alignments[t] = run_resp(
+                result, pt_path, cfg, t, trial_conds, lex_index, work_dir,
+                events.bind(run_type=t), write_intermediates)
+        except Exception as e:
+            if debug:
+                raise
+            events.message(str(e), level='error')
+            result.errors.append(str(e))
+    return result
+
+
+def run_resp(result: PatientResult, pt_path: Path, cfg: DictConfig,
+             resp_type: str, trial_conds: Optional[dict],
+             lex_index: Optional[dict], work_dir: Optional[Path],
+             events: EventLog, write_intermediates: bool = False) \
+        -> tuple[Tier, dict[str, Tier]]:
+    """Create response windows for a patient and align them with MFA.
+
+    Args:
+        result (PatientResult): Outputs of the earlier stages.
+        pt_path (Path): Path to the patient directory.
+        cfg (DictConfig): Pipeline configuration.
+        resp_type (str): Response annotation type ('resp', 'yes' or 'no').
+        trial_conds (Optional[dict]): Trial conditions, loaded from the trial
+            info file if None.
+        lex_index (Optional[dict]): Lexicon index.
+        work_dir (Optional[Path]): MFA temporary directory.
+        events (EventLog): Log for stage events.
+        write_intermediates (bool, optional): Whether to also write the
+            response TextGrid to the 'mfa' directory. Defaults to False.
+
+    Returns:
+        tuple[Tier, dict[str, Tier]]: Response windows, and the MFA
+            alignments for each tier.
+    """
+    pt = pt_path.name
+    mfa_path = pt_path / 'mfa'
+    names = resp_names(resp_type)
+    annot_name = windows_name(cfg, resp_type)
+    mfa_dict = cfg.task.mfa.dict
+
+    try:
+        with events.stage('windows'):
+            # create response windows
+            recording_dur = mfa_utils.calculateAudDur(
+                                pt_path / 'allblocks.wav')
+            if cfg.task.name == 'retro_cue':
+                # create response windows for retro cue task
+                windows = mfa_utils.retrocueWindows(
+                    mfa_utils.readTier(pt_path / 'cue_events_mfa.txt',
+                                       result.vocab),
+                    recording_dur, cfg.task.max_dur)
+            else:
+                merged_stims = result.merged_stims or \
+                    load_merged_stims(mfa_path, cfg.merge_thresh,
+                                      result.vocab)
+                if trial_conds is None:
+                    trial_conds = mfa_utils.loadTrialConds(
+                        pt_path / 'trialInfo.mat', len(merged_stims))
+                windows = mfa_utils.respWindows(merged_stims, trial_conds,
+                                                recording_dur,
+                                                cfg.task.max_dur,
+                                                method=resp_type)
+            mfa_utils.writeTier(windows, mfa_path / annot_name)
+
+            if lex_index is not None:
+                mfa_dict = check_lexicon(
+                    lex_index, windows,
+                    mfa_path / f'lexicon_{resp_type}.dict', mfa_dict,
+                    cfg.lexicon.oov_action, cfg.lexicon.subset_dict, events)
+
+            tg = mfa_utils.tierToTextGrid(windows)
+            if write_intermediates:
+                tg.write(mfa_path / names['tg'])
+
+        with events.stage('prepare') as ev:
+            mfa_utils.prepareForMFA(mfa_path,
+                                    wav_path=pt_path / 'allblocks.wav',
+                                    wav_name_out=names['wav'],
+                                    tg_name_out=names['tg'],
+                                    input_dir_name=names['input_dir'],
+                                    output_dir_name=names['output_dir'],
+                                    tg=tg)
+            ev['bytes'] = (pt_path / 'allblocks.wav').stat().st_size
+    except Exception as e:
+        raise RuntimeError(f'Error preparing patient {pt} for MFA: {e}') \
+            from e
+
+    # run mfa
+    with events.stage('align') as ev:
+        mfa_ran = mfa_utils.runMFA(
+            mfa_path / names['input_dir'], mfa_path / names['output_dir'],
+            mfa_dict=mfa_dict, mfa_model=cfg.task.mfa.acoustic,
+            temp_dir=work_dir, cleanup=cfg.mfa_work.cleanup,
+            log_path=(mfa_path / f'{names["output_dir"]}.log'
+                      if cfg.events.quiet_mfa else None))
+        if not mfa_ran:
+            ev['error'] = 'MFA alignment failed'
+    if not mfa_ran:
+        raise RuntimeError(f'Error running MFA on patient {pt}')
+
+    try:
+        with events.stage('extract'):
+            # convert mfa output to txt files
+            alignments = mfa_utils.textGridToTiers(
+                mfa_path / names['output_dir'] / names['tg'],
+                vocab=result.vocab)
+            for tier, intervals in alignments.items():
+                mfa_utils.writeTier(
+                    intervals, mfa_path / f'{names["label"]}_{tier}.txt')
+    except Exception as e:
+        raise RuntimeError(f'Error extracting annotations for patient {pt}: '
+                           f'{e}') from e
+    return windows, alignments
+
+
+def load_merged_stims(mfa_path: Path, merge_thresh: float,
+                      vocab: Optional[Vocab] = None) -> Tier:
+    """Merge the stimulus words saved by a previous run, for tasks that do
+    not annotate stimuli on every run. The words are always merged again
+    with the current threshold, rather than reusing 'merged_stim_times.txt',
+    which may have been saved with a different `merge_thresh`.
+
+    Args:
+        mfa_path (Path): Patient's 'mfa' directory.
+        merge_thresh (float): Threshold in seconds for merging stimuli.
+        vocab (Optional[Vocab], optional): Label vocabulary. Defaults to the
+            shared module vocabulary.
+
+    Returns:
+        Tier: Merged stimulus times.
+    """
+    return mfa_utils.mergeTier(
+        mfa_utils.readTier(mfa_path / 'mfa_stim_words.txt', vocab),
+        merge_thresh)
+
+
+def realign_patient(pt_path: str, cfg: DictConfig,
+                    run_type: Optional[list[str]] = None) -> dict[str, dict]:
+    """Re-align only the suspect response windows of an already aligned
+    patient, and merge the fixed alignments back into the patient's
+    'mfa_{run_type}_words.txt' and 'mfa_{run_type}_phones.txt' files. The
+    bounds of re-aligned windows are updated in the response windows file.
+    See `realign.realignSuspects`.
+
+    Args:
+        pt_path (str): Path to the patient directory.
+        cfg (DictConfig): Pipeline configuration.
+        run_type (Optional[list[str]], optional): Response annotation types to
+            re-align. Defaults to None (all types for the task).
+
+    Returns:
+        dict[str, dict]: Re-alignment report for each response annotation
+            type that has alignments.
+    """
+    pt_path = Path(pt_path)
+    pt = pt_path.name
+    mfa_path = pt_path / 'mfa'
+    if run_type is None:
+        run_type = run_types(cfg)
+    rcfg = cfg.realign
+
+    reports = {}
+    for t in run_type:
+        names = resp_names(t)
+        paths = {'windows': mfa_path / windows_name(cfg, t),
+                 'words': mfa_path / f'{names["label"]}_words.txt',
+                 'phones': mfa_path / f'{names["label"]}_phones.txt'}
+        if not all(p.is_file() for p in paths.values()):
+            print(f'##### No {t} alignments to re-align for patient {pt} '
+                  '#####')
+            continue
+
+        # the subset dictionary written for the full run covers every window
+        mfa_dict = mfa_path / f'lexicon_{t}.dict'
+        mfa_dict = (mfa_dict.as_posix() if mfa_dict.is_file()
+                    else cfg.task.mfa.dict)
+        work_dir = mfa_work_dir(cfg, pt_path, f'realign_{t}')
+        vocab = Vocab([''])
+        windows, words, phones, report = realign.realignSuspects(
+            pt_path / 'allblocks.wav',
+            mfa_utils.readTier(paths['windows'], vocab),
+            mfa_utils.readTier(paths['words'], vocab),
+            mfa_utils.readTier(paths['phones'], vocab),
+            mfa_path / f'realign_{t}', mfa_dict,
+            cfg.task.mfa.acoustic, pad_s=rcfg.pad_s, beam=rcfg.beam,
+            retry_beam=rcfg.retry_beam, temp_dir=work_dir,
+            log_path=(mfa_path / f'realign_{names["output_dir"]}.log'
+                      if cfg.events.quiet_mfa else None),
+            min_word_dur=rcfg.min_word_dur, phone_z=rcfg.phone_z,
+            min_coverage=rcfg.min_coverage)
+
+        print(f'##### Patient {pt} ({t}): {len(report["suspect"])}/'
+              f'{report["n_windows"]} suspect windows, '
+              f'{len(report["fixed"])} fixed, {len(report["improved"])} '
+              'improved #####')
+        for i, reasons in report['suspect'].items():
+            print(f'    window {i}: {", ".join(reasons)}')
+        if not report['mfa_ok']:
+            raise RuntimeError(f'Error re-aligning patient {pt}')
+        if report['fixed'] or report['improved']:
+            mfa_utils.writeTier(windows, paths['windows'])
+            mfa_utils.writeTier(words, paths['words'])
+            mfa_utils.writeTier(phones, paths['phones'])
+        reports[t] = report
+    return reports
+
+
+def export_patient(pt_path: str, cfg: DictConfig,
+                   run_type: Optional[list[str]] = None) -> dict[str, dict]:
+    """Cut an aligned patient's recording into per-word, per-phone or
+    per-trial epochs, see `export.exportEpochs`.
+
+    Epochs are saved to the patient's 'mfa' directory, as
+    'epochs_{run_type}_{unit}/' for clips or 'epochs_{run_type}_{unit}.npy'
+    for stacked arrays. Tiers are read into a vocabulary of their own, so
+    several patients can be exported from different threads at once.
+
+    Args:
+        pt_path (str): Path to the patient directory.
+        cfg (DictConfig): Pipeline configuration.
+        run_type (Optional[list[str]], optional): Response annotation types to
+            export. Defaults to None (all types for the task).
+
+    Returns:
+        dict[str, dict]: Export summary for each response annotation type
+            that has alignments.
+    """
+    pt_path = Path(pt_path)
+    mfa_path = pt_path / 'mfa'
+    if run_type is None:
+        run_type = run_types(cfg)
+    ecfg = cfg.export
+
+    summaries = {}
+    for t in run_type:
+        if ecfg.unit == 'trials':
+            tier_path = mfa_path / windows_name(cfg, t)
+        else:
+            tier_path = mfa_path / f'{resp_names(t)["label"]}_{ecfg.unit}.txt'
+        if not tier_path.is_file():
+            continue
+        out_path = mfa_path / epochs_name(t, ecfg.unit, ecfg.format)
+        summaries[t] = export.exportEpochs(
+            pt_path / ecfg.wav, mfa_utils.readTier(tier_path, Vocab([''])),
+            out_path, fmt=ecfg.format, pre_s=ecfg.pre_s, post_s=ecfg.post_s)
+    return summaries
+
+
+def sweep_values(cfg: DictConfig) -> tuple[list[float], list[float]]:
+    """Get the swept `merge_thresh` and `max_dur` values.
+
+    Args:
+        cfg (DictConfig): Pipeline configuration.
+
+    Returns:
+        tuple[list[float], list[float]]: Values of `merge_thresh` and
+            `max_dur` to try.
+
+    Raises:
+        ValueError: If `merge_thresh` is swept for the retro cue task, whose
+            response windows do not depend on it.
+    """
+    if cfg.task.name == 'retro_cue' and cfg.sweep.merge_thresh:
+        raise ValueError('sweep.merge_thresh has no effect on the retro_cue '
+                         'task; only sweep.max_dur can be swept.')
+    return (list(cfg.sweep.merge_thresh or [cfg.merge_thresh]),
+            list(cfg.sweep.max_dur or [cfg.task.max_dur]))
+
+
+def sweep_patient(pt_path: str, cfg: DictConfig,
+                  annot_dict: Optional[dict] = None,
+                  lex_index: Optional[dict] = None,
+                  run_type: Optional[list[str]] = None) -> dict[str, dict]:
+    """Align a patient with every combination of the swept `merge_thresh` and
+    `max_dur` values, sharing the work common to all variants.
+
+    Stimuli are placed and the audio denoised once. The patient's recording
+    is not changed: if it has not been denoised by a previous run, a
+    denoised copy is staged in 'mfa/{cfg.sweep.out_dir}/'. Each variant's
+    response windows are derived from the placed stimuli, and the distinct
+    windows of all variants are aligned together in a single MFA run per
+    response annotation type (windows that overlap are put in separate
+    transcripts). Variants whose merged stimuli do not match the number of
+    trials are skipped. Each variant's windows and alignments are saved to
+    'mfa/{cfg.sweep.out_dir}/{variant}/', and a summary of each variant to
+    'mfa/{cfg.sweep.out_dir}/summary.json'.
+
+    Args:
+        pt_path (str): Path to the patient directory.
+        cfg (DictConfig): Pipeline configuration.
+        annot_dict (Optional[dict], optional): Stim annotation templates.
+            Loaded from `cfg.task.stim_dir` if None and the task annotates
+            stimuli. Defaults to None.
+        lex_index (Optional[dict], optional): Lexicon index used to check
+            transcripts before alignment. Defaults to None (no check).
+        run_type (Optional[list[str]], optional): Response annotation types to
+            run. Defaults to None (all types for the task).
+
+    Returns:
+        dict[str, dict]: Summary of each variant, with the number of windows,
+            empty windows and suspect windows (see `realign.scoreWindows`) and
+            the mean fraction of the windows covered by aligned words for each
+            response annotation type, or the reason it was skipped under
+            'skipped'.
+    """
+    pt_path = Path(pt_path)
+    pt = pt_path.name
+    mfa_path = pt_path / 'mfa'
+    sweep_path = mfa_path / cfg.sweep.out_dir
+    if run_type is None:
+        run_type = run_types(cfg)
+    merge_threshs, max_durs = sweep_values(cfg)
+    variants = sweep.sweepVariants(merge_threshs, max_durs)
+    os.makedirs(sweep_path, exist_ok=True)
+
+    # stages shared by every variant
+    retro_cue = cfg.task.name == 'retro_cue'
+    trial_conds = None
+    vocab = Vocab([''])
+    if retro_cue:
+        cues = mfa_utils.readTier(pt_path / 'cue_events_mfa.txt', vocab)
+    elif cfg.task.get('run_stim', True):
+        print('##### Annotating stimuli for patient %s #####' % pt)
+        if annot_dict is None:
+            annot_dict = load_stim_templates(cfg)
+        onsets = mfa_utils.readTier(pt_path / 'cue_events.txt', vocab)
+        trial_conds = mfa_utils.loadTrialConds(pt_path / 'trialInfo.mat',
+                                               len(onsets))
+        stims = mfa_utils.placeStims(annot_dict, onsets,
+                                     trial_conds['modality'])
+        for tier, intervals in stims.items():
+            mfa_utils.writeTier(intervals, sweep_path / f'mfa_stim_{tier}.txt')
+        stim_words = stims['words']
+        n_trials = len(onsets)
+    else:
+        stim_words = mfa_utils.readTier(mfa_path / 'mfa_stim_words.txt',
+                                        vocab)
+        n_trials = mfa_utils.countTrials(pt_path / 'trialInfo.mat')
+    merged = {} if retro_cue else \
+        {m: mfa_utils.mergeTier(stim_words, m) for m in merge_threshs}
+
+    # each merged stimulus is a trial, so a threshold merging too much or too
+    # little would pair windows with the wrong trial conditions
+    summary = {}
+    for variant in variants:
+        name = sweep.variantName(*variant)
+        n_merged = None if retro_cue else len(merged[variant[0]])
+        if n_merged is not None and n_merged != n_trials:
+            summary[name] = {'skipped': f'{n_merged} merged stimuli for '
+                                        f'{n_trials} trials'}
+            print(f'##### Skipping variant {name} for patient {pt}: '
+                  f'{summary[name]["skipped"]} #####')
+        else:
+            summary[name] = {}
+            os.makedirs(sweep_path / name, exist_ok=True)
+    variants = [v for v in variants
+                if 'skipped' not in summary[sweep.variantName(*v)]]
+    if trial_conds is None and not retro_cue:
+        trial_conds = mfa_utils.loadTrialConds(pt_path / 'trialInfo.mat',
+                                               n_trials)
+
+    # denoise a copy rather than the patient's recording, unless the
+    # recording is still the denoised version written by a previous run
+    wav_path = pt_path / 'allblocks.wav'
+    if variants and not mfa_utils.isDenoised(wav_path):
+        staged_path = sweep_path / 'allblocks.wav'
+        if not staged_path.is_file() or \
+                staged_path.stat().st_mtime < wav_path.stat().st_mtime:
+            mfa_utils.denoiseWav(wav_path, out_path=staged_path)
+        wav_path = staged_path
+    wav_info = mfa_utils.getWavInfo(wav_path)
+    recording_dur = wav_info['n_frames'] / wav_info['fs']
+
+    for t in run_type:
+        if not variants:
+            break
+        names = resp_names(t)
+        print(f'##### Sweeping {len(variants)} variants for patient {pt}: '
+              f'{t} #####')
+        variant_windows = []
+        for merge_thresh, max_dur in variants:
+            if retro_cue:
+                windows = mfa_utils.retrocueWindows(cues, recording_dur,
+                                                    max_dur)
+            else:
+                windows = mfa_utils.respWindows(
+                    merged[merge_thresh], trial_conds, recording_dur, max_dur,
+                    method=t)
+            variant_windows.append(windows)
+
+        # align each distinct window once
+        windows, variant_idx = sweep.uniqueWindows(variant_windows,
+                                                   wav_info['fs'])
+        layers = sweep.packLayers(windows)
+        print(f'##### {sum(len(w) for w in variant_windows)} windows, '
+              f'{len(windows)} distinct, in {layers.max(initial=-1) + 1} '
+              'transcripts #####')
+        mfa_dict = cfg.task.mfa.dict
+        if lex_index is not None:
+            mfa_dict = check_lexicon(
+                lex_index, windows, sweep_path / f'lexicon_{t}.dict',
+                mfa_dict, cfg.lexicon.oov_action, cfg.lexicon.subset_dict)
+        input_dir = sweep_path / names['input_dir']
+        output_dir = sweep_path / names['output_dir']
+        sweep.stageLayers(wav_path, windows, layers, input_dir, names)
+        work_dir = mfa_work_dir(cfg, pt_path, f'sweep_{t}')
+        if not mfa_utils.runMFA(
+                input_dir, output_dir, mfa_dict=mfa_dict,
+                mfa_model=cfg.task.mfa.acoustic, temp_dir=work_dir,
+                cleanup=cfg.mfa_work.cleanup,
+                log_path=(sweep_path / f'{names["output_dir"]}.log'
+                          if cfg.events.quiet_mfa else None)):
+            raise RuntimeError(f'Error running MFA on patient {pt}')
+        aligned = sweep.collectLayers(windows, layers, output_dir, names)
+
+        # split the alignments back into the variants
+        for variant, v_windows, idx in zip(variants, variant_windows,
+                                           variant_idx):
+            name = sweep.variantName(*variant)
+            v_words = sweep.variantAlignment(*aligned['words'], idx)
+            v_phones = sweep.variantAlignment(*aligned['phones'], idx)
+            out_path = sweep_path / name
+            mfa_utils.writeTier(v_windows, out_path / windows_name(cfg, t))
+            mfa_utils.writeTier(v_words,
+                                out_path / f'{names["label"]}_words.txt')
+            mfa_utils.writeTier(v_phones,
+                                out_path / f'{names["label"]}_phones.txt')
+
+            scores = realign.scoreWindows(
+                v_windows.sort(), v_words, v_phones,
+                min_word_dur=cfg.realign.min_word_dur,
+                phone_z=cfg.realign.phone_z,
+                min_coverage=cfg.realign.min_coverage)
+            summary[name][t] = {
+                'merge_thresh': variant[0], 'max_dur': variant[1],
+                'n_windows': len(v_windows),
+                'n_empty': int(scores['reasons']['empty'].sum()),
+                'n_suspect': int(scores['suspect'].sum()),
+                'coverage': (float(scores['coverage'].mean())
+                             if len(v_windows) else None)}
+
+    with open(sweep_path / 'summary.json', 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
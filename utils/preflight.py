@@ -0,0 +1,178 @@
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import scipy.io as sio
+
+from utils import mfa_utils
+
+
+def _readEvents(onset_path: Path, issues: list[str]) -> Optional[list]:
+    """Parse a cue events file, recording any malformed lines as issues."""
+    rows = []
+    with open(onset_path, 'r') as f:
+        for i, line in enumerate(f):
+            line_split = line.strip().split('\t')
+            if line_split == ['']:
+                continue
+            try:
+                start, end = float(line_split[0]), float(line_split[1])
+            except (ValueError, IndexError):
+                issues.append(f'{onset_path.name} line {i + 1} is malformed')
+                return None
+            rows.append((start, end, line_split[2:]))
+    return rows
+
+
+def validatePatient(pt_path: str, required_files: list[str],
+                    annot_dict: Optional[dict] = None,
+                    retro_cue: bool = False) -> dict:
+    """Check that a patient's files can be processed by the pipeline, without
+    doing any of the processing.
+
+    Checks that the required files exist, that the wav file header is valid
+    and its audio data is complete, that the cue events and trial info files
+    can be parsed, that they contain the same number of trials, that cues lie
+    within the recording, and that every auditory cue label has a stimulus
+    template.
+
+    Args:
+        pt_path (str): Path to the patient directory.
+        required_files (list[str]): Files that must exist in the directory.
+        annot_dict (Optional[dict], optional): Stim annotation templates, see
+            `mfa_utils.loadAnnotsToDict`. Cue labels are only checked against
+            the templates if provided. Defaults to None.
+        retro_cue (bool, optional): Whether the patient is from the retro cue
+            task, which uses 'cue_events_mfa.txt' instead of the trial tables.
+            Defaults to False.
+
+    Returns:
+        dict: Validation result with keys 'patient', 'ok', 'audio_min',
+            'n_cues', 'n_trials' and 'issues' (list of problems found).
+    """
+    pt_path = Path(pt_path)
+    result = {'patient': pt_path.name, 'ok': False, 'audio_min': None,
+              'n_cues': None, 'n_trials': None, 'issues': []}
+    issues = result['issues']
+
+    missing = [f for f in required_files if not (pt_path / f).is_file()]
+    if missing:
+        issues.append(f'missing {", ".join(missing)}')
+
+    # audio header and completeness
+    wav_path = pt_path / 'allblocks.wav'
+    if wav_path.is_file():
+        try:
+            info = mfa_utils.getWavInfo(wav_path)
+            result['audio_min'] = info['n_frames'] / info['fs'] / 60
+            if info['data_offset'] + info['data_bytes'] > info['file_bytes']:
+                issues.append('allblocks.wav is truncated')
+            elif info['n_frames'] == 0:
+                issues.append('allblocks.wav has no audio')
+        except (OSError, ValueError) as e:
+            issues.append(f'allblocks.wav header unreadable: {e}')
+
+    # cue events
+    onset_name = 'cue_events_mfa.txt' if retro_cue else 'cue_events.txt'
+    onsets = None
+    if (pt_path / onset_name).is_file():
+        onsets = _readEvents(pt_path / onset_name, issues)
+        if onsets is not None:
+            result['n_cues'] = len(onsets)
+            if result['audio_min'] is not None and onsets and \
+                    max(e for _, e, _ in onsets) > result['audio_min'] * 60:
+                issues.append(f'{onset_name} has cues after the end of the '
+                              'recording')
+
+    # trial table layout and size
+    mod_cnds = None
+    trial_info_path = pt_path / 'trialInfo.mat'
+    if not retro_cue and trial_info_path.is_file():
+        try:
+            trial_info = sio.loadmat(trial_info_path)['trialInfo'][0, :]
+            result['n_trials'] = len(trial_info)
+            for col in ['cue', 'condition', 'go']:
+                mfa_utils.matCol(trial_info, col)
+            mod_cnds = mfa_utils.matCol(trial_info, 'modality')
+        except Exception as e:
+            issues.append(f'trialInfo.mat has an unexpected layout: '
+                          f'{type(e).__name__}: {e}')
+
+    if (result['n_cues'] is not None and result['n_trials'] is not None and
+            result['n_cues'] != result['n_trials']):
+        issues.append(f'{result["n_cues"]} cues in {onset_name} but '
+                      f'{result["n_trials"]} trials in trialInfo.mat')
+
+    # cue labels must resolve to stimulus templates
+    if annot_dict is not None and onsets is not None and not retro_cue:
+        unresolved = set()
+        for i, (_, _, label) in enumerate(onsets):
+            if mod_cnds is not None and i < len(mod_cnds) and \
+                    mod_cnds[i] != 'sound':
+                continue
+            try:
+                stim = label[0].split('_')[1].split('.')[0]
+            except IndexError:
+                unresolved.add(label[0] if label else '')
+                continue
+            if any(stim not in annot_dict[tier] for tier in annot_dict):
+                unresolved.add(stim)
+        if unresolved:
+            issues.append(f'no stim templates for cues '
+                          f'{sorted(unresolved)}')
+
+    result['ok'] = not issues
+    return result
+
+
+def preflight(pt_paths: list[str], required_files: list[str],
+              annot_dict: Optional[dict] = None, retro_cue: bool = False,
+              n_workers: int = 8) -> list[dict]:
+    """Validate many patients concurrently. See `validatePatient`.
+
+    Args:
+        pt_paths (list[str]): Paths to the patient directories.
+        required_files (list[str]): Files that must exist in each directory.
+        annot_dict (Optional[dict], optional): Stim annotation templates.
+            Defaults to None.
+        retro_cue (bool, optional): Whether the patients are from the retro
+            cue task. Defaults to False.
+        n_workers (int, optional): Number of patients checked at once.
+            Defaults to 8.
+
+    Returns:
+        list[dict]: Validation result for each patient, in input order.
+    """
+    def _validate(pt_path):
+        try:
+            return validatePatient(pt_path, required_files, annot_dict,
+                                   retro_cue)
+        except Exception as e:
+            return {'patient': Path(pt_path).name, 'ok': False,
+                    'audio_min': None, 'n_cues': None, 'n_trials': None,
+                    'issues': [f'{type(e).__name__}: {e}']}
+
+    with ThreadPoolExecutor(max_workers=max(1, n_workers)) as executor:
+        return list(executor.map(_validate, pt_paths))
+
+
+def formatPreflight(results: list[dict]) -> str:
+    """Format validation results as a pass/fail table.
+
+    Args:
+        results (list[dict]): Validation results, see `preflight`.
+
+    Returns:
+        str: Table with one row per patient.
+    """
+    def _fmt(val, spec=''):
+        return '-' if val is None else format(val, spec)
+
+    rows = [('patient', 'status', 'audio (min)', 'cues', 'trials', 'issues')]
+    for r in results:
+        rows.append((r['patient'], 'PASS' if r['ok'] else 'FAIL',
+                     _fmt(r['audio_min'], '.1f'), _fmt(r['n_cues']),
+                     _fmt(r['n_trials']), '; '.join(r['issues'])))
+    widths = [max(len(row[i]) for row in rows) for i in range(5)]
+    lines = ['  '.join(val.ljust(w) for val, w in zip(row, widths)) +
+             '  ' + row[5] for row in rows]
+    return '\n'.join(line.rstrip() for line in lines)
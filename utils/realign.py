@@ -0,0 +1,282 @@
+import os
+import shutil
+from pathlib import Path
+from typing import Optional
+import numpy as np
+import scipy.io as sio
+
+from utils import mfa_utils
+from utils.tier import Tier
+
+# labels MFA gives to words and phones it could not align to the transcript
+UNK_LABELS = ['<unk>', 'spn']
+
+
+def assignToWindows(windows: Tier, tier: Tier, tol: float = 1e-6
+                    ) -> np.ndarray:
+    """Find the window containing each interval of a tier.
+
+    Args:
+        windows (Tier): Windows sorted by start time.
+        tier (Tier): Intervals to assign.
+        tol (float, optional): Tolerance in seconds for intervals touching
+            the window bounds. Defaults to 1e-6.
+
+    Returns:
+        np.ndarray: Index of the window containing each interval, or -1 if it
+            is not inside a window.
+    """
+    idx = np.searchsorted(windows.starts, tier.starts + tol, side='right') - 1
+    inside = idx >= 0
+    inside[inside] = tier.ends[inside] <= windows.ends[idx[inside]] + tol
+    return np.where(inside, idx, -1)
+
+
+def phoneStats(phones: Tier) -> tuple[float, float]:
+    """Get the median and scaled median absolute deviation of the log
+    durations of a patient's phones, used to find phone duration outliers.
+
+    Args:
+        phones (Tier): Aligned phones.
+
+    Returns:
+        tuple[float, float]: Median and scaled MAD of the log durations.
+    """
+    log_durs = np.log(np.maximum(phones.durations, 1e-4))
+    if len(log_durs) == 0:
+        return 0.0, 1.0
+    med = np.median(log_durs)
+    mad = 1.4826 * np.median(np.abs(log_durs - med))
+    return float(med), float(mad) if mad > 0 else 1.0
+
+
+def scoreWindows(windows: Tier, words: Tier, phones: Tier,
+                 min_word_dur: float = 0.05, phone_z: float = 3.5,
+                 min_coverage: float = 0.0,
+                 phone_stats: Optional[tuple[float, float]] = None) -> dict:
+    """Score the MFA alignment of every response window.
+
+    A window is suspect if it has no aligned words ('empty'), fewer aligned
+    words than its transcript ('missing_words'), words MFA could not align
+    ('unk'), words collapsed to less than `min_word_dur` ('collapsed'),
+    phones with outlying durations ('phone_outliers'), or aligned words
+    covering less than `min_coverage` of the window ('low_coverage').
+
+    Args:
+        windows (Tier): Response windows given to MFA, sorted by start time.
+        words (Tier): Aligned words.
+        phones (Tier): Aligned phones.
+        min_word_dur (float, optional): Shortest plausible word duration in
+            seconds. Defaults to 0.05.
+        phone_z (float, optional): Robust z-score of the log phone duration
+            above which a phone is an outlier. Defaults to 3.5.
+        min_coverage (float, optional): Smallest plausible fraction of a
+            window covered by aligned words. Defaults to 0.
+        phone_stats (Optional[tuple[float, float]], optional): Phone duration
+            statistics to compare against, see `phoneStats`. Defaults to the
+            statistics of `phones`.
+
+    Returns:
+        dict: Arrays with one value per window: 'n_words', 'expected',
+            'coverage', 'n_unk', 'n_collapsed', 'n_phone_outliers' and
+            'suspect', plus 'reasons' (boolean array for each reason).
+    """
+    n = len(windows)
+
+    def _perWindow(idx, values):
+        inside = idx >= 0
+        values = np.asarray(values, dtype=np.float64)
+        return np.bincount(idx[inside], weights=values[inside], minlength=n)
+
+    word_idx = assignToWindows(windows, words)
+    ones = np.ones(len(words))
+    n_words = _perWindow(word_idx, ones).astype(int)
+    expected = np.array([len(label.split()) for label in windows.labels],
+                        dtype=int)
+    coverage = _perWindow(word_idx, words.durations) / \
+        np.maximum(windows.durations, 1e-9)
+    n_unk = _perWindow(word_idx, words.hasLabel(UNK_LABELS)).astype(int)
+    n_collapsed = _perWindow(word_idx,
+                             words.durations < min_word_dur).astype(int)
+
+    if phone_stats is None:
+        phone_stats = phoneStats(phones)
+    med, mad = phone_stats
+    phone_zs = (np.log(np.maximum(phones.durations, 1e-4)) - med) / mad
+    n_phone_outliers = _perWindow(assignToWindows(windows, phones),
+                                  np.abs(phone_zs) > phone_z).astype(int)
+
+    reasons = {'empty': n_words == 0,
+               'missing_words': (n_words > 0) & (n_words < expected),
+               'unk': n_unk > 0,
+               'collapsed': n_collapsed > 0,
+               'phone_outliers': n_phone_outliers > 0,
+               'low_coverage': (n_words > 0) & (coverage < min_coverage)}
+    suspect = np.zeros(n, dtype=bool)
+    for flags in reasons.values():
+        suspect |= flags
+    return {'n_words': n_words, 'expected': expected, 'coverage': coverage,
+            'n_unk': n_unk, 'n_collapsed': n_collapsed,
+            'n_phone_outliers': n_phone_outliers, 'reasons': reasons,
+            'suspect': suspect}
+
+
+def windowReasons(scores: dict, i: int) -> list[str]:
+    """List the reasons window `i` is suspect, see `scoreWindows`."""
+    return [name for name, flags in scores['reasons'].items() if flags[i]]
+
+
+def cutSegments(wav_path: str, windows: Tier, idx: np.ndarray, out_dir: str,
+                pad_s: float = 0.25) -> Tier:
+    """Cut the audio of some windows into separate MFA input files.
+
+    Each window is padded by `pad_s` seconds on both sides, without
+    overlapping the neighbouring windows, and saved as 'window_{i}.wav' with a
+    TextGrid transcript 'window_{i}.TextGrid'.
+
+    Args:
+        wav_path (str): Path to the patient's (denoised) recording.
+        windows (Tier): All response windows, sorted by start time.
+        idx (np.ndarray): Indices of the windows to cut.
+        out_dir (str): MFA input directory for the segments.
+        pad_s (float, optional): Padding in seconds. Defaults to 0.25.
+
+    Returns:
+        Tier: Sample-accurate bounds of each segment in the recording,
+            labelled with the window transcripts.
+    """
+    out_dir = Path(out_dir)
+    fs, data = sio.wavfile.read(wav_path, mmap=True)
+    rec_dur = len(data) / fs
+
+    prev_ends = np.append(0.0, windows.ends[:-1])[idx]
+    next_starts = np.append(windows.starts[1:], rec_dur)[idx]
+    starts = np.minimum(windows.starts[idx],
+                        np.maximum(windows.starts[idx] - pad_s, prev_ends))
+    ends = np.maximum(windows.ends[idx],
+                      np.minimum(windows.ends[idx] + pad_s, next_starts))
+    first = np.clip(np.floor(starts * fs).astype(int), 0, len(data))
+    last = np.clip(np.ceil(ends * fs).astype(int), 0, len(data))
+
+    segments = windows[idx]
+    for i, s0, s1, label in zip(idx.tolist(), first.tolist(), last.tolist(),
+                                segments.labels):
+        name = f'window_{i:04d}'
+        sio.wavfile.write(out_dir / f'{name}.wav', fs, np.array(data[s0:s1]))
+        mfa_utils.tierToTextGrid(Tier([0.0], [(s1 - s0) / fs], [label],
+                                      vocab=segments.vocab)) \
+            .write(out_dir / f'{name}.TextGrid')
+    del data
+    return Tier(first / fs, last / fs, codes=segments.codes,
+                vocab=segments.vocab)
+
+
+def _replaceWindows(tier: Tier, windows: Tier, new: list[Tier]) -> Tier:
+    """Replace the intervals inside windows with new intervals."""
+    keep = assignToWindows(windows, tier) < 0
+    return Tier.concat([tier[keep]] + new, vocab=tier.vocab).sort()
+
+
+def realignSuspects(wav_path: str, windows: Tier, words: Tier, phones: Tier,
+                    work_dir: str, mfa_dict: str, mfa_model: str,
+                    pad_s: float = 0.25, beam: int = 100,
+                    retry_beam: int = 400, temp_dir: Optional[str] = None,
+                    log_path: Optional[str] = None,
+                    **score_args) -> tuple[Tier, Tier, Tier, dict]:
+    """Re-align only the suspect windows of a patient's MFA alignment.
+
+    Suspect windows (see `scoreWindows`) are cut out of the recording with
+    some padding and aligned again in a single MFA run with wider beams. A
+    re-aligned window replaces the original alignment if it has fewer
+    problems than before, and the window is widened to the padded bounds so
+    that the new alignment lies inside it.
+
+    Args:
+        wav_path (str): Path to the patient's (denoised) recording.
+        windows (Tier): Response windows given to MFA.
+        words (Tier): Aligned words.
+        phones (Tier): Aligned phones.
+        work_dir (str): Directory for the segment MFA input and output. It is
+            deleted after a successful re-alignment.
+        mfa_dict (str): Dictionary for MFA to use.
+        mfa_model (str): Acoustic model for MFA to use.
+        pad_s (float, optional): Padding in seconds added to the windows.
+            Defaults to 0.25.
+        beam (int, optional): MFA beam width. Defaults to 100.
+        retry_beam (int, optional): MFA beam width for retries. Defaults to
+            400.
+        temp_dir (Optional[str], optional): MFA temporary directory, see
+            `mfa_utils.runMFA`. Defaults to None.
+        log_path (Optional[str], optional): File to write MFA's console
+            output to. Defaults to None.
+        **score_args: Thresholds passed to `scoreWindows`.
+
+    Returns:
+        tuple[Tier, Tier, Tier, dict]: Windows with the bounds of re-aligned
+            windows adjusted, merged words and phones, and a report with keys
+            'n_windows', 'suspect' (window index -> reasons), 'fixed' and
+            'improved' (indices of windows that no longer have problems or
+            have fewer problems) and 'mfa_ok'.
+    """
+    windows = windows.sort()
+    phone_stats = phoneStats(phones)
+    scores = scoreWindows(windows, words, phones, phone_stats=phone_stats,
+                          **score_args)
+    suspect = np.flatnonzero(scores['suspect'])
+    report = {'n_windows': len(windows),
+              'suspect': {int(i): windowReasons(scores, i) for i in suspect},
+              'fixed': [], 'improved': [], 'mfa_ok': True}
+    if len(suspect) == 0:
+        return windows, words, phones, report
+
+    work_dir = Path(work_dir)
+    input_dir = work_dir / 'input'
+    output_dir = work_dir / 'output'
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(input_dir)
+    os.makedirs(output_dir)
+    segments = cutSegments(wav_path, windows, suspect, input_dir, pad_s)
+
+    report['mfa_ok'] = mfa_utils.runMFA(
+        input_dir, output_dir, mfa_dict=mfa_dict, mfa_model=mfa_model,
+        single_speaker=True, temp_dir=temp_dir, log_path=log_path,
+        extra_args=['--beam', str(beam), '--retry_beam', str(retry_beam)])
+    if not report['mfa_ok']:
+        return windows, words, phones, report
+
+    fixed, new_words, new_phones = [], [], []
+    for k, i in enumerate(suspect.tolist()):
+        tg_path = output_dir / f'window_{i:04d}.TextGrid'
+        if not tg_path.is_file():
+            continue  # MFA could not align the segment at all
+        aligned = mfa_utils.textGridToTiers(tg_path, vocab=windows.vocab)
+        offset = segments.starts[k]
+        seg_words = aligned['words'].offset(offset)
+        seg_phones = aligned['phones'].offset(offset)
+
+        # score the new alignment within the padded window
+        new_scores = scoreWindows(segments[[k]], seg_words, seg_phones,
+                                  phone_stats=phone_stats, **score_args)
+        n_before = len(report['suspect'][i])
+        n_after = len(windowReasons(new_scores, 0))
+        if n_after >= n_before:
+            continue
+        report['fixed' if n_after == 0 else 'improved'].append(i)
+        fixed.append(k)
+        new_words.append(seg_words)
+        new_phones.append(seg_phones)
+
+    if fixed:
+        # padded windows do not overlap their neighbours, so everything
+        # aligned inside them is replaced
+        fixed = np.array(fixed)
+        fixed_segments = segments[fixed]
+        words = _replaceWindows(words, fixed_segments, new_words)
+        phones = _replaceWindows(phones, fixed_segments, new_phones)
+        starts, ends = windows.starts.copy(), windows.ends.copy()
+        starts[suspect[fixed]] = fixed_segments.starts
+        ends[suspect[fixed]] = fixed_segments.ends
+        windows = Tier(starts, ends, codes=windows.codes,
+                       vocab=windows.vocab)
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return windows, words, phones, report
@@ -0,0 +1,188 @@
+import os
+import shutil
+import heapq
+import itertools
+from pathlib import Path
+import numpy as np
+
+from utils import mfa_utils
+from utils.tier import Tier
+from utils.realign import assignToWindows
+
+
+def sweepVariants(merge_threshs: list[float], max_durs: list[float]) \
+        -> list[tuple[float, float]]:
+    """List every combination of swept parameter values.
+
+    Args:
+        merge_threshs (list[float]): Values of `merge_thresh`.
+        max_durs (list[float]): Values of `max_dur`.
+
+    Returns:
+        list[tuple[float, float]]: (merge_thresh, max_dur) of each variant.
+    """
+    return list(itertools.product(merge_threshs, max_durs))
+
+
+def variantName(merge_thresh: float, max_dur: float) -> str:
+    """Get the output directory name of a sweep variant."""
+    return f'merge_{merge_thresh:g}_maxdur_{max_dur:g}'
+
+
+def uniqueWindows(variant_windows: list[Tier], fs: float) \
+        -> tuple[Tier, list[np.ndarray]]:
+    """Find the distinct windows produced by several variants, so each is
+    only aligned once.
+
+    Window bounds are compared in samples, so bounds computed in different
+    ways (e.g. `end + max_dur` and the next stimulus onset) that differ only
+    by floating point error give the same window.
+
+    Args:
+        variant_windows (list[Tier]): Windows of each variant, with the same
+            vocabulary.
+        fs (float): Sampling rate of the recording.
+
+    Returns:
+        tuple[Tier, list[np.ndarray]]: Distinct windows sorted by start time,
+            with the bounds of their first occurrence, and the indices of
+            each variant's windows among them.
+    """
+    windows = Tier.concat(variant_windows)
+    keys = np.stack([np.round(windows.starts * fs).astype(np.int64),
+                     np.round(windows.ends * fs).astype(np.int64),
+                     windows.codes.astype(np.int64)], axis=1)
+    _, first, inverse = np.unique(keys, axis=0, return_index=True,
+                                  return_inverse=True)
+    inverse = inverse.reshape(-1)
+    bounds = np.cumsum([len(w) for w in variant_windows])[:-1]
+    return windows[first], np.split(inverse, bounds)
+
+
+def packLayers(windows: Tier) -> np.ndarray:
+    """Split windows into as few layers of non-overlapping windows as
+    possible, so each layer can be aligned as a single transcript.
+
+    Args:
+        windows (Tier): Windows sorted by start time.
+
+    Returns:
+        np.ndarray: Layer of each window.
+    """
+    layers = np.zeros(len(windows), dtype=int)
+    ends = []  # heap of (end time of last window, layer)
+    for i, (start, end) in enumerate(zip(windows.starts.tolist(),
+                                         windows.ends.tolist())):
+        if ends and ends[0][0] <= start:
+            _, layer = heapq.heappop(ends)
+        else:
+            layer = len(ends)
+        layers[i] = layer
+        heapq.heappush(ends, (end, layer))
+    return layers
+
+
+def stageLayers(wav_path: str, windows: Tier, layers: np.ndarray,
+                input_dir: str, names: dict[str, str]) -> None:
+    """Write the MFA input files for each layer of windows: a transcript per
+    layer, each with a hardlink (or copy) of the recording.
+
+    Args:
+        wav_path (str): Path to the (denoised) recording.
+        windows (Tier): Windows sorted by start time.
+        layers (np.ndarray): Layer of each window, see `packLayers`.
+        input_dir (str): MFA input directory.
+        names (dict[str, str]): File names for the run type, see
+            `pipeline.resp_names`. Layers are saved as '{stem}_layer{k}'.
+    """
+    input_dir = Path(input_dir)
+    shutil.rmtree(input_dir, ignore_errors=True)
+    os.makedirs(input_dir)
+    for k in range(layers.max(initial=-1) + 1):
+        stem = f'{Path(names["wav"]).stem}_layer{k}'
+        try:
+            os.link(wav_path, input_dir / f'{stem}.wav')
+        except OSError:
+            shutil.copy(wav_path, input_dir / f'{stem}.wav')
+        mfa_utils.tierToTextGrid(windows[layers == k]).write(
+            input_dir / f'{stem}.TextGrid')
+
+
+def collectLayers(windows: Tier, layers: np.ndarray, output_dir: str,
+                  names: dict[str, str]) -> dict[str, tuple[Tier, np.ndarray]]:
+    """Read the MFA alignments of every layer and find the window each
+    aligned interval belongs to.
+
+    Args:
+        windows (Tier): Windows sorted by start time.
+        layers (np.ndarray): Layer of each window, see `packLayers`.
+        output_dir (str): MFA output directory.
+        names (dict[str, str]): File names for the run type.
+
+    Returns:
+        dict[str, tuple[Tier, np.ndarray]]: For the 'words' and 'phones'
+            tiers, the aligned intervals of all layers and the index of the
+            window containing each interval (-1 if none).
+    """
+    collected = {'words': ([], []), 'phones': ([], [])}
+    for k in range(layers.max(initial=-1) + 1):
+        tg_path = Path(output_dir) / \
+            f'{Path(names["wav"]).stem}_layer{k}.TextGrid'
+        if not tg_path.is_file():
+            continue  # MFA could not align any window of the layer
+        members = np.flatnonzero(layers == k)
+        aligned = mfa_utils.textGridToTiers(tg_path, vocab=windows.vocab)
+        for tier, (tiers, owners) in collected.items():
+            local = assignToWindows(windows[members], aligned[tier])
+            tiers.append(aligned[tier])
+            owners.append(np.where(local >= 0, members[local], -1))
+    return {tier: (Tier.concat(tiers, vocab=windows.vocab),
+                   np.concatenate(owners) if owners else np.zeros(0, int))
+            for tier, (tiers, owners) in collected.items()}
+
+
+def variantAlignment(tier: Tier, owners: np.ndarray,
+                     window_idx: np.ndarray) -> Tier:
+    """Get the aligned intervals inside a variant's windows.
+
+    Args:
+        tier (Tier): Aligned intervals of all windows, see `collectLayers`.
+        owners (np.ndarray): Window containing each interval.
+        window_idx (np.ndarray): Indices of the variant's windows.
+
+    Returns:
+        Tier: Aligned intervals of the variant, sorted by start time.
+    """
+    return tier[np.isin(owners, window_idx)].sort()
+
+
+def formatSweep(summaries: dict[str, dict]) -> str:
+    """Format the sweep summaries of several patients as a table comparing
+    the variants.
+
+    Args:
+        summaries (dict[str, dict]): Summary of each patient, see
+            `pipeline.sweep_patient`.
+
+    Returns:
+        str: Table with one row per patient, variant and response annotation
+            type, and one row per skipped variant.
+    """
+    rows = [('patient', 'variant', 'type', 'windows', 'empty', 'suspect',
+             'coverage', 'note')]
+    for pt, summary in summaries.items():
+        for name, types in summary.items():
+            if 'skipped' in types:
+                rows.append((pt, name, '-', '-', '-', '-', '-',
+                             f'skipped: {types["skipped"]}'))
+                continue
+            for t, stats in types.items():
+                coverage = ('-' if stats['coverage'] is None
+                            else f'{stats["coverage"]:.3f}')
+                rows.append((pt, name, t, str(stats['n_windows']),
+                             str(stats['n_empty']), str(stats['n_suspect']),
+                             coverage, ''))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    lines = ['  '.join(val.ljust(w) for val, w in zip(row, widths))
+             for row in rows]
+    return '\n'.join(line.rstrip() for line in lines)
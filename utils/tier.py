@@ -0,0 +1,273 @@
+import threading
+from typing import Iterable, Iterator, NamedTuple, Optional, Union
+import numpy as np
+
+
+class Interval(NamedTuple):
+    """Labelled time interval, with times in seconds."""
+    start: float
+    end: float
+    label: str
+
+
+class Vocab:
+    """Vocabulary interning labels as integer codes.
+
+    Labels are stored once and tiers only keep their codes, so repeated
+    labels (e.g. phones, or the same stimulus on every trial) cost a single
+    integer per interval. New labels are added under a lock, so a vocabulary
+    can be shared by several threads. Labels are never removed, so
+    long-running processes should give each patient its own vocabulary
+    rather than growing the shared `VOCAB`.
+    """
+    __slots__ = ('labels', '_codes', '_lock')
+
+    def __init__(self, labels: Iterable[str] = ()) -> None:
+        self.labels = []
+        self._codes = {}
+        self._lock = threading.Lock()
+        for label in labels:
+            self.code(label)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def __getstate__(self) -> list[str]:
+        return self.labels
+
+    def __setstate__(self, labels: list[str]) -> None:
+        self.__init__(labels)
+
+    def code(self, label: str) -> int:
+        """Get the code of a label, adding it to the vocabulary if needed."""
+        code = self._codes.get(label)
+        if code is None:
+            with self._lock:
+                code = self._codes.get(label)
+                if code is None:
+                    # append the label before publishing its code, so other
+                    # threads never see a code without a label
+                    self.labels.append(label)
+                    code = self._codes[label] = len(self.labels) - 1
+        return code
+
+    def encode(self, labels: Iterable[str]) -> np.ndarray:
+        """Get the codes of several labels."""
+        return np.fromiter((self.code(label) for label in labels),
+                           dtype=np.int32)
+
+    def decode(self, codes: np.ndarray) -> list[str]:
+        """Get the labels of several codes."""
+        return [self.labels[code] for code in codes.tolist()]
+
+
+# vocabulary shared by all tiers unless another one is given
+VOCAB = Vocab([''])
+
+
+class Tier:
+    """Compact annotation tier of labelled intervals.
+
+    Start and end times are stored as float64 arrays and labels as int32
+    codes into a shared `Vocab`, with no per-interval Python objects.
+    Iterating over a tier or indexing it with an integer gives `Interval`
+    tuples, which are created on the fly. Indexing with a slice, boolean mask
+    or index array gives a new tier.
+
+    Args:
+        starts (Iterable[float], optional): Start times in seconds.
+        ends (Iterable[float], optional): End times in seconds.
+        labels (Optional[Iterable[str]], optional): Labels. Defaults to empty
+            labels if neither `labels` nor `codes` are given.
+        codes (Optional[np.ndarray], optional): Label codes in `vocab`, used
+            instead of `labels`. Defaults to None.
+        vocab (Optional[Vocab], optional): Label vocabulary. Defaults to the
+            shared module vocabulary.
+    """
+    __slots__ = ('starts', 'ends', 'codes', 'vocab')
+
+    def __init__(self, starts: Iterable[float] = (),
+                 ends: Iterable[float] = (),
+                 labels: Optional[Iterable[str]] = None,
+                 codes: Optional[np.ndarray] = None,
+                 vocab: Optional[Vocab] = None) -> None:
+        self.vocab = VOCAB if vocab is None else vocab
+        self.starts = np.asarray(starts, dtype=np.float64).reshape(-1)
+        self.ends = np.asarray(ends, dtype=np.float64).reshape(-1)
+        if codes is not None:
+            self.codes = np.asarray(codes, dtype=np.int32).reshape(-1)
+        elif labels is not None:
+            self.codes = self.vocab.encode(labels)
+        else:
+            self.codes = np.full(len(self.starts), self.vocab.code(''),
+                                 dtype=np.int32)
+        if not len(self.starts) == len(self.ends) == len(self.codes):
+            raise ValueError('starts, ends and labels must have the same '
+                             'length.')
+
+    @classmethod
+    def fromIntervals(cls, intervals: Iterable, vocab: Optional[Vocab] = None
+                      ) -> 'Tier':
+        """Create a tier from (start, end, label) rows. Times may be strings.
+
+        Args:
+            intervals (Iterable): Rows of start time, end time and label.
+            vocab (Optional[Vocab], optional): Label vocabulary. Defaults to
+                the shared module vocabulary.
+
+        Returns:
+            Tier: New tier.
+        """
+        rows = list(intervals)
+        if not rows:
+            return cls(vocab=vocab)
+        starts, ends, labels = zip(*rows)
+        return cls(np.array(starts, dtype=np.float64),
+                   np.array(ends, dtype=np.float64), labels, vocab=vocab)
+
+    @classmethod
+    def concat(cls, tiers: Iterable['Tier'],
+               vocab: Optional[Vocab] = None) -> 'Tier':
+        """Concatenate tiers in order.
+
+        Args:
+            tiers (Iterable[Tier]): Tiers to concatenate.
+            vocab (Optional[Vocab], optional): Vocabulary of the new tier.
+                Defaults to the vocabulary of the first tier.
+
+        Returns:
+            Tier: Concatenated tier.
+        """
+        tiers = list(tiers)
+        if vocab is None:
+            vocab = tiers[0].vocab if tiers else VOCAB
+        if not tiers:
+            return cls(vocab=vocab)
+        codes = [t.codes if t.vocab is vocab else vocab.encode(t.labels)
+                 for t in tiers]
+        return cls(np.concatenate([t.starts for t in tiers]),
+                   np.concatenate([t.ends for t in tiers]),
+                   codes=np.concatenate(codes), vocab=vocab)
+
+    @classmethod
+    def read(cls, txt_path: str, vocab: Optional[Vocab] = None) -> 'Tier':
+        """Read a text file with format:
+        start_time    end_time    label
+        Lines without a label are kept with an empty label.
+
+        Args:
+            txt_path (str): Path to txt file.
+            vocab (Optional[Vocab], optional): Label vocabulary. Defaults to
+                the shared module vocabulary.
+
+        Returns:
+            Tier: Intervals in the file.
+        """
+        rows = []
+        with open(txt_path, 'r') as f:
+            for line in f:
+                line_split = line.strip().split('\t')
+                if len(line_split) < 2:
+                    continue
+                label = line_split[2] if len(line_split) > 2 else ''
+                rows.append((line_split[0], line_split[1], label))
+        return cls.fromIntervals(rows, vocab)
+
+    def write(self, txt_path: str) -> None:
+        """Write the tier to a text file with format:
+        start_time    end_time    label
+        Times are written as the shortest repr of the float64 value, so they
+        read back exactly, but their text may differ from the file the tier
+        was read from (e.g. '12.345000' is written as '12.345').
+
+        Args:
+            txt_path (str): Path to txt file.
+        """
+        labels = self.vocab.labels
+        with open(txt_path, 'w', encoding='utf-8') as f:
+            f.writelines(f'{s}\t{e}\t{labels[c]}\n' for s, e, c in
+                         zip(self.starts.tolist(), self.ends.tolist(),
+                             self.codes.tolist()))
+
+    @classmethod
+    def load(cls, npz_path: str, vocab: Optional[Vocab] = None) -> 'Tier':
+        """Load a tier saved with `save`.
+
+        Args:
+            npz_path (str): Path to .npz file.
+            vocab (Optional[Vocab], optional): Label vocabulary. Defaults to
+                the shared module vocabulary.
+
+        Returns:
+            Tier: Loaded tier.
+        """
+        vocab = VOCAB if vocab is None else vocab
+        with np.load(npz_path, allow_pickle=False) as data:
+            remap = vocab.encode(data['labels'].tolist())
+            return cls(data['starts'], data['ends'],
+                       codes=remap[data['codes']] if len(remap) else
+                       data['codes'], vocab=vocab)
+
+    def save(self, npz_path: str) -> None:
+        """Save the tier to a binary .npz file, with only the labels it uses.
+
+        Args:
+            npz_path (str): Path to .npz file.
+        """
+        used, codes = np.unique(self.codes, return_inverse=True)
+        np.savez(npz_path, starts=self.starts, ends=self.ends,
+                 codes=codes.astype(np.int32),
+                 labels=np.array(self.vocab.decode(used), dtype=str))
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __iter__(self) -> Iterator[Interval]:
+        labels = self.vocab.labels
+        for s, e, c in zip(self.starts.tolist(), self.ends.tolist(),
+                           self.codes.tolist()):
+            yield Interval(s, e, labels[c])
+
+    def __getitem__(self, idx) -> Union[Interval, 'Tier']:
+        if isinstance(idx, (int, np.integer)):
+            return Interval(float(self.starts[idx]), float(self.ends[idx]),
+                            self.vocab.labels[self.codes[idx]])
+        return Tier(self.starts[idx], self.ends[idx], codes=self.codes[idx],
+                    vocab=self.vocab)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Tier):
+            return NotImplemented
+        return (np.array_equal(self.starts, other.starts) and
+                np.array_equal(self.ends, other.ends) and
+                self.labels == other.labels)
+
+    def __repr__(self) -> str:
+        preview = ', '.join(f'({s:.3f}, {e:.3f}, {label!r})'
+                            for s, e, label in list(self[:3]))
+        more = ', ...' if len(self) > 3 else ''
+        return f'Tier(n={len(self)}, [{preview}{more}])'
+
+    @property
+    def labels(self) -> list[str]:
+        """Labels of the intervals."""
+        return self.vocab.decode(self.codes)
+
+    @property
+    def durations(self) -> np.ndarray:
+        """Durations of the intervals in seconds."""
+        return self.ends - self.starts
+
+    def hasLabel(self, labels: Iterable[str]) -> np.ndarray:
+        """Get a boolean mask of intervals whose label is one of `labels`."""
+        return np.isin(self.codes, self.vocab.encode(labels))
+
+    def offset(self, dt: float) -> 'Tier':
+        """Shift all intervals by `dt` seconds."""
+        return Tier(self.starts + dt, self.ends + dt, codes=self.codes,
+                    vocab=self.vocab)
+
+    def sort(self) -> 'Tier':
+        """Sort intervals by start time."""
+        order = np.argsort(self.starts, kind='stable')
+        return self[order]
@@ -0,0 +1,256 @@
+import os
+import glob
+import json
+import time
+import fnmatch
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+
+try:  # file system notifications (inotify on Linux) if watchdog is installed
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+from utils import mfa_utils
+
+
+class _WakeHandler(FileSystemEventHandler):
+    """Wakes the watcher whenever a path it cares about changes."""
+
+    def __init__(self, wake: threading.Event,
+                 is_relevant: Callable[[str], bool]) -> None:
+        super().__init__()
+        self.wake = wake
+        self.is_relevant = is_relevant
+
+    def on_any_event(self, event) -> None:
+        paths = [event.src_path, getattr(event, 'dest_path', None)]
+        if any(p and self.is_relevant(p) for p in paths):
+            self.wake.set()
+
+
+class PatientWatcher:
+    """Watch a directory for patient folders that are ready to be processed.
+
+    A patient folder is ready once all of its required files exist, its wav
+    file is complete, and none of the required files have changed for
+    `settle_s` seconds. Folders are processed again when their required files
+    change after processing. Patients that failed are retried when their
+    required files change, or `retry_s` seconds after they failed. The file
+    signatures of processed and failed patients are saved to `state_path` so
+    a restarted watcher does not reprocess them.
+
+    The directory is polled every `poll_s` seconds. If the watchdog package
+    is installed, file system notifications (e.g. inotify) are used to check
+    the directory as soon as a patient folder or one of its required files
+    changes. Only the top level of the directory and of each patient folder
+    are watched, so the pipeline's own outputs (e.g. the 'mfa' directories
+    and the event log) do not wake the watcher.
+
+    Args:
+        patient_dir (str): Directory containing patient folders.
+        prefixes (list[str]): Glob patterns of patient folder names.
+        required_files (list[str]): Files that must be present in a patient
+            folder before it is processed.
+        settle_s (float, optional): Seconds the required files must be
+            unchanged for. Defaults to 60.
+        poll_s (float, optional): Seconds between checks of the directory.
+            Defaults to 30.
+        state_path (Optional[str], optional): File to save processed patients
+            to. If None, state is only kept in memory. Defaults to None.
+        patients (Optional[list[str]], optional): Only watch these patients.
+            Defaults to None (all patients matching `prefixes`).
+        retry_s (Optional[float], optional): Seconds after which a failed
+            patient is retried. If None, failed patients are only retried when
+            their required files change. Defaults to None.
+    """
+
+    def __init__(self, patient_dir: str, prefixes: list[str],
+                 required_files: list[str], settle_s: float = 60,
+                 poll_s: float = 30, state_path: Optional[str] = None,
+                 patients: Optional[list[str]] = None,
+                 retry_s: Optional[float] = None) -> None:
+        self.patient_dir = Path(patient_dir)
+        self.prefixes = list(prefixes)
+        self.required_files = list(required_files)
+        self.settle_s = settle_s
+        self.poll_s = poll_s
+        self.retry_s = retry_s
+        self.state_path = None if state_path is None else Path(state_path)
+        self.patients = None if patients is None else set(patients)
+
+        self._seen = {}  # patient -> (signature, time first seen)
+        self.processed = {}  # patient -> signature when last processed
+        self.failed = {}  # patient -> [signature, time] when last failed
+        if self.state_path is not None and self.state_path.is_file():
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+            if 'processed' in state and 'failed' in state:
+                self.processed = state['processed']
+                self.failed = state['failed']
+            else:  # state saved before failures were recorded
+                self.processed = state
+
+        self._wake = threading.Event()
+        self._handler = _WakeHandler(self._wake, self.is_relevant)
+        self._observer = None
+        self._watched = set()  # patient folders with their own watch
+        if Observer is not None:
+            self._observer = Observer()
+            self._observer.schedule(self._handler,
+                                    self.patient_dir.as_posix(),
+                                    recursive=False)
+            self._observer.start()
+
+    def is_relevant(self, path: str) -> bool:
+        """Check whether a change to a path can make a patient ready.
+
+        Args:
+            path (str): Changed path.
+
+        Returns:
+            bool: True for patient folders and their required files.
+        """
+        path = Path(path)
+        if path.parent == self.patient_dir:
+            return any(fnmatch.fnmatchcase(path.name, prefix)
+                       for prefix in self.prefixes)
+        if path.parent.parent == self.patient_dir:
+            return path.name in self.required_files
+        return False
+
+    def close(self) -> None:
+        """Stop watching for file system notifications."""
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+
+    def signature(self, pt: str) -> Optional[list]:
+        """Get the size and modification time of a patient's required files.
+
+        Args:
+            pt (str): Patient ID.
+
+        Returns:
+            Optional[list]: [name, size, mtime] for each required file, or
+                None if a required file is missing or the wav file is
+                incomplete.
+        """
+        pt_path = self.patient_dir / pt
+        sig = []
+        for fname in self.required_files:
+            try:
+                stat = (pt_path / fname).stat()
+            except OSError:
+                return None
+            sig.append([fname, stat.st_size, stat.st_mtime_ns])
+            if fname.endswith('.wav'):
+                try:
+                    info = mfa_utils.getWavInfo(pt_path / fname)
+                except (OSError, ValueError):
+                    return None
+                if info['data_offset'] + info['data_bytes'] > \
+                        info['file_bytes']:
+                    return None  # still being copied
+        return sig
+
+    def scan(self) -> list[str]:
+        """Find patients that are ready to be processed.
+
+        Returns:
+            list[str]: IDs of complete, stable patient folders that have not
+                been processed since they last changed.
+        """
+        now = time.time()
+        found = set()
+        for prefix in self.prefixes:
+            for pt_path in glob.glob(os.path.join(self.patient_dir, prefix)):
+                if os.path.isdir(pt_path):
+                    found.add(os.path.basename(pt_path))
+        if self.patients is not None:
+            found &= self.patients
+
+        # watch the top level of new patient folders for their required files
+        if self._observer is not None:
+            for pt in sorted(found - self._watched):
+                try:
+                    self._observer.schedule(self._handler,
+                                            (self.patient_dir / pt).as_posix(),
+                                            recursive=False)
+                except OSError:
+                    continue  # removed since it was found
+                self._watched.add(pt)
+
+        ready = []
+        for pt in sorted(found):
+            sig = self.signature(pt)
+            if sig is None or sig == self.processed.get(pt) or \
+                    self._waiting_retry(pt, sig, now):
+                self._seen.pop(pt, None)
+                continue
+            prev_sig, first_seen = self._seen.get(pt, (None, now))
+            if sig != prev_sig:
+                self._seen[pt] = (sig, now)
+                first_seen = now
+            if now - first_seen >= self.settle_s:
+                ready.append(pt)
+        return ready
+
+    def _waiting_retry(self, pt: str, sig: list, now: float) -> bool:
+        """Check whether a failed patient is still waiting to be retried."""
+        if pt not in self.failed:
+            return False
+        failed_sig, failed_time = self.failed[pt]
+        if sig != failed_sig:
+            return False  # files changed since the failure
+        return self.retry_s is None or now - failed_time < self.retry_s
+
+    def mark_processed(self, patients: list[str]) -> None:
+        """Record patients as processed, so they are only processed again if
+        their required files change.
+
+        Args:
+            patients (list[str]): IDs of processed patients.
+        """
+        for pt in patients:
+            # processing can rewrite the required files (e.g. denoising
+            # allblocks.wav), so take the signature after processing
+            self.processed[pt] = self.signature(pt)
+            self.failed.pop(pt, None)
+            self._seen.pop(pt, None)
+        self._save()
+
+    def mark_failed(self, patients: list[str]) -> None:
+        """Record patients whose processing failed, so they are retried when
+        their required files change or after `retry_s` seconds.
+
+        Args:
+            patients (list[str]): IDs of failed patients.
+        """
+        now = time.time()
+        for pt in patients:
+            self.failed[pt] = [self.signature(pt), now]
+            self._seen.pop(pt, None)
+        self._save()
+
+    def _save(self) -> None:
+        """Save the processed and failed patients to the state file."""
+        if self.state_path is not None:
+            with open(self.state_path, 'w') as f:
+                json.dump({'processed': self.processed,
+                           'failed': self.failed}, f, indent=2)
+
+    def wait(self) -> None:
+        """Wait until the next poll, or until a file system notification if
+        they are available.
+        """
+        # poll more often while a folder is settling so it is not left
+        # waiting for a whole poll interval
+        timeout = self.poll_s
+        if self._seen:
+            timeout = min(timeout, self.settle_s)
+        self._wake.wait(timeout)
+        self._wake.clear()